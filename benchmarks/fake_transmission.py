@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Stand-in for the Transmission RPC server used by the benchmarks, serving a synthetic torrent set
+from memory. It implements the parts of the protocol transmissionscripts uses: session id
+negotiation, session-get/session-stats/session-set, torrent-get with field projection and the
+recently-active delta, and the start/stop/verify/remove mutations.
+
+Round trips are counted per method. The private `_stats` and `_reset` methods read and clear the
+counters without being counted themselves.
+
+Run it standalone to point the scripts at it:
+
+    python benchmarks/fake_transmission.py --port 19091 --torrents 50000
+    python scripts/ts_cli.py -H 127.0.0.1 -p 19091
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from SocketServer import ThreadingMixIn
+
+SESSION_ID = "benchmark-session"
+
+RPC_VERSION = 15
+
+# Private trackers as (announce template, weight), the first two match the default config rules
+PRIVATE_TRACKERS = [
+    ("https://mars.apollo.rip/{key}/announce", 30),
+    ("https://landof.tv/{key}/announce", 25),
+] + [("https://tracker{}.private{}.example/{{key}}/announce".format(n, n % 7), 20.0 / (n + 1)) for n in range(40)]
+
+# Public trackers, public torrents usually list several of them in tiers
+PUBLIC_TRACKERS = [
+    "udp://tracker.opentrackr.org:1337/announce",
+    "udp://open.stealth.si:80/announce",
+    "udp://tracker.torrent.eu.org:451/announce",
+    "udp://exodus.desync.com:6969/announce",
+    "udp://tracker.openbittorrent.com:6969/announce",
+    "http://tracker.bt4g.com:2095/announce",
+    "udp://explodie.org:6969/announce",
+    "udp://tracker.moeking.me:6969/announce",
+]
+
+# Free bytes reported by free-space for directories not set in FakeTransmission.free_space
+DEFAULT_FREE_SPACE = 4 * 10 ** 12
+
+# Total bytes reported by free-space, directories are on the same disk when they report the same free and total bytes
+DEFAULT_TOTAL_SPACE = 16 * 10 ** 12
+
+# Share of torrents from public trackers
+PUBLIC_SHARE = 0.3
+
+# Status code -> weight, using RPC version 14+ codes
+STATUS_WEIGHTS = {0: 8, 3: 2, 4: 10, 5: 1, 6: 78, 2: 1}
+
+# (error code, errorString, share)
+ERRORS = [
+    (2, "Unregistered torrent", 0.02),
+    (3, "No data found! Ensure your drives are connected or use \"Set Location\".", 0.005),
+    (1, "Connection timed out", 0.01),
+    (2, "Torrent not registered with this tracker", 0.005),
+]
+
+NAME_WORDS = ["The", "Show", "Live", "Album", "Complete", "Collection", "Series", "Season", "Deluxe", "Edition",
+              "Remastered", "Documentary", "Archive", "Sessions", "Volume", "Anthology", "Special", "Origins"]
+
+NAME_TAGS = ["1080p.WEB-DL", "720p.HDTV.x264", "2160p.BluRay.x265", "FLAC", "MP3.320", "WEB.FLAC.24bit",
+             "DVDRip.XviD", "1080p.BluRay.x264"]
+
+
+def _weighted(rnd, choices):
+    total = sum(weight for _, weight in choices)
+    point = rnd.random() * total
+    for value, weight in choices:
+        point -= weight
+        if point <= 0:
+            return value
+    return choices[-1][0]
+
+
+def make_torrents(count, seed=1, now=None):
+    """ Generate a synthetic torrent set
+
+    :param count: Number of torrents
+    :type count: int
+    :param seed: Random seed, the same seed always produces the same torrents
+    :param now: Unix time the dates are relative to
+    :return: id -> torrent-get values
+    :rtype: dict
+    """
+    rnd = random.Random(seed)
+    now = int(now or time.time())
+    # One passkey per private tracker, so torrents of a tracker share their announce url
+    passkeys = {template: "%032x" % rnd.getrandbits(128) for template, _ in PRIVATE_TRACKERS}
+    statuses = list(STATUS_WEIGHTS.items())
+    torrents = {}
+    for torrent_id in range(1, count + 1):
+        if rnd.random() < PUBLIC_SHARE:
+            announces = rnd.sample(PUBLIC_TRACKERS, rnd.randint(1, 5))
+        else:
+            template = _weighted(rnd, PRIVATE_TRACKERS)
+            announces = [template.format(key=passkeys[template])]
+        trackers = [{"announce": announce, "id": tier, "scrape": announce.replace("announce", "scrape"), "tier": tier}
+                    for tier, announce in enumerate(announces)]
+        size = int(min(2e11, max(1e5, rnd.lognormvariate(math.log(1.5e9), 1.3))))
+        status = _weighted(rnd, statuses)
+        left = 0 if status in (0, 5, 6) and rnd.random() < 0.9 else rnd.randint(0, size)
+        if status == 6:
+            left = 0
+        added = now - rnd.randint(60, 86400 * 730)
+        seeding = rnd.randint(0, now - added) if left == 0 else 0
+        downloaded = size - left
+        uploaded = int(downloaded * rnd.expovariate(0.8))
+        error, error_string = 0, ""
+        point = rnd.random()
+        for code, message, share in ERRORS:
+            point -= share
+            if point < 0:
+                error, error_string = code, message
+                break
+        active = status in (4, 6) and rnd.random() < 0.15
+        torrents[torrent_id] = {
+            "id": torrent_id,
+            "hashString": "%040x" % rnd.getrandbits(160),
+            "name": "{}.{}.{}.{}".format(rnd.choice(NAME_WORDS), rnd.choice(NAME_WORDS), torrent_id,
+                                         rnd.choice(NAME_TAGS)),
+            "status": status,
+            "error": error,
+            "errorString": error_string,
+            "totalSize": size,
+            "sizeWhenDone": size,
+            "leftUntilDone": left,
+            "percentDone": downloaded / float(size),
+            "uploadRatio": round(uploaded / float(downloaded), 4) if downloaded else -1,
+            "uploadedEver": uploaded,
+            "downloadedEver": downloaded,
+            "rateUpload": rnd.randint(1000, 5 * 10 ** 6) if active else 0,
+            "rateDownload": rnd.randint(1000, 10 ** 7) if active and left else 0,
+            "addedDate": added,
+            "activityDate": now - rnd.randint(0, now - added),
+            "startDate": added,
+            "doneDate": added + rnd.randint(0, 86400) if left == 0 else 0,
+            "secondsSeeding": seeding,
+            "secondsDownloading": rnd.randint(60, 86400),
+            "queuePosition": torrent_id - 1,
+            "downloadDir": rnd.choice(["/data/music", "/data/tv", "/data/movies", "/data/misc"]),
+            "isFinished": left == 0 and rnd.random() < 0.1,
+            "eta": -1 if left == 0 else rnd.randint(60, 86400),
+            "trackers": trackers,
+        }
+    return torrents
+
+
+class FakeTransmission(object):
+    """ In memory daemon state along with the round trip counters """
+
+    def __init__(self, torrents=None):
+        self.lock = threading.Lock()
+        # Directory -> free bytes, or (free, total) bytes, reported by free-space
+        self.free_space = {}
+        # Methods whose next request is run but not answered, the connection is closed instead
+        self.drop = set()
+        self.load(torrents or {})
+
+    def load(self, torrents):
+        """ Replace the torrent set and clear the counters
+
+        :param torrents: id -> torrent-get values, see `make_torrents`
+        """
+        with self.lock:
+            self.torrents = torrents
+            self.by_hash = {t["hashString"]: t for t in torrents.values()}
+            self.recent = set()
+            self.removed = []
+            self.reset()
+
+    def reset(self):
+        self.requests = {}
+        self.bytes_sent = 0
+
+    def stats(self):
+        return {"requests": dict(self.requests), "round_trips": sum(self.requests.values()),
+                "bytes_sent": self.bytes_sent, "torrents": len(self.torrents)}
+
+    def _select(self, ids):
+        if ids is None:
+            return list(self.torrents.values())
+        if ids == "recently-active":
+            return [self.torrents[i] for i in self.recent if i in self.torrents]
+        if not isinstance(ids, list):
+            ids = [ids]
+        selected = []
+        for torrent_id in ids:
+            torrent = self.torrents.get(torrent_id) if isinstance(torrent_id, int) else self.by_hash.get(torrent_id)
+            if torrent is not None:
+                selected.append(torrent)
+        return selected
+
+    def handle(self, method, arguments):
+        """ Answer one RPC request
+
+        :return: Response arguments
+        :rtype: dict
+        """
+        if method == "_stats":
+            return self.stats()
+        elif method == "_reset":
+            self.reset()
+            return {}
+        self.requests[method] = self.requests.get(method, 0) + 1
+        if method == "session-get":
+            return {"rpc-version": RPC_VERSION, "rpc-version-minimum": 1, "version": "2.94 (benchmark)",
+                    "download-dir": "/data", "download-dir-free-space": 4 * 10 ** 12}
+        elif method == "session-stats":
+            stats = {"downloadedBytes": 10 ** 13, "uploadedBytes": 3 * 10 ** 13, "filesAdded": len(self.torrents),
+                     "secondsActive": 86400 * 90, "sessionCount": 12}
+            return {"activeTorrentCount": sum(1 for t in self.torrents.values() if t["rateUpload"] or t["rateDownload"]),
+                    "pausedTorrentCount": sum(1 for t in self.torrents.values() if t["status"] == 0),
+                    "torrentCount": len(self.torrents), "downloadSpeed": 0, "uploadSpeed": 0,
+                    "cumulative-stats": stats, "current-stats": stats}
+        elif method == "session-set":
+            return {}
+        elif method == "free-space":
+            path = arguments.get("path")
+            free = self.free_space.get(path, DEFAULT_FREE_SPACE)
+            free, total = free if isinstance(free, tuple) else (free, DEFAULT_TOTAL_SPACE)
+            return {"path": path, "size-bytes": free, "total_size": total}
+        elif method == "torrent-get":
+            ids = arguments.get("ids")
+            fields = arguments.get("fields", [])
+            result = {"torrents": [{field: t[field] for field in fields if field in t} for t in self._select(ids)]}
+            if ids == "recently-active":
+                result["removed"] = list(self.removed)
+                self.recent.clear()
+                del self.removed[:]
+            return result
+        elif method in ("torrent-start", "torrent-start-now", "torrent-stop", "torrent-verify"):
+            for torrent in self._select(arguments.get("ids")):
+                torrent["status"] = 0 if method == "torrent-stop" else 2 if method == "torrent-verify" else 6
+                self.recent.add(torrent["id"])
+            return {}
+        elif method == "torrent-remove":
+            for torrent in self._select(arguments.get("ids")):
+                del self.torrents[torrent["id"]]
+                del self.by_hash[torrent["hashString"]]
+                self.removed.append(torrent["id"])
+            return {}
+        raise KeyError(method)
+
+
+def make_handler(daemon):
+    class RPCHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt, *args):
+            pass
+
+        def _send(self, code, body=b"", headers=None):
+            self.send_response(code)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if self.headers.get("X-Transmission-Session-Id") != SESSION_ID:
+                self._send(409, headers={"X-Transmission-Session-Id": SESSION_ID})
+                return
+            query = json.loads(body.decode("utf-8"))
+            with daemon.lock:
+                try:
+                    arguments = daemon.handle(query.get("method"), query.get("arguments", {}))
+                    result = "success"
+                except KeyError:
+                    arguments, result = {}, "method name not recognized"
+                data = json.dumps({"result": result, "arguments": arguments, "tag": query.get("tag")}).encode("utf-8")
+                if not query.get("method", "").startswith("_"):
+                    daemon.bytes_sent += len(data)
+                if query.get("method") in daemon.drop:
+                    daemon.drop.discard(query.get("method"))
+                    self.close_connection = True
+                    return
+            self._send(200, data, {"Content-Type": "application/json"})
+
+    return RPCHandler
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def serve(daemon, host="127.0.0.1", port=0):
+    """ Serve the daemon from a background thread
+
+    :param daemon: State to serve
+    :type daemon: FakeTransmission
+    :param port: Port to listen on, 0 picks a free one
+    :return: The running server, its address is in server.server_address
+    """
+    server = ThreadingHTTPServer((host, port), make_handler(daemon))
+    thread = threading.Thread(target=server.serve_forever, name="fake-transmission")
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve a synthetic torrent set over the Transmission RPC protocol")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", "-p", type=int, default=19091)
+    parser.add_argument("--torrents", "-n", type=int, default=10000, help="Number of torrents to generate")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    fake = FakeTransmission(make_torrents(args.torrents, args.seed))
+    http_server = serve(fake, args.host, args.port)
+    print("Serving {} torrents on http://{}:{}/transmission/rpc".format(args.torrents, *http_server.server_address))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
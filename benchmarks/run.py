@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the hot paths against the synthetic daemon in fake_transmission.py.
+
+Each benchmark runs in its own child process for every torrent set size, so peak RSS is that of
+the benchmark alone. The report is JSON: for each benchmark and size, the wall time of every
+repetition (min/median/mean/max), the throughput in torrents per second at the median, the peak
+and post-setup RSS, and the RPC round trips per repetition as counted by the fake daemon.
+
+    python benchmarks/run.py --sizes 1000,10000,100000 --out before.json
+    python benchmarks/run.py --sizes 1000,10000,100000 --out after.json
+    python benchmarks/run.py --compare before.json after.json
+"""
+import argparse
+import fnmatch
+import io
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+from contextlib import redirect_stdout
+from importlib.util import module_from_spec, spec_from_file_location
+try:
+    from urllib.request import Request, urlopen
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from urllib2 import Request, urlopen
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from transmissionscripts import FIELDS_AGGREGATE, FIELDS_CLEAN, FIELDS_PRINT, Filter, Sort, TSClient, \
+    TorrentRenderer, clean_torrents, filter_torrents_by, find_rule_set, find_tracker, logger, make_fields, \
+    plan_removals, print_torrent_line, sort_torrents_by
+from fake_transmission import SESSION_ID, FakeTransmission, make_torrents, serve
+
+DEFAULT_SIZES = "1000,10000,50000"
+
+DEFAULT_REPEAT = 5
+
+# Pipelines run through TorrentCLI.onecmd, as `ts_cli.py -x` would
+CLI_COMMANDS = (
+    "ls",
+    "ls | seeding | ratio | 20",
+    "ls | t=btn | c",
+    "ls | n=complete | size | r | 50",
+    "ls | s=season | c",
+    "ls | downloading | speed | 10",
+    "ls | time=>30d | total_size",
+    "clientstats",
+)
+
+# Fields of the torrents benchmarks that don't fetch for themselves run against
+FIELDS_BENCH = make_fields(FIELDS_PRINT, FIELDS_CLEAN, FIELDS_AGGREGATE, *(list(Filter.fields.values()) +
+                                                                         list(Sort.fields.values())))
+
+
+class Context(object):
+    """ What a benchmark runs against: a client of the fake daemon and, fetched on first use
+    before timing starts, its torrents.
+    """
+
+    def __init__(self, port, size):
+        self.port = port
+        self.size = size
+        self.client = TSClient("127.0.0.1", port=port)
+        self.devnull = open(os.devnull, "w")
+        self._torrents = None
+        self._cli = None
+
+    @property
+    def torrents(self):
+        if self._torrents is None:
+            self._torrents = self.client.fetch_torrents(FIELDS_BENCH)
+        return self._torrents
+
+    @property
+    def cli(self):
+        if self._cli is None:
+            spec = spec_from_file_location("ts_cli", os.path.join(ROOT_DIR, "scripts", "ts_cli.py"))
+            ts_cli = module_from_spec(spec)
+            spec.loader.exec_module(ts_cli)
+            with redirect_stdout(self.devnull):
+                self._cli = ts_cli.TorrentCLI(self.client, index_names=False)
+        return self._cli
+
+    def rpc_stats(self):
+        """ The fake daemon's request counters, reading them is not counted
+
+        :rtype: dict
+        """
+        return self._query("_stats")
+
+    def rpc_reset(self):
+        self._query("_reset")
+
+    def _query(self, method):
+        request = Request("http://127.0.0.1:{}/transmission/rpc".format(self.port),
+                          json.dumps({"method": method}).encode("utf-8"),
+                          {"X-Transmission-Session-Id": SESSION_ID, "Content-Type": "application/json"})
+        return json.loads(urlopen(request).read().decode("utf-8"))["arguments"]
+
+
+def bench_get_torrents_by(ctx):
+    torrents = ctx.client.get_torrents_by(sort_by="ratio", filter_by="seeding", fields=FIELDS_PRINT)
+    return ctx.size if torrents is not None else 0
+
+
+def bench_iter_torrents(ctx):
+    return sum(1 for _ in ctx.client.iter_torrents(FIELDS_PRINT))
+
+
+def bench_find_tracker(ctx):
+    for torrent in ctx.torrents:
+        find_tracker(torrent)
+    return len(ctx.torrents)
+
+
+def bench_find_rule_set(ctx):
+    for torrent in ctx.torrents:
+        find_rule_set(torrent)
+    return len(ctx.torrents)
+
+
+def bench_filter_torrents_by(ctx):
+    for name in Filter.names:
+        filter_torrents_by(ctx.torrents, key=getattr(Filter, name))
+    return len(ctx.torrents) * len(Filter.names)
+
+
+def bench_sort_torrents_by(ctx):
+    for name in Sort.names:
+        sort_torrents_by(ctx.torrents, key=getattr(Sort, name))
+    return len(ctx.torrents) * len(Sort.names)
+
+
+def bench_print_torrent_line(ctx):
+    with redirect_stdout(ctx.devnull):
+        for torrent in ctx.torrents:
+            print_torrent_line(torrent)
+    return len(ctx.torrents)
+
+
+def bench_render_plain(ctx):
+    return TorrentRenderer(colourize=False).write(ctx.torrents, ctx.devnull)
+
+
+def bench_render_colour(ctx):
+    return TorrentRenderer(colourize=True).write(ctx.torrents, ctx.devnull)
+
+
+def bench_plan_removals(ctx):
+    plan_removals(ctx.torrents)
+    return len(ctx.torrents)
+
+
+def bench_clean_torrents(ctx):
+    clean_torrents(ctx.client, dry_run=True)
+    return ctx.size
+
+
+def make_cli_bench(command):
+    def bench(ctx):
+        cli = ctx.cli
+        with redirect_stdout(ctx.devnull):
+            cli.onecmd(command)
+        return ctx.size
+    return bench
+
+
+BENCHMARKS = OrderedDict([
+    ("get_torrents_by", bench_get_torrents_by),
+    ("iter_torrents", bench_iter_torrents),
+    ("find_tracker", bench_find_tracker),
+    ("find_rule_set", bench_find_rule_set),
+    ("filter_torrents_by", bench_filter_torrents_by),
+    ("sort_torrents_by", bench_sort_torrents_by),
+    ("print_torrent_line", bench_print_torrent_line),
+    ("render_plain", bench_render_plain),
+    ("render_colour", bench_render_colour),
+    ("plan_removals", bench_plan_removals),
+    ("clean_torrents", bench_clean_torrents),
+] + [("ts_cli:" + command, make_cli_bench(command)) for command in CLI_COMMANDS])
+
+
+def peak_rss_kb():
+    """ Peak resident set size of this process in kB, None where it can't be read """
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS bytes
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run_benchmark(name, port, size, repeat):
+    """ Run one benchmark in this process
+
+    :param name: Key of `BENCHMARKS`
+    :param port: Port of the fake daemon, already serving size torrents
+    :param size: Number of torrents served
+    :param repeat: Timed repetitions, after one untimed warm up run
+    :rtype: dict
+    """
+    bench = BENCHMARKS[name]
+    ctx = Context(port, size)
+    # Warm up, which also fetches the torrents and imports ts_cli when the benchmark uses them
+    bench(ctx)
+    setup_rss = peak_rss_kb()
+    ctx.rpc_reset()
+    timings = []
+    items = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        items = bench(ctx)
+        timings.append(time.perf_counter() - started)
+    stats = ctx.rpc_stats()
+    median = statistics.median(timings)
+    return {
+        "benchmark": name,
+        "size": size,
+        "repeat": repeat,
+        "items": items,
+        "latency": {
+            "min": min(timings),
+            "median": median,
+            "mean": sum(timings) / len(timings),
+            "max": max(timings),
+        },
+        "throughput": items / median if median else None,
+        "rpc": {
+            "round_trips": stats["round_trips"] / float(repeat),
+            "requests": {method: count / float(repeat) for method, count in sorted(stats["requests"].items())},
+            "bytes": stats["bytes_sent"] // repeat,
+        },
+        "setup_rss_kb": setup_rss,
+        "peak_rss_kb": peak_rss_kb(),
+    }
+
+
+def select_benchmarks(patterns):
+    """ Names of the benchmarks matching any of the comma separated glob patterns """
+    if not patterns:
+        return list(BENCHMARKS)
+    globs = [p.strip() for p in patterns.split(",") if p.strip()]
+    return [name for name in BENCHMARKS if any(fnmatch.fnmatchcase(name, g) for g in globs)]
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                                       stderr=subprocess.DEVNULL).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(args):
+    sizes = [int(size) for size in args.sizes.split(",")]
+    names = select_benchmarks(args.only)
+    if not names:
+        raise SystemExit("No benchmarks match {}".format(args.only))
+    fake = FakeTransmission()
+    server = serve(fake)
+    port = server.server_address[1]
+    results = []
+    for size in sizes:
+        fake.load(make_torrents(size, args.seed))
+        for name in names:
+            output = subprocess.check_output([
+                sys.executable, os.path.abspath(__file__), "--child", name, "--port", str(port),
+                "--size", str(size), "--repeat", str(args.repeat)])
+            result = json.loads(output.decode("utf-8"))
+            results.append(result)
+            sys.stderr.write("{:<40} {:>7} {:>10.2f} ms {:>14.0f}/s {:>6g} rpc {:>9} kB\n".format(
+                name, size, result["latency"]["median"] * 1000, result["throughput"] or 0,
+                result["rpc"]["round_trips"], result["peak_rss_kb"]))
+    server.shutdown()
+    report = {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.out:
+        with io.open(args.out, "w", encoding="utf-8") as fp:
+            fp.write(data + "\n")
+    else:
+        print(data)
+
+
+def compare(old_path, new_path):
+    """ Print the change in median latency, peak RSS and round trips between two reports """
+    reports = []
+    for path in (old_path, new_path):
+        with io.open(path, encoding="utf-8") as fp:
+            reports.append({(r["benchmark"], r["size"]): r for r in json.load(fp)["results"]})
+    old, new = reports
+    print("{:<40} {:>7} {:>11} {:>11} {:>8} {:>9} {:>9}".format(
+        "benchmark", "size", "old ms", "new ms", "speedup", "rss kB", "rpc"))
+    for key in sorted(set(old) & set(new), key=lambda k: (list(BENCHMARKS).index(k[0])
+                                                           if k[0] in BENCHMARKS else len(BENCHMARKS), k)):
+        before, after = old[key]["latency"]["median"], new[key]["latency"]["median"]
+        print("{:<40} {:>7} {:>11.2f} {:>11.2f} {:>7.2f}x {:>+9} {:>+9g}".format(
+            key[0], key[1], before * 1000, after * 1000, before / after if after else 0,
+            (new[key]["peak_rss_kb"] or 0) - (old[key]["peak_rss_kb"] or 0),
+            new[key]["rpc"]["round_trips"] - old[key]["rpc"]["round_trips"]))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Benchmark transmissionscripts against a synthetic daemon")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help="Comma separated torrent set sizes, eg. 1000,10000,200000")
+    parser.add_argument("--repeat", "-r", type=int, default=DEFAULT_REPEAT, help="Timed runs of each benchmark")
+    parser.add_argument("--only", help="Comma separated glob patterns of the benchmarks to run, eg. 'ts_cli:*'")
+    parser.add_argument("--seed", type=int, default=1, help="Seed of the synthetic torrent sets")
+    parser.add_argument("--out", "-o", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--list", action="store_true", help="List the benchmarks and exit")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="Compare two JSON reports and exit")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    if args.child:
+        logger.setLevel(logging.WARNING)
+        print(json.dumps(run_benchmark(args.child, args.port, args.size, args.repeat)))
+    elif args.compare:
+        compare(*args.compare)
+    elif args.list:
+        print("\n".join(BENCHMARKS))
+    else:
+        run_all(args)
@@ -4,8 +4,27 @@
 """
 # -*- coding: utf-8 -*-
 import argparse
-from transmissionscripts import make_client, remove_unknown_torrents, remove_local_errors, clean_min_time_ratio, \
-    make_arg_parser
+from transmissionscripts import CACHE_MAX_DELTA_AGE, make_client, clean_torrents, make_arg_parser, logger
+from transmissionscripts.cleaner import CLEANER_POLL_INTERVAL, CleanerDaemon
+from transmissionscripts.eviction import FIELDS_EVICTION, apply_eviction, format_eviction, make_free_space_lookup, \
+    parse_size, plan_eviction
+
+
+def parse_target(value):
+    directory, sep, size = value.rpartition("=")
+    if not sep or not directory:
+        raise argparse.ArgumentTypeError("Expected DIR=SIZE, eg. /data/tv=500G: {}".format(value))
+    try:
+        return directory, parse_size(size)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def parse_size_arg(value):
+    try:
+        return parse_size(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
 
 
 def parse_args():
@@ -13,11 +32,47 @@ def parse_args():
         description='Clean out old torrents from the transmission client via RPC',
         parents=[make_arg_parser()]
     )
-    return parser.parse_args()
+    parser.add_argument('--dry_run', '-d', dest='dry_run', action='store_true',
+                        help="Only log the torrents which would be removed")
+    parser.add_argument('--daemon', action='store_true',
+                        help="Keep running, removing torrents as they qualify instead of checking them all once")
+    parser.add_argument('--interval', '-i', type=float, default=CLEANER_POLL_INTERVAL,
+                        help="Seconds between syncs with the daemon when running with --daemon")
+    parser.add_argument('--min_free', dest='min_free', type=parse_size_arg,
+                        help="Evict seeding torrents until every download directory's disk has this much free "
+                             "space, eg. 100G, instead of applying the clean rules")
+    parser.add_argument('--target', dest='targets', type=parse_target, action='append', default=[],
+                        help="Free space to reach on the disk of a download directory, DIR=SIZE, eg. "
+                             "/data/tv=500G. May be repeated and overrides --min_free under DIR")
+    args = parser.parse_args()
+    if args.daemon and (args.min_free is not None or args.targets):
+        parser.error("Eviction targets can't be combined with --daemon")
+    if args.interval <= 0:
+        parser.error("--interval must be positive")
+    if args.daemon and args.interval > CACHE_MAX_DELTA_AGE:
+        logger.warning("An --interval above {}s is too long for the recently active list, every sync will fetch "
+                       "all torrents".format(CACHE_MAX_DELTA_AGE))
+    return args
+
+
+def evict(client, args):
+    targets = dict(args.targets)
+    if args.min_free is not None:
+        targets[None] = args.min_free
+    plan = plan_eviction(client.fetch_torrents(FIELDS_EVICTION), targets, make_free_space_lookup(client))
+    print(format_eviction(plan) or "No download directories with a target")
+    apply_eviction(client, plan, dry_run=args.dry_run)
 
 
 if __name__ == "__main__":
-    rpc_client = make_client(parse_args())
-    remove_unknown_torrents(rpc_client)
-    remove_local_errors(rpc_client)
-    clean_min_time_ratio(rpc_client)
+    args = parse_args()
+    rpc_client = make_client(args)
+    if args.daemon:
+        try:
+            CleanerDaemon(rpc_client, dry_run=args.dry_run, poll_interval=args.interval).run()
+        except KeyboardInterrupt:
+            pass
+    elif args.min_free is not None or args.targets:
+        evict(rpc_client, args)
+    else:
+        clean_torrents(rpc_client, dry_run=args.dry_run)
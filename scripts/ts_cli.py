@@ -5,10 +5,24 @@
 """
 import argparse
 import cmd
+import hashlib
+import io
 import re
+import sqlite3
+import sys
 import time
-from datetime import timedelta, datetime
+from contextlib import redirect_stdout
+from itertools import islice
 from transmissionscripts import *
+from transmissionscripts.columnar import HAS_NUMPY, TorrentTable, TorrentView
+from transmissionscripts.instrument import PROFILER
+from transmissionscripts.history import FIELDS_HISTORY, RateHistory, rate_stats, sparkline
+from transmissionscripts.snapshot import SNAPSHOT_MAX_AGE, TorrentSnapshot, make_snapshot_arg_parser, open_snapshot
+from transmissionscripts.query import NAME_PREDICATES, QueryError, Predicate, Stage, parse_pipeline, plan_pipeline, \
+    pipeline_fields, make_filter, make_name_matcher
+from transmissionscripts.output import HAS_MSGPACK, OUTPUT_FORMATS, make_writer, parse_fields
+from transmissionscripts.schedule import PollScheduler
+from transmissionscripts.search import NameIndex
 try:
     from urllib.parse import urlparse
 except ImportError:
@@ -24,25 +38,51 @@ SEP_ARG = " "
 
 
 class TorrentCLI(cmd.Cmd):
-    prompt = "(TS)$ "
-    _cmd_print = ("p", "print")
-    _cmd_count = ("c", "cnt", "count")
-    _cmd_reverse = ("r", "rev", "reverse")
-    _cmd_name = ("n", "name")
-    _cmd_tracker = ("t", "tracker")
-    _cmd_time = ("time",)
 
-    _args_time = re.compile(r"(?P<dir>[<>])(?P<duration>\d+)(?P<unit>[mhdwMY])")
-
-    def __init__(self, client):
+    def __init__(self, client, snapshot=None, index_names=True, output_format="text", print_fields=FIELDS_PRINT):
         """
 
-        :param client:
-        :type client: transmissionscripts.TSClient
+        :param client: Client, or a function creating it the first time a command needs the daemon, so
+        commands answered from a snapshot don't have to connect
+        :type client: transmissionscripts.TSClient|callable
+        :param snapshot: Function returning torrents from an on-disk snapshot, used instead of fetching
+        :param index_names: Answer name searches from a `NameIndex` kept between commands, building
+        it costs more than a single scan so this is only worthwhile when running several commands
+        :type index_names: bool
+        :param output_format: How the print stage writes torrents, one of `OUTPUT_FORMATS`
+        :type output_format: str
+        :param print_fields: torrent-get fields written by the print stage in machine readable formats
         """
         cmd.Cmd.__init__(self)
-        self.client = client
-        self.prompt = self._generate_prompt()
+        if callable(client):
+            self._client, self._make_client = None, client
+        else:
+            self._client, self._make_client = client, None
+        self.snapshot = snapshot
+        self.store = None
+        self.cache = None
+        self.history = RateHistory()
+        self.names = NameIndex() if index_names else None
+        self.output_format = output_format
+        self.print_fields = tuple(print_fields) if output_format != "text" else FIELDS_PRINT
+        self.writer = make_writer(output_format, self.print_fields)
+        self._prompt = None
+
+    @property
+    def client(self):
+        """ The client, created on first use when a factory was given
+
+        :rtype: transmissionscripts.TSClient
+        """
+        if self._client is None:
+            self._client = self._make_client()
+        return self._client
+
+    @property
+    def prompt(self):
+        if self._prompt is None:
+            self._prompt = self._generate_prompt()
+        return self._prompt
 
     def default(self, line):
         """Called on an input line when the command prefix is not recognized.
@@ -61,9 +101,10 @@ class TorrentCLI(cmd.Cmd):
         url = urlparse(self.client.url)
         return "(TS@{}:{})> ".format(url.hostname, url.port)
 
-    @staticmethod
-    def msg(msg, prefix=">>>", color="green"):
-        print(colored("{} {}".format(prefix, msg), color=color))
+    def msg(self, msg, prefix=">>>", color="green"):
+        # Keep stdout to the records alone when writing a machine readable format
+        print(colored("{} {}".format(prefix, msg), color=color),
+              file=sys.stdout if self.output_format == "text" else sys.stderr)
 
     def error(self, msg):
         self.msg(msg, "!!!", "red")
@@ -75,125 +116,386 @@ class TorrentCLI(cmd.Cmd):
     def _parse_line(line, sep=SEP_CMD):
         return [arg.strip().lower() for arg in line.split(sep) if arg]
 
+    @staticmethod
+    def _plan(line):
+        """ Parse and plan a pipeline, see `transmissionscripts.query`
+
+        :param line: Pipeline string, eg. "seeding | ratio | 20"
+        :type line: str
+        :rtype: transmissionscripts.query.Stage[]
+        """
+        return plan_pipeline(parse_pipeline(line, SEP_CMD))
+
+    def _command_fields(self, line):
+        """ Determine the torrent-get fields a full command line requires, None when unknown
+
+        :param line: Command line including the command name
+        :type line: str
+        :rtype: list
+        """
+        command, _, arg = line.strip().partition(" ")
+        if command == "ls":
+            try:
+                return pipeline_fields(self._plan(arg), self.print_fields)
+            except QueryError:
+                return None
+        elif command == "clientstats":
+            return make_fields(FIELDS_AGGREGATE)
+        elif command == "total_size":
+            return make_fields(("totalSize",))
+        elif command == "history":
+            return make_fields(FIELDS_HISTORY)
+        return None
+
+    def get_torrents(self, fields=None, stream=False, ids=None):
+        """ Fetch torrents with the given fields, reading from the torrent cache instead when
+        one is active, eg. while running under watch where the cache is synced once per run.
+
+        :param fields: torrent-get field names required
+        :type fields: list
+        :param stream: Return a generator decoding torrents as they are received instead of a list
+        :type stream: bool
+        :param ids: Only fetch the torrents with these ids, ignored when reading the cache or a snapshot
+        :type ids: set
+        :rtype: transmissionrpc.Torrent[]
+        """
+        if self.cache is not None:
+            return self.cache.torrents
+        if self.snapshot is not None:
+            return self.snapshot()
+        if ids is not None:
+            if not ids:
+                return []
+            ids = sorted(ids)
+        if stream:
+            return self.client.iter_torrents(fields, ids)
+        return self.client.fetch_torrents(fields, ids)
+
+    def _resolve_index(self, stages):
+        """ Answer the tracker and name predicates of a leading filter stage from the client's
+        `TorrentIndex`, so only the matching torrents are fetched along with the fields the rest of
+        the pipeline reads. Skipped when reading the torrent cache or a snapshot, which hold every
+        torrent already.
+
+        Building the index fetches the trackers of every torrent, which a tracker predicate needs
+        anyway, so a name predicate alone only builds it when running several commands.
+
+        :param stages: Stages as returned by `plan_pipeline`
+        :type stages: transmissionscripts.query.Stage[]
+        :return: The ids of the torrents to fetch, None for every torrent, and the remaining stages
+        :rtype: (set, transmissionscripts.query.Stage[])
+        """
+        if self.cache is not None or self.snapshot is not None or not stages or stages[0].op != "filter":
+            return None, stages
+        indexed = [p for p in stages[0].arg if p.name == "tracker" or p.name in NAME_PREDICATES]
+        if not indexed or (self.client.torrent_index(sync=False).cache.last_sync is None and self.names is None
+                           and not any(p.name == "tracker" for p in indexed)):
+            return None, stages
+        index = self.client.torrent_index()
+        if self.names is not None and any(p.name in NAME_PREDICATES for p in indexed):
+            self.names.sync(index, full=True)
+        ids = None
+        for predicate in indexed:
+            if predicate.name == "tracker":
+                matched = index.tracker_ids(predicate.arg)
+            elif self.names is not None:
+                matched = self.names.search(predicate.arg, "prefix" if predicate.name == "name" else predicate.name)
+            else:
+                match_name = make_name_matcher(predicate)
+                matched = {t.id for t in index if match_name(t.name.lower())}
+            ids = matched if ids is None else ids & matched
+            if not ids:
+                break
+        predicates = [p for p in stages[0].arg if p not in indexed]
+        if len(ids) > INDEX_FETCH_SHARE * len(index):
+            # Most torrents match, sending their ids costs more than filtering them locally
+            predicates.insert(0, Predicate("ids", frozenset(ids)))
+            ids = None
+        return ids, ([Stage("filter", tuple(predicates))] if predicates else []) + stages[1:]
+
+    def _resolve_ids(self, args):
+        """ Resolve torrent ids or hashes given as command arguments using the `TorrentIndex`,
+        reporting the ones which match no torrent.
+
+        :param args: Torrent ids or hashes
+        :return: The ids of the matching torrents
+        :rtype: list
+        """
+        ids, unknown = self.client.torrent_index().resolve_ids(args)
+        for value in unknown:
+            self.error("Unknown torrent: {}".format(value))
+        return ids
+
+    def _resolve_search(self, torrents, stages):
+        """ Answer the substring, token and fuzzy name predicates of a leading filter stage from
+        the name index, replacing them with the matching ids. The index is synced with the torrents
+        first, which only re-indexes names that changed.
+
+        :param torrents: Torrents the pipeline runs over
+        :param stages: Stages as returned by `plan_pipeline`
+        :type stages: transmissionscripts.query.Stage[]
+        :return: The torrents, materialized when the index was used, and the rewritten stages
+        :rtype: (list, transmissionscripts.query.Stage[])
+        """
+        if self.names is None or not stages or stages[0].op != "filter":
+            return torrents, stages
+        searches = [p for p in stages[0].arg if p.name in ("substring", "tokens", "fuzzy")]
+        if not searches:
+            return torrents, stages
+        torrents = list(torrents)
+        self.names.sync(torrents, full=True)
+        predicates = [p for p in stages[0].arg if p not in searches]
+        for predicate in searches:
+            predicates.append(Predicate("ids", frozenset(self.names.search(predicate.arg, predicate.name))))
+        return torrents, [Stage("filter", tuple(predicates))] + stages[1:]
+
     def do_ls(self, line):
-        parsed_args = self._parse_line(line)
         try:
-            torrents = self._apply_functions(self.client.get_torrents(), parsed_args)
-            if not parsed_args:
-                self.print_torrents(torrents)
+            stages = self._plan(line)
+        except QueryError as err:
+            return self.error(err)
+        ids, stages = self._resolve_index(stages)
+        fields = pipeline_fields(stages, self.print_fields)
+        if ids is not None and set(fields) <= set(FIELDS_INDEX):
+            # The index holds every field the rest of the pipeline reads
+            source = [t for t in self.client.torrent_index(sync=False) if t.id in ids]
+        else:
+            source = self.get_torrents(fields, stream=True, ids=ids)
+        try:
+            source, stages = self._resolve_search(source, stages)
+            self._apply_functions(source, stages)
         except CmdError as err:
             self.error(err)
+        finally:
+            # Stop reading the response if the pipeline finished early, eg. due to a limit
+            if hasattr(source, "close"):
+                source.close()
+
+    def _synced_store(self):
+        """ The local indexed torrent store for this daemon, synced with it before returning
+
+        :rtype: transmissionscripts.snapshot.TorrentSnapshot
+        """
+        if self.store is None:
+            url = urlparse(self.client.url)
+            self.store = TorrentSnapshot("{}:{}".format(url.hostname, url.port))
+        self.store.refresh(self.client)
+        return self.store
+
+    def do_where(self, line):
+        """ Select torrents with a SQL condition over the indexed columns of the local store and
+        feed them into a pipeline, eg:
+
+        where tracker = 'BTN' and status = 'seeding' and ratio < 0.5 and added < ago('30d') | stop
+
+        Columns: id, hash, name, status, tracker, ratio, added (unix time)
+        """
+        condition, _, pipeline = line.partition(SEP_CMD)
+        if not condition.strip():
+            return self.error("Must supply a condition, eg: where tracker = 'BTN' and ratio < 0.5")
+        try:
+            stages = self._plan(pipeline)
+            torrents = self._synced_store().query(condition)
+            self._apply_functions(*self._resolve_search(torrents, stages))
+        except (QueryError, CmdError, sqlite3.Error) as err:
+            self.error(err)
+
+    def do_sql(self, line):
+        """ Run a SQL statement against the torrents table of the local store and print the rows, eg:
+
+        sql select tracker, status, count(*), avg(ratio) from torrents group by tracker, status
+        """
+        try:
+            columns, rows = self._synced_store().execute(line)
+        except sqlite3.Error as err:
+            return self.error(err)
+        if columns:
+            print("\t".join(columns))
+        for row in rows:
+            print("\t".join(str(value) for value in row))
 
     def do_exit(self, line):
         raise KeyboardInterrupt
 
     def print_torrents(self, torrents):
-        for torrent in torrents:
-            print_torrent_line(torrent)
+        self.writer.write(torrents, self.stdout)
+
+    def mutate_torrents(self, action, torrents):
+        """ Apply a `MutationBatch` action to the torrents in batched RPC calls, reporting
+        any chunks which failed.
+
+        :param action: One of `MutationBatch.actions`
+        :type action: str
+        :param torrents: Torrent instances, ids or hashes
+        :return: Number of torrents the action succeeded for
+        :rtype: int
+        """
+        batch = self.client.batch()
+        batch.add(action, *torrents)
+        succeeded = 0
+        for result in batch.commit():
+            if result.error:
+                self.error("Failed to {} {} torrents: {}".format(action, len(result.ids), result.error))
+            else:
+                succeeded += len(result.ids)
+        return succeeded
 
     def rm_torrents(self, ids, delete_data=False):
-        self.client.remove_torrent(ids, delete_data=delete_data)
-        self.msg("Removing {} torrents from client".format(len(ids)))
+        removed = self.mutate_torrents("delete" if delete_data else "remove", ids)
+        self.msg("Removing {} torrents from client".format(removed))
         return []
 
-    def _apply_functions(self, torrents, args):
-        for i, arg in enumerate(args, start=1):
-            try:
-                if int(arg) <= 0:
-                    print("Limit too low, must be positive integer: {}".format(arg))
-                    # Bail early
-                    return []
-            except ValueError:
-                is_int = False
-            else:
-                is_int = True
-            if is_int:
-                torrents = torrents[0:int(arg)]
-                # Special case to print when limit was the last argument
-                if i == len(args):
-                    self.print_torrents(torrents)
-            elif arg in self._cmd_print:
-                self.print_torrents(torrents)
-            elif arg in self._cmd_count:
-                print(len(torrents))
-                return []
-            elif arg in self._cmd_reverse:
-                torrents.reverse()
-                if i == len(args):
-                    self.print_torrents(torrents)
-            elif arg in ("remove", "rm"):
-                return self.rm_torrents(find_torrent_ids(torrents), delete_data=False)
-            elif arg in ("delete",):
-                return self.rm_torrents(find_torrent_ids(torrents), delete_data=True)
-            elif arg in Filter.names:
-                torrents = filter_torrents_by(torrents, key=getattr(Filter, arg))
-                if i == len(args):
-                    self.print_torrents(torrents)
-            elif arg in Sort.names:
-                torrents = sort_torrents_by(torrents, key=getattr(Sort, arg))
-                if i == len(args):
-                    self.print_torrents(torrents)
-            elif arg in ("total_size",):
-                self.total_size(torrents)
-            elif arg in ("stop", "pause"):
-                for torrent in torrents:
-                    self.client.stop_torrent(torrent.hashString)
-                self.msg("Stopping {} torrents.".format(len(torrents)))
-            elif arg in ("start", "start"):
-                for torrent in torrents:
-                    self.client.start_torrent(torrent.hashString)
-                self.msg("Starting {} torrents.".format(len(torrents)))
-            elif "=" in arg:
-                cmd_name, cmd_arg = arg.split("=")
-                if cmd_name in self._cmd_name:
-                    def filter_name(t):
-                        return t.name.lower().startswith(cmd_arg)
-                    torrents = filter_torrents_by(torrents, key=filter_name)
-                    if i == len(args):
-                        self.print_torrents(torrents)
-                elif cmd_name in self._cmd_tracker:
-                    def filter_tracker(t):
-                        return cmd_arg.lower() in find_tracker(t).lower()
-                    torrents = filter_torrents_by(torrents, key=filter_tracker)
-                    self.conditional_print(torrents, i == len(args))
-                elif cmd_name in self._cmd_time:
-                    m = self._args_time.match(cmd_arg)
-                    if not m:
-                        return 0
-                    td_args = {}
-                    split, duration, unit = m.groups()
-                    duration = int(duration)
-                    # mhdwMY
-                    if unit == "w":
-                        td_args['weeks'] = duration
-                    elif unit == "m":
-                        td_args['minutes'] = duration
-                    elif unit == "h":
-                        td_args['hours'] = duration
-                    elif unit == "d":
-                        td_args['days'] = duration
-                    elif unit == "M":
-                        td_args['days'] = duration * 30.5
-                    elif unit == "Y":
-                        td_args['days'] = duration * 365
-                    filter_date = datetime.now() - timedelta(**td_args)
-
-                    def filter_time(t):
-                        if split == ">":
-                            return t.date_added < filter_date
-                        else:
-                            return t.date_added > filter_date
-
-                    torrents = filter_torrents_by(torrents, key=filter_time)
-                    self.conditional_print(torrents, i == len(args))
+    def _apply_functions(self, torrents, stages):
+        """ Run planned pipeline stages over the torrents. Torrents may be any iterable, they are
+        only materialized into a list by stages which need the full set such as sorting. When given
+        a `TorrentView` the filter, sort, limit and reverse stages run as vectorized operations,
+        when numpy is available the pipeline switches to a view at the first full sort.
+
+        :param stages: Stages as returned by `plan_pipeline`
+        :type stages: transmissionscripts.query.Stage[]
+        """
+        profile = PROFILER.enabled
+        if profile and not isinstance(torrents, (list, TorrentView)):
+            torrents = PROFILER.iterate("fetch", torrents)
+        for i, stage in enumerate(stages, start=1):
+            if profile:
+                torrents, finished = self._apply_stage_timed(torrents, stage, i == len(stages))
             else:
-                raise CmdError("Unknown function: {}".format(arg))
+                torrents, finished = self._apply_stage(torrents, stage, i == len(stages))
+            if finished:
+                break
         return torrents
 
+    def _apply_stage_timed(self, torrents, stage, last):
+        """ `_apply_stage` charging its time to the stage in the profiler. Lazy stages only return a
+        generator here, the time spent producing each torrent is charged as it is pulled.
+        """
+        frame = PROFILER.begin(stage.op)
+        try:
+            torrents, finished = self._apply_stage(torrents, stage, last)
+        except Exception:
+            PROFILER.end(frame)
+            raise
+        if stage.op not in ("filter", "limit") or isinstance(torrents, TorrentView):
+            PROFILER.end(frame, len(torrents) if isinstance(torrents, (list, TorrentView)) else 0)
+            return torrents, finished
+        PROFILER.end(frame, calls=0)
+        return PROFILER.iterate(stage.op, torrents), finished
+
+    def _apply_stage(self, torrents, stage, last):
+        """ Run a single pipeline stage, see `_apply_functions`
+
+        :param last: The stage is the last of the pipeline
+        :type last: bool
+        :return: The torrents for the next stage and whether the pipeline is finished
+        :rtype: tuple
+        """
+        vectorized = isinstance(torrents, TorrentView)
+        if stage.op == "filter":
+            if vectorized:
+                torrents = torrents.where(stage.arg)
+            else:
+                torrents = ifilter_torrents_by(torrents, key=make_filter(stage.arg))
+        elif stage.op == "sort":
+            if not vectorized and HAS_NUMPY:
+                # Sorting needs every torrent anyway, run the remaining stages vectorized
+                torrents = TorrentView(TorrentTable(torrents))
+                vectorized = True
+            if vectorized:
+                torrents = torrents.sort(stage.arg)
+            else:
+                torrents = sort_torrents_by(torrents, key=getattr(Sort, stage.arg))
+        elif stage.op == "top":
+            name, count, reverse = stage.arg
+            if vectorized:
+                torrents = torrents.top(name, count, reverse)
+            else:
+                torrents = top_torrents_by(torrents, count, key=getattr(Sort, name), reverse=reverse)
+        elif stage.op == "limit":
+            torrents = torrents.limit(stage.arg) if vectorized else islice(torrents, stage.arg)
+        elif stage.op == "reverse":
+            if vectorized:
+                torrents = torrents.reverse()
+            else:
+                torrents = list(torrents)
+                torrents.reverse()
+        elif stage.op == "print":
+            # Later stages need the torrents again
+            if not vectorized and not last:
+                torrents = list(torrents)
+            self.print_torrents(torrents)
+        elif stage.op == "count":
+            print(sum(1 for _ in torrents))
+            return [], True
+        elif stage.op == "total_size":
+            torrents = self.total_size(torrents if vectorized else list(torrents))
+        elif stage.op == "mutate":
+            if stage.arg in ("remove", "delete"):
+                # Pass the torrents so they are removed by hash, ids may be stale when reading a snapshot
+                return self.rm_torrents(list(torrents), delete_data=stage.arg == "delete"), True
+            if not vectorized:
+                torrents = list(torrents)
+            self.msg("{} {} torrents.".format(
+                "Stopping" if stage.arg == "stop" else "Starting", self.mutate_torrents(stage.arg, torrents)))
+        else:
+            raise CmdError("Unknown function: {}".format(stage.op))
+        return torrents, False
+
+    def _watch_static(self, line):
+        """ Whether a command's output can only change when the torrents do, so watch can skip running
+        it after a sync which changed nothing. True for ls pipelines without time filters or mutations.
+
+        :param line: Command line including the command name
+        :type line: str
+        :rtype: bool
+        """
+        command, _, arg = line.strip().partition(" ")
+        if command != "ls":
+            return False
+        try:
+            stages = self._plan(arg)
+        except QueryError:
+            return False
+        for stage in stages:
+            if stage.op == "mutate":
+                return False
+            if stage.op == "filter" and any(p.name == "added" for p in stage.arg):
+                return False
+        return True
+
+    def _capture(self, line):
+        """ Run a command returning everything it wrote to stdout instead of writing it
+
+        :rtype: bytes
+        """
+        buf = io.TextIOWrapper(io.BytesIO(), encoding="utf-8", write_through=True)
+        stdout, self.stdout = self.stdout, buf
+        try:
+            with redirect_stdout(buf):
+                self.onecmd(line)
+        finally:
+            self.stdout = stdout
+        return buf.buffer.getvalue()
+
+    def _write_captured(self, output):
+        stream = getattr(self.stdout, "buffer", None)
+        if stream is None:
+            self.stdout.write(output.decode("utf-8"))
+        else:
+            self.stdout.flush()
+            stream.write(output)
+            stream.flush()
+
     def do_watch(self, line):
+        """ Re-run a command on a fixed cadence, eg: watch 5 | ls | seeding | speed | 10
+
+        Torrents are synced from the recently active delta on each tick. Commands which only depend on
+        the torrents are not re-run when nothing changed, and output is only redrawn when it differs
+        from the last run. The interval backs off while the daemon is slow to respond.
+        """
         wait_time = 5.0
         new_line = line.strip()
-        has_time = re.match(r"^(?P<wait_time>\d|\d\.\d)", new_line)
+        has_time = re.match(r"^(?P<wait_time>\d+(?:\.\d+)?)", new_line)
         if has_time:
             new_wait_time = has_time.groups()[0]
             if new_wait_time:
@@ -203,13 +505,80 @@ class TorrentCLI(cmd.Cmd):
             new_line = new_line[1:]
         else:
             return self.error("Invalid syntax")
-        while True:
+        fields = self._command_fields(new_line)
+        static = self._watch_static(new_line)
+        self.cache = TorrentCache(self.client, make_fields(fields, FIELDS_HISTORY) if fields is not None else None)
+        # Backing off past the delta's maximum age would turn every tick into a full fetch, the margin
+        # covers ticks starting late
+        scheduler = PollScheduler(wait_time, max_interval=self.cache.max_delta_age * 0.8)
+        digest = None
+        try:
+            while True:
+                scheduler.wait()
+                started = time.monotonic()
+                self.history.record(self.cache.sync())
+                scheduler.record(time.monotonic() - started)
+                if static and digest is not None and not self.cache.changed and not self.cache.removed:
+                    continue
+                output = self._capture(new_line)
+                output_digest = hashlib.sha1(output).digest()
+                if output_digest == digest:
+                    continue
+                digest = output_digest
+                self._write_captured(output)
+                self.msg("Running every {} seconds{}: {} (ctrl+c to stop)".format(
+                    wait_time, ", backed off to {:.1f} while the daemon is slow".format(scheduler.interval)
+                    if scheduler.backed_off else "", new_line))
+        except KeyboardInterrupt:
+            return
+        finally:
+            self.cache = None
+
+    def do_history(self, line):
+        """ Show rolling rate stats recorded while running under watch, per tracker or for the
+        torrent ids given.
+        """
+        if not self.history.fine.samples:
+            return self.error("No rate history yet, record some with eg: watch 5 | history")
+        ids = self._parse_line(line, " ")
+        if ids:
             try:
-                self.onecmd(new_line)
-                self.msg("Running every {} seconds: {} (ctrl+c to stop)".format(wait_time, new_line))
-                time.sleep(wait_time)
-            except KeyboardInterrupt:
-                return
+                series = [("#{}".format(torrent_id), self.history.torrent(int(torrent_id))) for torrent_id in ids]
+            except ValueError:
+                return self.error("Torrent ids must be integers")
+        else:
+            series = [(tracker, self.history.tracker(tracker)) for tracker in self.history.trackers()]
+        for name, (up, down) in series:
+            if not up:
+                print("[History] {} No samples".format(name))
+                continue
+            up_stats, down_stats = rate_stats(up), rate_stats(down)
+            print("[History] {:<6} Up: {:>10}/s avg {:>10}/s p95 {} Dn: {:>10}/s avg {:>10}/s p95 {}".format(
+                name,
+                natural_size(up_stats.avg), natural_size(up_stats.p95), sparkline(up, 30),
+                natural_size(down_stats.avg), natural_size(down_stats.p95), sparkline(down, 30)
+            ))
+
+    def do_stats(self, line):
+        """ Show the RPC, pipeline stage and cache timings recorded while profiling, eg:
+
+        stats on | stats | stats reset | stats off
+        """
+        arg = line.strip().lower()
+        if arg == "on":
+            PROFILER.enable()
+            return self.msg("Profiling enabled")
+        elif arg == "off":
+            PROFILER.disable()
+            return self.msg("Profiling disabled")
+        elif arg == "reset":
+            PROFILER.reset()
+            return self.msg("Profiling data cleared")
+        elif arg:
+            return self.error("Unknown argument, expected on, off or reset: {}".format(arg))
+        if not PROFILER.enabled:
+            self.msg("Profiling is disabled, enable it with --profile or: stats on")
+        print(PROFILER.report(), end="")
 
     def do_enablelimits(self, line):
         self.client.set_enabled_limits(True, False)
@@ -245,18 +614,16 @@ class TorrentCLI(cmd.Cmd):
         self.do_limit(line, True)
 
     def do_stop(self, line):
-        ids = line.split(" ")
-        if not ids:
-            self.error("Must supply at least 1 id")
-        self.client.stop_torrent(ids)
-        self.msg("Stopped {} torrents".format(len(ids)))
+        args = self._parse_line(line, " ")
+        if not args:
+            return self.error("Must supply at least 1 id")
+        self.msg("Stopped {} torrents".format(self.mutate_torrents("stop", self._resolve_ids(args))))
 
     def do_start(self, line):
-        ids = line.split(" ")
-        if not ids:
-            self.error("Must supply at least 1 id")
-        self.client.start_torrent(ids)
-        self.msg("Started {} torrents".format(len(ids)))
+        args = self._parse_line(line, " ")
+        if not args:
+            return self.error("Must supply at least 1 id")
+        self.msg("Started {} torrents".format(self.mutate_torrents("start", self._resolve_ids(args))))
 
     def do_startall(self, line):
         self.client.start_all()
@@ -268,24 +635,25 @@ class TorrentCLI(cmd.Cmd):
 
     def total_size(self, torrents=None):
         if torrents is None:
-            torrents = self.client.get_torrents()
+            torrents = self.get_torrents(("totalSize",))
         self.msg("Total size for {} torrents: {}".format(
             len(torrents), natural_size(sum(t.totalSize for t in torrents))))
         return torrents
 
     def do_verify(self, line):
-        ids = self._parse_line(line, " ")
-        self.client.verify_torrent(ids)
-        self.msg("Starting verify of {} torrents".format(len(ids)))
+        args = self._parse_line(line, " ")
+        if not args:
+            return self.error("Must supply at least 1 id")
+        self.msg("Starting verify of {} torrents".format(self.mutate_torrents("verify", self._resolve_ids(args))))
 
     def do_delete(self, line):
-        self.rm_torrents(self._parse_line(line, " "), delete_data=True)
+        self.rm_torrents(self._resolve_ids(self._parse_line(line, " ")), delete_data=True)
 
     def do_remove(self, line):
-        self.rm_torrents(self._parse_line(line, " "), delete_data=False)
+        self.rm_torrents(self._resolve_ids(self._parse_line(line, " ")), delete_data=False)
 
     def do_clientstats(self, line):
-        torrents = self.client.get_torrents()
+        torrents = self.get_torrents(FIELDS_AGGREGATE)
         stats = self.client.session_stats()
 
         # All Time totals
@@ -311,30 +679,55 @@ class TorrentCLI(cmd.Cmd):
         ))
 
         # Tracker info
-        for tracker in find_all_trackers(torrents):
-            def filter_tracker(t):
-                return tracker.lower() in find_tracker(t).lower()
-            tracker_torrents = filter_torrents_by(torrents, key=filter_tracker)
-            print("[Tracker] Name: {} Torrents: {} Total Size: {}".format(
+        ratio_labels = ["<={}".format(bound) for bound in RATIO_BUCKETS] + [">{}".format(RATIO_BUCKETS[-1])]
+        for tracker, tracker_stats in sorted(aggregate_by_tracker(torrents).items()):
+            print("[Tracker] Name: {} Torrents: {} Total Size: {} Up: {}/s Dn: {}/s Errors: {}".format(
+                tracker,
+                tracker_stats.count,
+                natural_size(tracker_stats.total_size),
+                natural_size(tracker_stats.rate_upload),
+                natural_size(tracker_stats.rate_download),
+                tracker_stats.errors
+            ))
+            print("[Ratio  ] Name: {} Avg: {:.2f} Min: {:.2f} Max: {:.2f} {}".format(
                 tracker,
-                len(tracker_torrents),
-                natural_size(sum(t.totalSize for t in tracker_torrents))
+                tracker_stats.ratio_avg,
+                tracker_stats.ratio_min,
+                tracker_stats.ratio_max,
+                " ".join("{}: {}".format(label, count) for label, count in zip(ratio_labels, tracker_stats.ratio_buckets))
             ))
 
 
 def parse_args():
     parser = argparse.ArgumentParser(
         description='Clean out old torrents from the transmission client via RPC',
-        parents=[make_arg_parser()]
+        parents=[make_arg_parser(), make_snapshot_arg_parser()]
     )
     parser.add_argument("--exec", "-x", dest="execute", help="Run a single command line string and exit without "
                                                              "opening the REPL.")
-    return parser.parse_args()
+    parser.add_argument("--format", dest="output_format", choices=OUTPUT_FORMATS, default="text",
+                        help="How ls prints torrents, the machine readable formats write raw field values")
+    parser.add_argument("--fields", type=parse_fields,
+                        default=FIELDS_PRINT,
+                        help="Comma separated torrent-get fields written by the machine readable formats")
+    args = parser.parse_args()
+    if args.output_format == "msgpack" and not HAS_MSGPACK:
+        parser.error("The msgpack format requires the msgpack package")
+    return args
 
 
 if __name__ == "__main__":
     cli_args = parse_args()
-    cli = TorrentCLI(make_client(cli_args))
+    snapshot = open_snapshot(cli_args) if cli_args.execute else None
+    if snapshot is not None:
+        max_age = SNAPSHOT_MAX_AGE if cli_args.max_age is None else cli_args.max_age
+        # Only connect when the snapshot needs refreshing or a command needs the daemon
+        cli = TorrentCLI(lambda: make_client(cli_args),
+                         lambda: snapshot.torrents(lambda: cli.client, max_age), index_names=False,
+                         output_format=cli_args.output_format, print_fields=cli_args.fields)
+    else:
+        cli = TorrentCLI(make_client(cli_args), index_names=not cli_args.execute,
+                         output_format=cli_args.output_format, print_fields=cli_args.fields)
     try:
         cli.onecmd(cli_args.execute) if cli_args.execute else cli.cmdloop()
     except KeyboardInterrupt:
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Prometheus exporter for a transmission daemon. Serves /metrics from data polled in the background, scrapes
+never make RPC calls of their own.
+
+"""
+import argparse
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    # noinspection PyUnresolvedReferences
+    from SocketServer import ThreadingMixIn
+
+from transmissionscripts import make_client, make_arg_parser, logger
+from transmissionscripts.exporter import CONTENT_TYPE, METRICS_INTERVAL, MetricsCollector
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def make_handler(collector):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = collector.scrape().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, fmt, *args):
+            logger.debug(fmt, *args)
+
+    return MetricsHandler
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description='Export transmission metrics for Prometheus',
+        parents=[make_arg_parser()]
+    )
+    parser.add_argument("--listen", default="0.0.0.0:9190", help="Address to serve /metrics on, host:port")
+    parser.add_argument("--interval", "-i", type=float, default=METRICS_INTERVAL,
+                        help="Seconds between polls of the daemon")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    host, _, port = args.listen.rpartition(":")
+    collector = MetricsCollector(make_client(args), args.interval)
+    # Have data to serve before accepting scrapes
+    collector.collect()
+    collector.start()
+    server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), make_handler(collector))
+    logger.info("Serving metrics on http://{}:{}/metrics".format(host or "0.0.0.0", port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        collector.stop()
+        server.server_close()
@@ -6,29 +6,58 @@ and filtering options exist.
 
 """
 import argparse
-from transmissionscripts import make_client, Sort, print_torrent_line, make_arg_parser, Filter
+from transmissionscripts import make_client, Sort, make_arg_parser, Filter, FIELDS_PRINT, select_torrents, \
+    make_fields
+from transmissionscripts.output import HAS_MSGPACK, OUTPUT_FORMATS, make_writer, parse_fields
+from transmissionscripts.query import Predicate, make_name_matcher
+from transmissionscripts.search import SEARCH_MODES
+from transmissionscripts.snapshot import SNAPSHOT_MAX_AGE, make_snapshot_arg_parser, open_snapshot
 
 
 def parse_args():
-    parser = argparse.ArgumentParser(parents=[make_arg_parser()])
+    parser = argparse.ArgumentParser(parents=[make_arg_parser(), make_snapshot_arg_parser()])
     parser.add_argument('--sort', choices=Sort.names, default="id", help="Sort output by: id, progress, name, size")
     parser.add_argument('--filter', choices=Filter.names,
                         default="all", help="Filter to: all, active, downloading, seeding, paused, finished.")
-    return parser.parse_args()
+    parser.add_argument('--name', help="Only list torrents whose name matches this text")
+    parser.add_argument('--match', choices=SEARCH_MODES, default="substring",
+                        help="How --name is matched: prefix, substring, tokens (all words) or fuzzy.")
+    parser.add_argument('--format', dest="output_format", choices=OUTPUT_FORMATS, default="text",
+                        help="Output format, the machine readable formats write raw field values.")
+    parser.add_argument('--fields', type=parse_fields,
+                        default=FIELDS_PRINT,
+                        help="Comma separated torrent-get fields written by the machine readable formats.")
+    args = parser.parse_args()
+    if args.output_format == "msgpack" and not HAS_MSGPACK:
+        parser.error("The msgpack format requires the msgpack package")
+    return args
 
 
 if __name__ == "__main__":
     # Get options and configure
     args = parse_args()
-    rpc_client = make_client(args)
+    snapshot = open_snapshot(args)
+    fields = FIELDS_PRINT if args.output_format == "text" else args.fields
 
     # Fetch torrents performing filtering/sorting if requested
-    torrents = rpc_client.get_torrents_by(
-        filter_by=args.filter if args.filter else None,
-        sort_by=args.sort if args.sort else None
-    )
+    if snapshot is None:
+        torrents = make_client(args).get_torrents_by(
+            filter_by=args.filter if args.filter else None,
+            sort_by=args.sort if args.sort else None,
+            fields=make_fields(fields, ("name",) if args.name else None)
+        )
+    else:
+        torrents = select_torrents(
+            snapshot.torrents(lambda: make_client(args), SNAPSHOT_MAX_AGE if args.max_age is None else args.max_age),
+            filter_by=args.filter if args.filter else None,
+            sort_by=args.sort if args.sort else None
+        )
+
+    if args.name:
+        # A single search is cheaper to scan for than to build the name index for
+        match = make_name_matcher(Predicate("name" if args.match == "prefix" else args.match, args.name))
+        torrents = [t for t in torrents if match(t.name.lower())]
 
     # Output the results
-    for torrent in torrents:
-        print_torrent_line(torrent)
+    make_writer(args.output_format, fields).write(torrents)
 
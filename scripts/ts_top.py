@@ -1,9 +1,13 @@
 import argparse
+import locale
 import sys
-from time import sleep
+import threading
+from time import time
 
 from transmissionscripts import filesystem, natural_size
-from transmissionscripts import make_client, make_arg_parser
+from transmissionscripts import make_client, make_arg_parser, make_fields, TorrentCache, FIELDS_PRINT, Sort, \
+    top_torrents_by
+from transmissionscripts.history import FIELDS_HISTORY, RateHistory, sparkline
 try:
     # noinspection PyUnresolvedReferences
     import curses
@@ -15,50 +19,160 @@ except ImportError:
     exit(1)
 
 HEADER_SIZE = 4
-BODY_SIZE = 6
 
+# Fields polled for each torrent
+FIELDS_TOP = make_fields(FIELDS_PRINT, FIELDS_HISTORY, ("downloadDir",))
 
-def draw_header(scr):
-    max_height, max_width = scr.getmaxyx()
-    drives = {"/"}
-    scr.addstr(0, 1, "Disk free: {}".format(", ".join(
-        ["{} ({})".format(natural_size(filesystem.get_free_space(d)), d) for d in drives]
-    )))
-    scr.addstr(1, 1, "1")
-    scr.addstr(2, 1, "2")
-    scr.addstr(3, 1, "3s")
-    scr.refresh()
+# Most rows the poller prepares, bounds the work done per poll regardless of terminal size
+MAX_ROWS = 500
 
+# Characters of rate history shown per row
+SPARK_WIDTH = 20
 
-def draw_footer(scr):
-    max_height, max_width = scr.getmaxyx()
-    scr.addstr(max_height-1, 2, "{}".format(max_height))
-    scr.refresh()
+# How often the UI wakes to check for input and new data, in milliseconds
+INPUT_TIMEOUT = 250
 
 
-def draw_body(scr):
-    max_height, max_width = scr.getmaxyx()
-    for i in range(0, max_height - 1):
-        scr.addstr(i, 1, '10 divided by {}'.format(i))
-    scr.refresh()
+class Snapshot(object):
+    """ Pre-formatted display state produced by the poller, replaced as a whole on every poll
+    so the UI thread never reads torrents while they are being updated.
+    """
 
+    __slots__ = ("version", "header", "rows", "error")
 
-def top(args):
+    def __init__(self, version=0, header=(), rows=(), error=None):
+        self.version = version
+        self.header = header
+        self.rows = rows
+        self.error = error
+
+
+class Poller(threading.Thread):
+    """ Background thread syncing a `TorrentCache` every rate seconds and publishing a `Snapshot` """
+
+    def __init__(self, client, rate, free_space_ttl=30.0):
+        threading.Thread.__init__(self, name="ts_top-poller")
+        self.daemon = True
+        self.cache = TorrentCache(client, FIELDS_TOP)
+        self.rate = rate
+        self.free_space = filesystem.FreeSpaceCache(free_space_ttl)
+        self.history = RateHistory()
+        self.snapshot = Snapshot()
+        self.stopped = threading.Event()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            started = time()
+            try:
+                self.snapshot = self.make_snapshot(self.cache.sync(), time() - started)
+            except Exception as err:
+                self.snapshot = Snapshot(self.snapshot.version + 1, self.snapshot.header, self.snapshot.rows,
+                                         "Update failed: {}".format(err))
+            # Wait out the remainder of the interval, a slow poll starts the next one straight away
+            self.stopped.wait(max(0.0, self.rate - (time() - started)))
+
+    @staticmethod
+    def _total(series):
+        up, down = series
+        return [u + d for u, d in zip(up, down)]
+
+    def make_snapshot(self, torrents, duration):
+        self.history.record(torrents)
+        up = down = active = 0
+        dirs = set()
+        for torrent in torrents:
+            up += torrent.rateUpload
+            down += torrent.rateDownload
+            if torrent.rateUpload or torrent.rateDownload:
+                active += 1
+            dirs.add(torrent.downloadDir)
+        mounts = sorted({self.free_space.mount(d) for d in dirs})
+        header = (
+            "Torrents: {} Active: {} Up: {}/s Down: {}/s".format(
+                len(torrents), active, natural_size(up), natural_size(down)),
+            "Disk free: {}".format(", ".join(
+                "{} ({})".format(natural_size(self.free_space.get_free_space(m) or 0), m) for m in mounts)),
+            "Trackers: {}".format(" ".join(
+                "{} {}".format(tracker, sparkline(self._total(self.history.tracker(tracker)), SPARK_WIDTH))
+                for tracker in self.history.trackers())),
+            "Updated in {:.2f}s every {}s".format(duration, self.rate),
+        )
+        rows = tuple(
+            "{:>6} {:>12}/s {:>12}/s {:>7.3f} {} {}".format(
+                t.id, natural_size(t.rateUpload), natural_size(t.rateDownload), t.ratio,
+                sparkline(self._total(self.history.torrent(t.id))[-SPARK_WIDTH:]).rjust(SPARK_WIDTH), t.name)
+            for t in top_torrents_by(torrents, MAX_ROWS, key=Sort.speed, reverse=True)
+        )
+        return Snapshot(self.snapshot.version + 1, header, rows)
+
+
+class Pane(object):
+    """ A curses window which remembers the lines on screen and only rewrites lines that changed """
+
+    def __init__(self, height, width, y):
+        self.win = curses.newwin(height, width, y, 0)
+        self.lines = {}
+
+    def draw(self, lines):
+        height, width = self.win.getmaxyx()
+        changed = False
+        for y in range(height):
+            # Leave the bottom right cell empty, writing to it moves the cursor off the window
+            line = (lines[y] if y < len(lines) else "")[0:width - 2].ljust(width - 2)
+            if self.lines.get(y) != line:
+                self.win.addstr(y, 1, line)
+                self.lines[y] = line
+                changed = True
+        if changed:
+            self.win.noutrefresh()
+
+
+def make_panes(scr):
+    height, width = scr.getmaxyx()
+    header = Pane(HEADER_SIZE, width, 0)
+    body = Pane(max(1, height - HEADER_SIZE - 1), width, HEADER_SIZE)
+    footer = Pane(1, width, height - 1)
+    return header, body, footer
+
+
+def top(client, args):
+    poller = Poller(client, args.rate)
+    poller.start()
+    # Needed for curses to draw the sparkline characters
+    locale.setlocale(locale.LC_ALL, "")
     scr = curses.initscr()
-    #scr.start_color()
     curses.noecho()
     curses.cbreak()
-    hx, wm = scr.getmaxyx()
+    curses.curs_set(0)
     scr.keypad(True)
+    scr.timeout(INPUT_TIMEOUT)
     try:
-        header = curses.newwin(HEADER_SIZE, wm, 0, 0)
-        body = curses.newwin(BODY_SIZE, wm, HEADER_SIZE, 0)
+        header, body, footer = make_panes(scr)
+        version = None
         while True:
-            draw_header(header)
-            draw_body(body)
-            draw_footer(scr)
-            sleep(0.2)
+            key = scr.getch()
+            if key in (ord("q"), ord("Q")):
+                break
+            elif key == curses.KEY_RESIZE:
+                scr.clear()
+                scr.refresh()
+                header, body, footer = make_panes(scr)
+                version = None
+            snapshot = poller.snapshot
+            if snapshot.version == version:
+                continue
+            version = snapshot.version
+            header.draw(snapshot.header)
+            body.draw(snapshot.rows)
+            footer.draw([snapshot.error or "q to quit"])
+            curses.doupdate()
     except KeyboardInterrupt:
+        pass
+    finally:
+        poller.stop()
         curses.nocbreak()
         scr.keypad(False)
         curses.echo()
@@ -78,6 +192,6 @@ if __name__ == "__main__":
     try:
         cli_args = parse_args()
         cli = make_client(cli_args)
-        top(cli_args)
+        top(cli, cli_args)
     except KeyboardInterrupt:
         print("")
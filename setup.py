@@ -22,7 +22,7 @@ setup(
     long_description=open(join(dirname(__file__), "README.rst")).read(),
     url='https://github.com/leighmacdonald/transmission_scripts',
     packages=['transmissionscripts'],
-    scripts=['scripts/ts_clean.py', 'scripts/ts_cli.py', 'scripts/ts_list.py'],
+    scripts=['scripts/ts_clean.py', 'scripts/ts_cli.py', 'scripts/ts_list.py', 'scripts/ts_exporter.py'],
     download_url='https://github.com/leighmacdonald/transmission_scripts/tarball/{}'.format(VERSION),
     keywords=["torrent", "transmission", "p2p"],
     classifiers=[
@@ -0,0 +1,46 @@
+"""
+Fixtures serving the synthetic torrent set of `benchmarks/fake_transmission.py` over real RPC, so the
+optimized paths are exercised against the same protocol they talk to in production.
+"""
+import importlib.util
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+import fake_transmission  # noqa: E402
+from transmissionscripts import TSClient  # noqa: E402
+
+# Torrents served by the daemon fixture
+TORRENT_COUNT = 2000
+
+
+def load_script(name):
+    """ Import one of the scripts, they are not part of the package
+
+    :param name: Script name without the .py extension
+    """
+    spec = importlib.util.spec_from_file_location(name, os.path.join(ROOT, "scripts", name + ".py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+@pytest.fixture
+def daemon():
+    """ A fresh fake daemon per test, tests are free to mutate it """
+    fake = fake_transmission.FakeTransmission(fake_transmission.make_torrents(TORRENT_COUNT, seed=7))
+    server = fake_transmission.serve(fake)
+    fake.port = server.server_address[1]
+    yield fake
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(daemon):
+    return TSClient("127.0.0.1", port=daemon.port)
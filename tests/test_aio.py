@@ -0,0 +1,102 @@
+"""
+The asyncio client against the fake daemon: pooled keep-alive connections, the session id handshake
+and dropped connections.
+"""
+import asyncio
+import socket
+
+import pytest
+import transmissionrpc
+
+from transmissionscripts import FIELDS_PRINT
+from transmissionscripts.aio import AsyncTSClient
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """ Count the connections opened to the daemon """
+    opened = []
+    open_connection = asyncio.open_connection
+
+    async def counting(*args, **kwargs):
+        opened.append(args)
+        return await open_connection(*args, **kwargs)
+
+    monkeypatch.setattr(asyncio, "open_connection", counting)
+    return opened
+
+
+def run(client, method, *args, **kwargs):
+    async def _run():
+        try:
+            return await getattr(client, method)(*args, **kwargs)
+        finally:
+            client.close()
+    return asyncio.run(_run())
+
+
+def abort_idle(client):
+    """ Close the idle connection so sending over it fails, as when the daemon closed it while it sat in the pool """
+    (conn,) = client._idle
+    conn.writer.transport.abort()
+
+
+def test_keep_alive_connection_is_reused(daemon, connections):
+    client = AsyncTSClient("127.0.0.1", daemon.port)
+
+    async def _run():
+        for _ in range(5):
+            await client.session_stats()
+        client.close()
+    asyncio.run(_run())
+    assert len(connections) == 1
+    assert daemon.requests == {"session-get": 1, "session-stats": 5}
+
+
+def test_session_id_is_negotiated_and_renegotiated(daemon):
+    client = AsyncTSClient("127.0.0.1", daemon.port)
+    torrents = run(client, "fetch_torrents", FIELDS_PRINT)
+    assert len(torrents) == len(daemon.torrents)
+    assert client.session_id == "benchmark-session"
+    client.session_id = "rotated"
+    assert run(client, "get_session")["rpc-version"]
+    assert client.session_id == "benchmark-session"
+
+
+def test_closed_connection_is_retried(daemon, connections):
+    client = AsyncTSClient("127.0.0.1", daemon.port)
+
+    async def _run():
+        await client.connect()
+        abort_idle(client)
+        await client._request_arguments("torrent-stop", {"ids": [1]})
+        client.close()
+    asyncio.run(_run())
+    assert len(connections) == 2
+    assert daemon.requests["torrent-stop"] == 1
+
+
+def test_dropped_read_is_retried(daemon, connections):
+    client = AsyncTSClient("127.0.0.1", daemon.port)
+    daemon.drop.add("torrent-get")
+    torrents = run(client, "fetch_torrents", FIELDS_PRINT, ids=[1, 2])
+    assert [t.id for t in torrents] == [1, 2]
+    assert daemon.requests["torrent-get"] == 2
+    assert len(connections) == 2
+
+
+def test_dropped_mutation_is_not_retried(daemon, connections):
+    client = AsyncTSClient("127.0.0.1", daemon.port)
+    daemon.drop.add("torrent-stop")
+    with pytest.raises(transmissionrpc.TransmissionError):
+        run(client, "_request_arguments", "torrent-stop", {"ids": [1]})
+    assert daemon.requests["torrent-stop"] == 1
+    assert len(connections) == 1
+
+
+def test_connection_refused(daemon):
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    with pytest.raises(transmissionrpc.TransmissionError):
+        run(AsyncTSClient("127.0.0.1", port), "session_stats")
@@ -0,0 +1,71 @@
+"""
+A `TorrentCache` kept current from recently-active deltas must hold exactly what a full fetch
+returns, whatever was changed, added or removed in between.
+"""
+import random
+
+import pytest
+
+from transmissionscripts import FIELDS_PRINT, TorrentCache
+
+
+def touch(daemon, torrent_id, **values):
+    """ Change a torrent in the fake daemon the way the real one would report it """
+    with daemon.lock:
+        daemon.torrents[torrent_id].update(values)
+        daemon.recent.add(torrent_id)
+
+
+def add(daemon, template_id):
+    """ Add a copy of a torrent under a new id and hash """
+    with daemon.lock:
+        torrent_id = max(daemon.torrents) + 1
+        torrent = dict(daemon.torrents[template_id], id=torrent_id, hashString="{:040x}".format(torrent_id))
+        daemon.torrents[torrent_id] = torrent
+        daemon.by_hash[torrent["hashString"]] = torrent
+        daemon.recent.add(torrent_id)
+    return torrent_id
+
+
+def snapshot(torrents):
+    return {t.id: t.as_dict() for t in torrents}
+
+
+@pytest.mark.parametrize("rounds", (1, 5))
+def test_delta_sync_matches_full_fetch(client, daemon, rounds):
+    cache = TorrentCache(client, FIELDS_PRINT)
+    cache.sync()
+    rnd = random.Random(rounds)
+    for _ in range(rounds):
+        ids = rnd.sample(sorted(daemon.torrents), 40)
+        for torrent_id in ids[:20]:
+            touch(daemon, torrent_id, rateUpload=rnd.randint(0, 10 ** 6), uploadRatio=rnd.random() * 3,
+                  name="Renamed.{}".format(torrent_id))
+        client.stop_torrent(ids[20:25])
+        client.remove_torrent(ids[25:35])
+        added = [add(daemon, ids[0]) for _ in range(3)]
+        daemon.reset()
+        cache.sync()
+        assert daemon.requests == {"torrent-get": 1}
+        assert set(cache.removed) == set(ids[25:35])
+        assert {t.id for t in cache.changed} == set(ids[:25]) | set(added)
+        assert snapshot(cache) == snapshot(client.fetch_torrents(FIELDS_PRINT))
+
+
+def test_unchanged_sync_transfers_nothing(client, daemon):
+    cache = TorrentCache(client, FIELDS_PRINT)
+    cache.sync()
+    daemon.reset()
+    assert len(cache.sync()) == len(daemon.torrents)
+    assert cache.changed == [] and cache.removed == []
+    assert daemon.bytes_sent < 200
+
+
+def test_stale_cache_does_a_full_sync(client, daemon):
+    cache = TorrentCache(client, FIELDS_PRINT, max_delta_age=0)
+    cache.sync()
+    client.remove_torrent([1])
+    cache.last_sync -= 1
+    cache.sync()
+    assert cache.removed == [1]
+    assert len(cache.changed) == len(daemon.torrents)
@@ -0,0 +1,129 @@
+import time
+
+import transmissionrpc
+
+import transmissionscripts
+from transmissionscripts import CONFIG, FIELDS_CLEAN, apply_removals, plan_removals, remove_torrent
+from transmissionscripts.cleaner import CLEANER_RETRY_DELAY, CleanerDaemon, predict_eligible
+from transmissionscripts.records import TorrentRecord
+
+DEFAULT_RULES = CONFIG["RULES"]["DEF"]
+
+
+def seeding(**values):
+    torrent = {"id": 1, "hashString": "a" * 40, "name": "x", "status": 6, "error": 0, "errorString": "",
+               "trackers": [], "secondsSeeding": 0, "uploadRatio": 0.0, "uploadedEver": 0, "downloadedEver": 1000,
+               "sizeWhenDone": 1000, "rateUpload": 0}
+    torrent.update(values)
+    return TorrentRecord(torrent)
+
+
+def test_predict_by_min_time():
+    now = 1000.0
+    due = predict_eligible(seeding(secondsSeeding=DEFAULT_RULES["min_time"] - 60), now)
+    assert 60 < due - now <= 62
+
+
+def test_predict_by_upload_rate():
+    now = 1000.0
+    remaining = DEFAULT_RULES["max_ratio"] * 1000
+    due = predict_eligible(seeding(rateUpload=int(remaining / 10)), now)
+    assert 10 < due - now <= 12
+
+
+def test_predict_not_seeding():
+    assert predict_eligible(seeding(status=4), 1000.0) is None
+
+
+def test_predict_qualifying_now():
+    assert predict_eligible(seeding(error=2, errorString="Unregistered torrent"), 1000.0) == 1000.0
+
+
+def qualifying(client):
+    return set(plan_removals(client.fetch_torrents(FIELDS_CLEAN)))
+
+
+def test_removes_what_clean_torrents_would(client, daemon):
+    expected = qualifying(client)
+    assert expected
+    cleaner = CleanerDaemon(client)
+    cleaner.step()
+    assert cleaner.removed == len(expected)
+    assert not expected & set(daemon.by_hash)
+    assert not qualifying(client)
+
+
+def test_dry_run_removes_nothing_and_reports_once(client, daemon):
+    count = len(daemon.torrents)
+    cleaner = CleanerDaemon(client, dry_run=True)
+    cleaner.step()
+    assert len(daemon.torrents) == count
+    reported = cleaner.removed
+    now = time.time() + CLEANER_RETRY_DELAY + 1
+    cleaner.check(cleaner.pop_due(now), now)
+    assert cleaner.removed == reported
+
+
+def test_failed_removal_is_retried(client, daemon, monkeypatch):
+    expected = qualifying(client)
+
+    def fail(*args, **kwargs):
+        raise transmissionrpc.TransmissionError("Query failed")
+
+    monkeypatch.setattr(client, "remove_torrent", fail)
+    cleaner = CleanerDaemon(client)
+    cleaner.step()
+    assert cleaner.removed == 0
+    assert expected <= set(daemon.by_hash)
+    monkeypatch.undo()
+    now = time.time()
+    assert not cleaner.pop_due(now)
+    later = now + CLEANER_RETRY_DELAY + 1
+    # The failed torrents were stopped, they are removed for their original reasons all the same
+    cleaner.check(cleaner.pop_due(later), later)
+    assert cleaner.removed == len(expected)
+    assert not expected & set(daemon.by_hash)
+
+
+def test_changed_torrents_are_rescheduled(client, daemon):
+    cleaner = CleanerDaemon(client)
+    cleaner.step()
+    torrent_id = next(t["id"] for t in daemon.torrents.values() if t["status"] == 6)
+    with daemon.lock:
+        daemon.torrents[torrent_id]["error"] = 2
+        daemon.torrents[torrent_id]["errorString"] = "Unregistered torrent"
+        daemon.recent.add(torrent_id)
+    cleaner.next_sync = 0
+    daemon.reset()
+    cleaner.step()
+    assert torrent_id not in daemon.torrents
+    assert daemon.requests["torrent-get"] == 2
+
+
+def logged_removals(monkeypatch):
+    messages = []
+    monkeypatch.setattr(transmissionscripts.logger, "info", messages.append)
+    return messages
+
+
+def test_failed_removal_is_not_logged(client, monkeypatch):
+    plan = plan_removals(client.fetch_torrents(FIELDS_CLEAN))
+    torrent = next(iter(plan.values()))[0]
+
+    def fail(*args, **kwargs):
+        raise transmissionrpc.TransmissionError("Query failed")
+
+    monkeypatch.setattr(client, "remove_torrent", fail)
+    messages = logged_removals(monkeypatch)
+    assert not remove_torrent(client, torrent)
+    results = apply_removals(client, plan)
+    assert all(result.error for result in results if result.action == "remove")
+    assert not [message for message in messages if message.startswith("Removed:")]
+
+
+def test_removals_are_logged_once(client, monkeypatch):
+    plan = plan_removals(client.fetch_torrents(FIELDS_CLEAN))
+    for dry_run in (True, False):
+        messages = logged_removals(monkeypatch)
+        apply_removals(client, plan, dry_run=dry_run)
+        assert len([message for message in messages if message.startswith("Removed:")]) == len(plan)
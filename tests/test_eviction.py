@@ -0,0 +1,118 @@
+import itertools
+import random
+
+import pytest
+import transmissionrpc
+
+import transmissionscripts
+from transmissionscripts.eviction import FIELDS_EVICTION, EvictionCandidate, apply_eviction, eviction_cost, \
+    make_free_space_lookup, parse_size, plan_eviction, solve_eviction
+from transmissionscripts.records import TorrentRecord
+
+
+@pytest.mark.parametrize("text,size", (
+        ("500", 500), ("500G", 500 * 10 ** 9), ("1.5TB", 15 * 10 ** 11), ("200GiB", 200 * 2 ** 30), ("1 kb", 1000)))
+def test_parse_size(text, size):
+    assert parse_size(text) == size
+
+
+def test_parse_size_invalid():
+    with pytest.raises(ValueError):
+        parse_size("lots")
+
+
+def test_solve_covers_deficit_cheaply():
+    rnd = random.Random(5)
+    for _ in range(300):
+        candidates = [EvictionCandidate(None, rnd.randint(1, 100), rnd.choice((0, rnd.random() * 100)), rnd.random())
+                      for _ in range(rnd.randint(1, 10))]
+        deficit = rnd.randint(1, sum(c.size for c in candidates))
+        chosen = solve_eviction(candidates, deficit)
+        assert sum(c.size for c in chosen) >= deficit
+        best = min(sum(c.cost for c in subset) for r in range(1, len(candidates) + 1)
+                   for subset in itertools.combinations(candidates, r) if sum(c.size for c in subset) >= deficit)
+        assert sum(c.cost for c in chosen) <= 2 * best + 1e-9
+
+
+def test_solve_takes_everything_when_short():
+    candidates = [EvictionCandidate(None, 10, 1.0, 1.0), EvictionCandidate(None, 20, 5.0, 1.0)]
+    assert len(solve_eviction(candidates, 100)) == 2
+    assert solve_eviction(candidates, 0) == []
+
+
+def test_cost_ignores_negative_ratio():
+    torrent = TorrentRecord({"id": 1, "name": "x", "trackers": [], "uploadRatio": -1, "secondsSeeding": 0,
+                             "rateUpload": 0, "sizeWhenDone": 100})
+    cost, slack = eviction_cost(torrent)
+    assert slack == 0
+    assert cost > 0
+
+
+def test_plan_groups_remote_directories_by_disk(client, daemon):
+    daemon.free_space = {"/data/tv": (10 ** 11, 10 ** 13), "/data/movies": (10 ** 11, 10 ** 13)}
+    lookup = make_free_space_lookup(client, local=False)
+    plan = plan_eviction(client.fetch_torrents(FIELDS_EVICTION), {None: 2 * 10 ** 11}, lookup)
+    by_dirs = {frozenset(group.directories): group for group in plan}
+    shared = by_dirs[frozenset(("/data/tv", "/data/movies"))]
+    assert shared.deficit == 10 ** 11
+    assert shared.freed >= shared.deficit
+    # Both directories share one deficit rather than each freeing it
+    assert shared.freed - min(c.size for c in shared.chosen) < shared.deficit
+    assert all(group.deficit == 0 and not group.chosen for group in plan if group is not shared)
+    assert all(c.torrent.status == "seeding" for c in shared.chosen)
+
+
+def test_plan_target_per_directory(client, daemon):
+    lookup = make_free_space_lookup(client, local=False)
+    plan = plan_eviction(client.fetch_torrents(FIELDS_EVICTION), {"/data/music": 5 * 10 ** 12}, lookup)
+    # Directories without a target are left alone even though they share the disk
+    assert [sorted(group.directories) for group in plan] == [["/data/music"]]
+    assert plan[0].deficit == 10 ** 12
+
+
+def test_apply_eviction_deletes_chosen(client, daemon):
+    daemon.free_space = {"/data/music": 0}
+    lookup = make_free_space_lookup(client, local=False)
+    plan = plan_eviction(client.fetch_torrents(FIELDS_EVICTION), {"/data/music": 10 ** 10}, lookup)
+    chosen = [c.torrent.id for group in plan for c in group.chosen]
+    assert chosen
+    apply_eviction(client, plan, dry_run=True)
+    assert all(torrent_id in daemon.torrents for torrent_id in chosen)
+    results = apply_eviction(client, plan)
+    assert not any(result.error for result in results)
+    assert not any(torrent_id in daemon.torrents for torrent_id in chosen)
+
+
+def test_failed_eviction_is_not_logged(client, daemon, monkeypatch):
+    daemon.free_space = {"/data/music": 0}
+    lookup = make_free_space_lookup(client, local=False)
+    plan = plan_eviction(client.fetch_torrents(FIELDS_EVICTION), {"/data/music": 10 ** 10}, lookup)
+    chosen = sum(len(group.chosen) for group in plan)
+    messages = []
+    monkeypatch.setattr(transmissionscripts.logger, "info", messages.append)
+    apply_eviction(client, plan, dry_run=True)
+    assert len(messages) == chosen
+
+    def fail(*args, **kwargs):
+        raise transmissionrpc.TransmissionError("Query failed")
+
+    del messages[:]
+    monkeypatch.setattr(client, "remove_torrent", fail)
+    results = apply_eviction(client, plan)
+    assert any(result.error for result in results)
+    assert not [message for message in messages if message.startswith("Evicted:")]
+
+
+def test_local_lookup_groups_by_mount(tmp_path):
+    first, second = tmp_path / "a", tmp_path / "b"
+    first.mkdir()
+    second.mkdir()
+    lookup = make_free_space_lookup(local=True)
+    (key_a, free_a), (key_b, free_b) = lookup(str(first)), lookup(str(second))
+    assert key_a == key_b
+    assert free_a is not None and free_a == free_b
+
+
+def test_remote_lookup_ignores_local_directories(client, daemon, tmp_path):
+    daemon.free_space = {str(tmp_path): 12345}
+    assert make_free_space_lookup(client, local=False)(str(tmp_path)) == (str(tmp_path), 12345)
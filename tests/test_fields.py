@@ -0,0 +1,32 @@
+"""
+Commands request only the torrent-get fields they read instead of the full payload.
+"""
+import io
+from contextlib import redirect_stdout
+
+from conftest import load_script
+from transmissionscripts import FIELDS_PRINT, make_fields
+
+ts_cli = load_script("ts_cli")
+
+
+def test_ls_fetches_only_printed_fields(client, daemon):
+    cli = ts_cli.TorrentCLI(client, index_names=False)
+    out = io.StringIO()
+    cli.stdout = out
+    daemon.reset()
+    with redirect_stdout(out):
+        cli.onecmd("ls seeding | ratio | 5")
+    assert daemon.requests == {"torrent-get": 1}
+    assert len(out.getvalue().splitlines()) == 5
+    projected = daemon.bytes_sent
+    daemon.reset()
+    client.get_torrents()
+    assert projected < daemon.bytes_sent
+
+
+def test_fetch_torrents_projects_fields(client):
+    fields = make_fields(FIELDS_PRINT)
+    torrent = client.fetch_torrents(fields)[0]
+    assert set(torrent.as_dict()) <= set(fields)
+    assert not hasattr(torrent, "downloadDir")
@@ -0,0 +1,65 @@
+"""
+The planned ls pipeline (field projection, streaming, columnar sort, top-k limits and the tracker
+index) must print exactly what the original stage by stage pipeline over full torrents printed.
+"""
+import io
+import random
+from contextlib import redirect_stdout
+
+import pytest
+
+from conftest import load_script
+from transmissionscripts import Filter, Sort, filter_torrents_by, find_tracker, print_torrent_line
+
+ts_cli = load_script("ts_cli")
+
+STAGES = list(Filter.names) + list(Sort.names) + ["r", "5", "1", "40", "5000", "n=se", "n=the.", "t=apo",
+                                                 "t=def", "t=zzz", "p", "c"]
+
+
+def reference_ls(torrents, args):
+    """ The original ts_cli pipeline: every stage applied in turn to the full torrent list """
+    out = io.StringIO()
+    with redirect_stdout(out):
+        for i, arg in enumerate(args, start=1):
+            last = i == len(args)
+            if arg.isdigit():
+                torrents = torrents[:int(arg)]
+            elif arg == "p":
+                last = True
+            elif arg == "c":
+                print(len(torrents))
+                break
+            elif arg == "r":
+                torrents.reverse()
+            elif arg in Filter.names:
+                torrents = filter_torrents_by(torrents, key=getattr(Filter, arg))
+            elif arg in Sort.names:
+                torrents = sorted(torrents, key=getattr(Sort, arg))
+            elif arg.startswith("n="):
+                torrents = [t for t in torrents if t.name.lower().startswith(arg[2:])]
+            elif arg.startswith("t="):
+                torrents = [t for t in torrents if arg[2:] in find_tracker(t).lower()]
+            if last:
+                for torrent in torrents:
+                    print_torrent_line(torrent)
+    return out.getvalue()
+
+
+def run_ls(cli, args):
+    out = io.StringIO()
+    cli.stdout = out
+    with redirect_stdout(out):
+        cli.onecmd("ls " + " | ".join(args))
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("index_names", (False, True), ids=("one-shot", "repl"))
+def test_ls_matches_reference(client, index_names):
+    full = client.get_torrents()
+    cli = ts_cli.TorrentCLI(client, index_names=index_names)
+    rnd = random.Random(3)
+    for _ in range(60):
+        args = [rnd.choice(STAGES) for _ in range(rnd.randint(1, 5))]
+        assert run_ls(cli, args) == reference_ls(list(full), args), args
+
@@ -0,0 +1,62 @@
+import pytest
+
+from transmissionscripts import CACHE_MAX_DELTA_AGE
+from transmissionscripts.schedule import MAX_BACKOFF, PollScheduler
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def run(scheduler, clock, durations):
+    """ Tick once per poll duration, returning the times each tick started """
+    started = []
+    for duration in durations:
+        scheduler.wait()
+        started.append(clock.now)
+        clock.now += duration
+        scheduler.record(duration)
+    return started
+
+
+def gaps(started):
+    return [b - a for a, b in zip(started, started[1:])]
+
+
+def test_fixed_cadence_without_drift():
+    clock = FakeClock()
+    scheduler = PollScheduler(5.0, clock=clock, sleep=clock.sleep)
+    assert gaps(run(scheduler, clock, [1.0, 2.0, 0.5, 2.4])) == [5.0] * 3
+    assert not scheduler.backed_off
+
+
+def test_backs_off_while_slow_and_recovers():
+    clock = FakeClock()
+    scheduler = PollScheduler(1.0, clock=clock, sleep=clock.sleep)
+    run(scheduler, clock, [100.0] * 5)
+    assert scheduler.interval == MAX_BACKOFF
+    run(scheduler, clock, [0.1] * 10)
+    assert scheduler.interval == 1.0
+
+
+@pytest.mark.parametrize("interval", (5.0, 10.0, 30.0))
+def test_back_off_keeps_delta_syncs(interval):
+    clock = FakeClock()
+    max_interval = CACHE_MAX_DELTA_AGE * 0.8
+    scheduler = PollScheduler(interval, max_interval=max_interval, clock=clock, sleep=clock.sleep)
+    started = run(scheduler, clock, [interval * 1.2] * 20)
+    assert scheduler.backed_off
+    assert all(gap <= CACHE_MAX_DELTA_AGE for gap in gaps(started))
+
+
+def test_max_interval_never_shortens_interval():
+    scheduler = PollScheduler(60.0, max_interval=40.0)
+    scheduler.record(1000.0)
+    assert scheduler.interval == 60.0
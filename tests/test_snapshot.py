@@ -0,0 +1,47 @@
+"""
+A snapshot refreshed from the small fields only must still hold what a full fetch returns, even
+when the daemon has given a stored id to another torrent.
+"""
+from transmissionscripts.snapshot import FIELDS_SNAPSHOT, TorrentSnapshot
+
+
+def age(snapshot, seconds):
+    db = snapshot._connect()
+    try:
+        with db:
+            db.execute("UPDATE snapshots SET synced = synced - ?", (seconds,))
+    finally:
+        db.close()
+
+
+def renumber(daemon, first, second):
+    """ Swap the ids of two torrents, as a restarted daemon may number them differently """
+    with daemon.lock:
+        a, b = daemon.torrents[first], daemon.torrents[second]
+        a["id"], b["id"] = second, first
+        daemon.torrents[first], daemon.torrents[second] = b, a
+
+
+def test_partial_refresh_matches_full_fetch_after_renumbering(client, daemon, tmp_path):
+    snapshot = TorrentSnapshot("test", str(tmp_path / "snapshot.sqlite"))
+    snapshot.refresh(client)
+    first = daemon.torrents[1]
+    second = next(t for t in daemon.torrents.values()
+                  if t["downloadDir"] != first["downloadDir"] and t["trackers"] != first["trackers"])
+    renumber(daemon, 1, second["id"])
+    age(snapshot, 3600)
+    snapshot.refresh(client)
+    stored = {t.id: t.as_dict() for t in snapshot.load(max_age=None)}
+    assert stored == {t.id: t.as_dict() for t in client.fetch_torrents(FIELDS_SNAPSHOT)}
+    assert stored[1]["downloadDir"] == second["downloadDir"]
+    columns, rows = snapshot.execute("SELECT hash FROM torrents WHERE id = 1")
+    assert rows == [(second["hashString"],)]
+
+
+def test_partial_refresh_skips_static_fields(client, daemon, tmp_path):
+    snapshot = TorrentSnapshot("test", str(tmp_path / "snapshot.sqlite"))
+    snapshot.refresh(client)
+    age(snapshot, 3600)
+    daemon.reset()
+    snapshot.refresh(client)
+    assert daemon.requests == {"torrent-get": 1}
@@ -0,0 +1,51 @@
+"""
+Streamed torrent-get responses must decode to what a buffered request returns, and fail the same way.
+"""
+import io
+import json
+
+import pytest
+import transmissionrpc
+
+from transmissionscripts import FIELDS_PRINT, _check_result, _iter_json_array
+from transmissionscripts.instrument import PROFILER
+
+
+def test_stream_matches_fetch(client):
+    streamed = [t.as_dict() for t in client.iter_torrents(FIELDS_PRINT)]
+    assert streamed == [t.as_dict() for t in client.fetch_torrents(FIELDS_PRINT)]
+
+
+@pytest.fixture
+def failing_torrent_get(daemon, monkeypatch):
+    """ Make the daemon answer torrent-get with an error result """
+    handle = daemon.handle
+
+    def failing(method, arguments):
+        if method == "torrent-get":
+            raise KeyError(method)
+        return handle(method, arguments)
+
+    monkeypatch.setattr(daemon, "handle", failing)
+
+
+@pytest.mark.parametrize("timed", (False, True), ids=("plain", "profiled"))
+def test_stream_raises_daemon_errors(client, failing_torrent_get, monkeypatch, timed):
+    monkeypatch.setattr(PROFILER, "enabled", timed)
+    with pytest.raises(transmissionrpc.TransmissionError):
+        list(client.iter_torrents(FIELDS_PRINT))
+
+
+@pytest.mark.parametrize("chunk_size", (1, 7, 4096))
+def test_result_after_array_is_checked(chunk_size):
+    items = [{"id": i, "name": "torrent ]\\" + str(i)} for i in range(20)]
+    document = {"arguments": {"torrents": items, "removed": [1]}, "result": "success", "tag": 3}
+
+    def stream(values):
+        return io.BytesIO(json.dumps(values).encode("utf-8"))
+
+    assert list(_iter_json_array(stream(document), "torrents", chunk_size, _check_result)) == items
+    document["result"] = "torrent-get failed"
+    with pytest.raises(transmissionrpc.TransmissionError):
+        list(_iter_json_array(stream(document), "torrents", chunk_size, _check_result))
+
@@ -5,14 +5,31 @@ Simple set of functionality to manage a local or remote transmission instance. Y
 as a set of helper functions for interacting with the transmissionrpc python module.
 """
 import argparse
+import bisect
+import codecs
 import errno
+import heapq
 import logging
 import math
+import re
 import sys
-from json import dumps, load
+import time
+from collections import defaultdict, deque, namedtuple
+from functools import lru_cache
+from json import dumps, load, loads, JSONDecoder
 from os.path import expanduser, join, exists, isdir
 from os import makedirs, environ
 import transmissionrpc
+from transmissionrpc.client import parse_torrent_ids
+from time import perf_counter
+from transmissionscripts.instrument import PROFILER, CountingReader
+from transmissionscripts.records import TorrentRecord, status_codes
+try:
+    from urllib.request import Request
+    from urllib.error import HTTPError
+except ImportError:
+    # noinspection PyUnresolvedReferences
+    from urllib2 import Request, HTTPError
 
 
 logging.basicConfig()
@@ -36,12 +53,58 @@ SEED_TIME_BUFFER = 1.1
 
 RULES_DEFAULT = 'DEF'
 
+# Default number of torrents sent in each batched RPC mutation
+BATCH_SIZE = 500
+
+# Bytes read at a time when streaming large RPC responses
+STREAM_CHUNK_SIZE = 1 << 16
+
+# Number of announce urls the tracker rule matcher remembers results for
+RULE_CACHE_SIZE = 4096
+
+# Lines a `TorrentRenderer` buffers before writing them out
+RENDER_CHUNK_LINES = 1000
+
+# Number of formatted sizes a `TorrentRenderer` remembers
+RENDER_SIZE_CACHE_SIZE = 8192
+
+# Transmission reports torrents which changed within the last 60 seconds as "recently-active". Caches
+# fall back to a full sync once their last sync is older than this so no changes are missed.
+CACHE_MAX_DELTA_AGE = 50
+
+# Share of all torrents above which a query resolved from a `TorrentIndex` fetches every torrent and
+# filters locally, rather than sending the matching ids
+INDEX_FETCH_SHARE = 0.5
+
+# torrent-get fields which are always requested so results can be identified and acted upon
+FIELDS_IDENTITY = ('id', 'hashString', 'name')
+
+# torrent-get fields read by find_tracker and find_rule_set
+FIELDS_TRACKER = ('trackers',)
+
+# torrent-get fields read by print_torrent_line
+FIELDS_PRINT = ('id', 'name', 'sizeWhenDone', 'leftUntilDone', 'totalSize', 'uploadRatio',
+                'rateUpload', 'rateDownload', 'status') + FIELDS_TRACKER
+
+# torrent-get fields read by the cleaning functions
+FIELDS_CLEAN = ('error', 'errorString', 'status', 'uploadRatio', 'secondsSeeding') + FIELDS_TRACKER
+
+# torrent-get fields read by aggregate_by_tracker
+FIELDS_AGGREGATE = ('status', 'totalSize', 'rateUpload', 'rateDownload', 'uploadRatio', 'error') + FIELDS_TRACKER
+
+# torrent-get fields kept by a `TorrentIndex`
+FIELDS_INDEX = FIELDS_IDENTITY + FIELDS_TRACKER
+
+# Upper bounds of the ratio buckets counted by TrackerStats, a last bucket holds every larger ratio
+RATIO_BUCKETS = (0.5, 1.0, 2.0, 5.0)
+
 CONFIG = {
     'CLIENT': {
         'host': 'localhost',
         'port': transmissionrpc.DEFAULT_PORT,
         'user': None,
-        'password': None
+        'password': None,
+        'batch_size': BATCH_SIZE
     },
     'RULES': {
         'apollo': {
@@ -121,6 +184,122 @@ def colored(msg, color=None, on_color=None, attrs=None):
         return msg
 
 
+class RuleMatcher(object):
+    """ Matches announce urls against the configured tracker rule keys. The keys are compiled once into an
+    Aho-Corasick automaton so a url is scanned in a single pass no matter how many rules are defined, and
+    results are memoized per announce url with least recently used eviction.
+
+    When more than one key matches, the rule defined first in the config wins, the same as a linear scan.
+    """
+
+    def __init__(self, rules, default=RULES_DEFAULT, cache_size=RULE_CACHE_SIZE):
+        """
+
+        :param rules: Rule sets keyed by the announce url substring to match, eg. `CONFIG['RULES']`
+        :type rules: dict
+        :param default: Key of the rule set used when nothing matches
+        :type default: str
+        :param cache_size: Maximum number of announce urls to memoize
+        :type cache_size: int
+        """
+        self.rules = rules
+        self.default = rules[default]
+        self._keys = list(rules)
+        self._goto = [{}]
+        self._fail = [0]
+        # Lowest key index matched upon reaching each state, following fail links
+        self._out = [None]
+        for index, key in enumerate(self._keys):
+            self._add_key(key, index)
+        self._build_fail_links()
+        self.match_url = lru_cache(maxsize=cache_size)(self._match_url)
+
+    def _add_key(self, key, index):
+        state = 0
+        for char in key:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+                self._goto[state][char] = next_state
+            state = next_state
+        if self._out[state] is None or index < self._out[state]:
+            self._out[state] = index
+
+    def _build_fail_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                inherited = self._out[self._fail[next_state]]
+                if inherited is not None and (self._out[next_state] is None or inherited < self._out[next_state]):
+                    self._out[next_state] = inherited
+
+    def _match_url(self, url):
+        """ Find the index of the highest priority rule key within the announce url
+
+        :param url: Announce url
+        :type url: str
+        :return: Index of the matching key or None
+        :rtype: int
+        """
+        goto, fail, out = self._goto, self._fail, self._out
+        best = None
+        state = 0
+        for char in url.lower():
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            index = out[state]
+            if index is not None and (best is None or index < best):
+                best = index
+                if best == 0:
+                    break
+        return best
+
+    def match(self, torrent):
+        """ Return the rule set matching any of the torrents trackers
+
+        :param torrent: Torrent instance to search
+        :type torrent: transmissionrpc.Torrent
+        :return: A matching rule set if it exists, otherwise the default rule set
+        :rtype: dict
+        """
+        best = None
+        for tracker in torrent.trackers:
+            index = self.match_url(tracker['announce'])
+            if index is not None and (best is None or index < best):
+                best = index
+        if best is None:
+            return self.default
+        return self.rules[self._keys[best]]
+
+
+_rule_matcher = None
+
+
+def get_rule_matcher():
+    """ Return the rule matcher for the currently loaded config, compiling a new one whenever
+    the rules have been replaced, eg. by `load_config`.
+
+    :rtype: RuleMatcher
+    """
+    global _rule_matcher
+    if _rule_matcher is None or _rule_matcher.rules is not CONFIG['RULES']:
+        _rule_matcher = RuleMatcher(CONFIG['RULES'])
+    return _rule_matcher
+
+
+PROFILER.cache_sources["rule matcher urls"] = lambda: get_rule_matcher().match_url.cache_info()[0:2]
+
+
 def find_rule_set(torrent):
     """ Return the rule set associated with the torrent.
 
@@ -129,15 +308,9 @@ def find_rule_set(torrent):
     :return: A matching rule set if it exists, otherwise a default rule set
     :rtype: dict
     """
+    return get_rule_matcher().match(torrent)
 
-    for key in CONFIG['RULES']:
-        for tracker in torrent.trackers:
-            if key in tracker['announce'].lower():
-                return CONFIG['RULES'][key]
-    return CONFIG['RULES'][RULES_DEFAULT]
 
-
-# noinspection PyTypeChecker
 def find_tracker(torrent):
     """ Find the tracker that the torrent is associated with. This uses the announce
     url to determine it based on the configured trackers. It will return default if it
@@ -147,11 +320,7 @@ def find_tracker(torrent):
     :type torrent: transmissionrpc.Torrent
     :return:
     """
-    for key in CONFIG['RULES']:
-        for tracker in torrent.trackers:
-            if key in tracker['announce'].lower():
-                return CONFIG['RULES'][key]['name']
-    return CONFIG['RULES'][RULES_DEFAULT]['name']
+    return get_rule_matcher().match(torrent)['name']
 
 
 def make_arg_parser():
@@ -180,6 +349,8 @@ def make_arg_parser():
                         help="Generate a config file that can be used to override defaults")
     parser.add_argument('--force', '-f', help="Overwrite existing files",
                         dest='force', action='store_true')
+    parser.add_argument('--profile', action='store_true',
+                        help="Time RPC requests, pipeline stages and caches, the report is written to stderr on exit")
     return parser
 
 
@@ -246,12 +417,411 @@ def load_config(path=None):
     return False
 
 
+def make_fields(*field_sets):
+    """ Merge any number of torrent-get field name sequences into the smallest argument list
+    that satisfies all of them. The identity fields are always included.
+
+    >>> make_fields(Filter.fields['seeding'], Sort.fields['ratio'], FIELDS_PRINT)
+
+    :param field_sets: Sequences of torrent-get field names, None values are ignored
+    :return: Sorted, de-duplicated list of field names
+    :rtype: list
+    """
+    fields = set(FIELDS_IDENTITY)
+    for field_set in field_sets:
+        if field_set:
+            fields.update(field_set)
+    return sorted(fields)
+
+
+def _iter_json_array(fp, key, chunk_size=STREAM_CHUNK_SIZE, check_document=None):
+    """ Incrementally decode the objects of the first array stored under key in a JSON document,
+    yielding each one as soon as it has been read instead of buffering the whole document.
+
+    :param fp: File like object returning utf-8 encoded bytes
+    :param key: Name of the key holding the array
+    :type key: str
+    :param chunk_size: Bytes to read at a time
+    :type chunk_size: int
+    :param check_document: Called with the rest of the decoded document, the array emptied, once the
+    array has been read or when the document has no such array. Raise to reject the document.
+    :return: Generator of decoded array elements
+    """
+    decoder = JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    marker = re.compile(r'"{}"\s*:\s*\['.format(re.escape(key)))
+    buf = ""
+    match = None
+    while match is None:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            if check_document is not None:
+                document = _decode_document(buf)
+                if document is not None:
+                    check_document(document)
+            raise ValueError('No "{}" array found in response: {}'.format(key, buf[0:200]))
+        buf += text_decoder.decode(chunk)
+        match = marker.search(buf)
+    head = buf[:match.end()]
+    pos = match.end()
+    while True:
+        while pos < len(buf) and buf[pos] in " \t\r\n,":
+            pos += 1
+        if pos < len(buf) and buf[pos] == "]":
+            break
+        try:
+            if pos >= len(buf):
+                raise ValueError("Buffer exhausted")
+            item, pos = decoder.raw_decode(buf, pos)
+        except ValueError:
+            chunk = fp.read(chunk_size)
+            if not chunk:
+                raise ValueError('Truncated "{}" array in response'.format(key))
+            buf = buf[pos:] + text_decoder.decode(chunk)
+            pos = 0
+            continue
+        yield item
+        if pos > chunk_size:
+            buf = buf[pos:]
+            pos = 0
+    if check_document is not None:
+        tail = [buf[pos:]]
+        chunk = fp.read(chunk_size)
+        while chunk:
+            tail.append(text_decoder.decode(chunk))
+            chunk = fp.read(chunk_size)
+        document = _decode_document(head + "".join(tail))
+        if document is None:
+            raise ValueError('Malformed response after the "{}" array'.format(key))
+        check_document(document)
+
+
+def _decode_document(text):
+    """ Decode a JSON object, returning None when the text is not one
+
+    :type text: str
+    :rtype: dict|None
+    """
+    try:
+        document = loads(text)
+    except ValueError:
+        return None
+    return document if isinstance(document, dict) else None
+
+
+def _check_result(data):
+    """ Raise the error of a RPC response which did not succeed
+
+    :param data: Decoded RPC response
+    :type data: dict
+    """
+    if data.get('result') != 'success':
+        raise transmissionrpc.TransmissionError('Query failed with result "{}".'.format(data.get('result')))
+
+
+def make_limit_args(speed_up=None, speed_dn=None, alt=False):
+    """ Build the session-set arguments for changing the (alt) speed limits
+
+    :param speed_up: Upload limit in kB/s, unchanged when None
+    :param speed_dn: Download limit in kB/s, unchanged when None
+    :param alt: Set the alternate speed limits instead
+    :type alt: bool
+    :rtype: dict
+    """
+    kwargs = {}
+    if alt:
+        if speed_up is not None:
+            kwargs['alt_speed_up'] = speed_up
+        if speed_dn is not None:
+            kwargs['alt_speed_down'] = speed_dn
+    else:
+        if speed_up is not None:
+            kwargs['speed_limit_up'] = speed_up
+        if speed_dn is not None:
+            kwargs['speed_limit_down'] = speed_dn
+    return kwargs
+
+
+def make_enabled_limit_args(status, alt=False):
+    """ Build the session-set arguments for enabling or disabling the (alt) speed limits
+
+    :param status: Enable the limits
+    :type status: bool
+    :param alt: Toggle the alternate speed limits instead
+    :type alt: bool
+    :rtype: dict
+    """
+    kwargs = {}
+    if alt:
+        kwargs['alt_speed_enabled'] = status
+    else:
+        kwargs['speed_limit_down_enabled'] = int(status)
+        kwargs['speed_limit_up_enabled'] = int(status)
+    return kwargs
+
+
+def make_peer_limit_args(limits, is_global=True):
+    """ Build the session-set arguments for changing the peer limits
+
+    :param limits: Maximum number of peers
+    :type limits: int
+    :param is_global: Set the global limit instead of the per torrent limit
+    :type is_global: bool
+    :rtype: dict
+    """
+    if is_global:
+        return {'peer_limit_global': limits}
+    return {'peer_limit': limits}
+
+
 class TSClient(transmissionrpc.Client):
     """ Basic subclass of the standard transmissionrpc client which provides some simple
     helper functionality.
     """
 
-    def get_torrents_by(self, sort_by=None, filter_by=None, reverse=False):
+    # Duration and response size of the last `_http_query`, only kept while profiling
+    _query_seconds = 0.0
+    _query_bytes = 0
+
+    # Created by `torrent_index`
+    _index = None
+
+    def _http_query(self, query, timeout=None):
+        if not PROFILER.enabled:
+            return transmissionrpc.Client._http_query(self, query, timeout)
+        started = perf_counter()
+        result = transmissionrpc.Client._http_query(self, query, timeout)
+        self._query_seconds = perf_counter() - started
+        self._query_bytes = len(result)
+        return result
+
+    def _request(self, method, arguments=None, ids=None, require_ids=False, timeout=None):
+        if not PROFILER.enabled:
+            return transmissionrpc.Client._request(self, method, arguments, ids, require_ids, timeout)
+        started = perf_counter()
+        try:
+            return transmissionrpc.Client._request(self, method, arguments, ids, require_ids, timeout)
+        finally:
+            seconds = perf_counter() - started
+            PROFILER.record_rpc(method, seconds, self._query_bytes,
+                                http=self._query_seconds, decode=seconds - self._query_seconds)
+
+    def _build_torrents(self, make_torrent, items):
+        """ Build torrents from the items of a torrent-get response, timed while profiling """
+        if not PROFILER.enabled:
+            return [make_torrent(item) for item in items]
+        started = perf_counter()
+        torrents = [make_torrent(item) for item in items]
+        PROFILER.add_phase('torrent-get', 'build', perf_counter() - started)
+        return torrents
+
+    def _torrent_factory(self, fields):
+        """ Return the callable used to build torrents from torrent-get response items. Projected
+        requests produce compact `TorrentRecord` instances, full requests `transmissionrpc.Torrent`.
+
+        :param fields: torrent-get field names requested, None when every field was requested
+        :type fields: list
+        :rtype: callable
+        """
+        if fields is None:
+            return lambda item: transmissionrpc.Torrent(self, item)
+        statuses = status_codes(self.rpc_version)
+        return lambda item: TorrentRecord(item, statuses)
+
+    def _torrent_get_arguments(self, fields, ids):
+        arguments = {'fields': make_fields(fields) if fields is not None else self.torrent_get_arguments}
+        if ids == 'recently-active':
+            arguments['ids'] = ids
+        else:
+            ids = parse_torrent_ids(ids)
+            if ids:
+                arguments['ids'] = ids
+        return arguments
+
+    def fetch_torrents(self, fields=None, ids=None, timeout=None):
+        """ Fetch torrents requesting only the fields given instead of the full torrent-get
+        payload (files, peers, pieces, trackerStats...) which can be very large.
+
+        :param fields: torrent-get field names required, None fetches every field
+        :type fields: list
+        :param ids: Optional torrent ids or hashes to limit the request to
+        :param timeout: Optional request timeout
+        :return: Torrent list, compact records unless every field was requested
+        :rtype: TorrentRecord[]
+        """
+        make_torrent = self._torrent_factory(fields)
+        data = self._request_arguments('torrent-get', self._torrent_get_arguments(fields, ids), timeout)
+        return self._build_torrents(make_torrent, data.get('torrents', []))
+
+    def _request_arguments(self, method, arguments=None, timeout=None):
+        """ Send a raw RPC request returning the response arguments dict untouched. Unlike
+        `_request` this does not discard response keys such as "removed".
+
+        :param method: RPC method name
+        :type method: str
+        :param arguments: RPC arguments
+        :type arguments: dict
+        :param timeout: Optional request timeout
+        :return: Response arguments
+        :rtype: dict
+        """
+        query = dumps({'tag': self._sequence, 'method': method, 'arguments': arguments or {}})
+        self._sequence += 1
+        if PROFILER.enabled:
+            data = self._timed_query(method, query, timeout)
+        else:
+            data = loads(self._http_query(query, timeout))
+        _check_result(data)
+        return data['arguments']
+
+    def _timed_query(self, method, query, timeout=None):
+        """ Send a raw RPC request and decode the response, recording how long waiting for the
+        response, transferring it and decoding it took.
+
+        :param method: RPC method name
+        :type method: str
+        :param query: JSON encoded request
+        :type query: str
+        :param timeout: Optional request timeout
+        :return: Decoded response
+        :rtype: dict
+        """
+        started = perf_counter()
+        if hasattr(self.http_handler, 'http_opener'):
+            response = self._open_stream(query.encode('utf-8'), timeout)
+            opened = perf_counter()
+            try:
+                body = response.read()
+            finally:
+                response.close()
+        else:
+            body = transmissionrpc.Client._http_query(self, query, timeout)
+            opened = started
+        received = perf_counter()
+        data = loads(body)
+        decoded = perf_counter()
+        PROFILER.record_rpc(method, decoded - started, len(body), len(data.get('arguments', {}).get('torrents', ())),
+                            wait=opened - started, transfer=received - opened, decode=decoded - received)
+        return data
+
+    def _open_stream(self, query, timeout=None):
+        """ Send a raw RPC request returning the unread HTTP response, negotiating the session id
+        if required.
+
+        :param query: JSON encoded request
+        :type query: bytes
+        :param timeout: Optional request timeout
+        :return: File like HTTP response
+        """
+        if timeout is None:
+            timeout = self._query_timeout
+        for attempt in range(2):
+            request = Request(self.url, query, {'x-transmission-session-id': str(self.session_id)})
+            try:
+                return self.http_handler.http_opener.open(request, timeout=timeout)
+            except HTTPError as err:
+                if err.code == 409 and not attempt:
+                    self.session_id = err.headers.get('X-Transmission-Session-Id', self.session_id)
+                    continue
+                raise transmissionrpc.TransmissionError('Request failed.', err)
+
+    def iter_torrents(self, fields=None, ids=None, timeout=None):
+        """ Stream torrents from a torrent-get response, decoding and yielding each torrent as it is
+        received so callers can filter or stop early without the full response held in memory.
+        Custom http handlers which cannot stream fall back to a normal request.
+
+        :param fields: torrent-get field names required, None fetches every field
+        :type fields: list
+        :param ids: Optional torrent ids or hashes to limit the request to
+        :param timeout: Optional request timeout
+        :return: Generator of torrents
+        """
+        if not hasattr(self.http_handler, 'http_opener'):
+            for torrent in self.fetch_torrents(fields, ids, timeout):
+                yield torrent
+            return
+        make_torrent = self._torrent_factory(fields)
+        arguments = self._torrent_get_arguments(fields, ids)
+        query = dumps({'tag': self._sequence, 'method': 'torrent-get', 'arguments': arguments})
+        self._sequence += 1
+        if PROFILER.enabled:
+            for torrent in self._iter_timed(query, make_torrent, timeout):
+                yield torrent
+            return
+        response = self._open_stream(query.encode('utf-8'), timeout)
+        try:
+            for item in _iter_json_array(response, 'torrents', check_document=_check_result):
+                yield make_torrent(item)
+        finally:
+            response.close()
+
+    def _iter_timed(self, query, make_torrent, timeout=None):
+        """ `iter_torrents` recording the time spent waiting for the response, reading and decoding
+        it and building torrents, excluding the time the caller spends between torrents.
+        """
+        started = perf_counter()
+        response = self._open_stream(query.encode('utf-8'), timeout)
+        wait = perf_counter() - started
+        reader = CountingReader(response)
+        items = _iter_json_array(reader, 'torrents', check_document=_check_result)
+        read = build = 0.0
+        count = 0
+        try:
+            while True:
+                started = perf_counter()
+                try:
+                    item = next(items)
+                except StopIteration:
+                    read += perf_counter() - started
+                    break
+                decoded = perf_counter()
+                torrent = make_torrent(item)
+                read += decoded - started
+                build += perf_counter() - decoded
+                count += 1
+                yield torrent
+        finally:
+            response.close()
+            PROFILER.record_rpc('torrent-get', wait + read + build, reader.bytes, count,
+                                wait=wait, read=read, build=build)
+
+    def get_recently_active(self, fields=None, timeout=None):
+        """ Fetch only the torrents which changed recently along with the ids of any torrents
+        which were removed since.
+
+        :param fields: torrent-get field names required, None fetches every field
+        :type fields: list
+        :param timeout: Optional request timeout
+        :return: Tuple of the changed torrents and the removed torrent ids
+        :rtype: (TorrentRecord[], int[])
+        """
+        make_torrent = self._torrent_factory(fields)
+        data = self._request_arguments('torrent-get', self._torrent_get_arguments(fields, 'recently-active'), timeout)
+        return self._build_torrents(make_torrent, data.get('torrents', [])), data.get('removed', [])
+
+    def torrent_index(self, sync=True):
+        """ The `TorrentIndex` of this client's torrents, created on first use
+
+        :param sync: Sync the index with the daemon before returning it
+        :type sync: bool
+        :rtype: TorrentIndex
+        """
+        if self._index is None:
+            self._index = TorrentIndex(self)
+        return self._index.sync() if sync else self._index
+
+    def batch(self, chunk_size=None):
+        """ Create a new mutation batch for this client
+
+        :param chunk_size: Torrents per RPC call, defaults to the configured batch_size
+        :type chunk_size: int
+        :rtype: MutationBatch
+        """
+        if chunk_size is None:
+            chunk_size = CONFIG['CLIENT'].get('batch_size', BATCH_SIZE)
+        return MutationBatch(self, chunk_size)
+
+    def get_torrents_by(self, sort_by=None, filter_by=None, reverse=False, fields=None):
         """This method will call get_torrents and then perform any sorting or filtering
         actions requested on the returned torrent set.
 
@@ -260,44 +830,317 @@ class TSClient(transmissionrpc.Client):
         :param filter_by:
         :type filter_by: str
         :param reverse:
-        :return: Sorted and filter torrent list
-        :rtype: transmissionrpc.Torrent[]
+        :param fields: torrent-get fields required by the caller in addition to those used for
+                       sorting and filtering. When None every field is fetched.
+        :type fields: list
+        :return: Sorted and filter torrent list, compact records when fields were given
+        :rtype: TorrentRecord[]
         """
-        torrents = self.get_torrents()
-        if filter_by:
-            torrents = filter_torrents_by(torrents, key=getattr(Filter, filter_by))
-        if sort_by:
-            torrents = sort_torrents_by(torrents, key=getattr(Sort, sort_by), reverse=reverse)
-        return torrents
+        if fields is not None:
+            fields = make_fields(Filter.fields.get(filter_by), Sort.fields.get(sort_by), fields)
+        return select_torrents(self.fetch_torrents(fields), sort_by, filter_by, reverse)
 
     def set_limits(self, speed_up=None, speed_dn=None, alt=False):
-        kwargs = {}
-        if alt:
-            if speed_up is not None:
-                kwargs['alt_speed_up'] = speed_up
-            if speed_dn is not None:
-                kwargs['alt_speed_down'] = speed_up
-        else:
-            if speed_up is not None:
-                kwargs['speed_limit_up'] = speed_up
-            if speed_dn is not None:
-                kwargs['speed_limit_down'] = speed_dn
-        self.set_session(**kwargs)
+        self.set_session(**make_limit_args(speed_up, speed_dn, alt))
 
     def set_enabled_limits(self, status, alt=False):
-        kwargs = {}
-        if alt:
-            kwargs['alt_speed_enabled'] = status
-        else:
-            kwargs['speed_limit_down_enabled'] = int(status)
-            kwargs['speed_limit_up_enabled'] = int(status)
-        self.set_session(**kwargs)
+        self.set_session(**make_enabled_limit_args(status, alt))
 
     def set_peer_limit(self, limits, is_global=True):
-        if is_global:
-            self.set_session(peer_limit_global=limits)
+        self.set_session(**make_peer_limit_args(limits, is_global))
+
+
+BatchResult = namedtuple("BatchResult", ("action", "ids", "error"))
+
+
+def batch_failures(results, action):
+    """ Collect the torrents a committed action failed for
+
+    :param results: Results returned by `MutationBatch.commit`
+    :type results: BatchResult[]
+    :param action: One of `MutationBatch.actions`
+    :type action: str
+    :return: Hashes or ids as they were queued
+    :rtype: set
+    """
+    return {torrent for result in results if result.error and result.action == action for torrent in result.ids}
+
+
+class MutationBatch(object):
+    """ Collects torrent mutations grouped by action and sends each group as id-list RPC calls
+    of at most chunk_size torrents, instead of one round trip per torrent.
+
+    >>> batch = client.batch()
+    >>> for torrent in torrents:
+    >>>     batch.add("stop", torrent)
+    >>>     batch.add("remove", torrent)
+    >>> failed = [result for result in batch.commit() if result.error]
+    """
+
+    # Actions in the order they are applied on commit, so torrents are stopped before removal
+    actions = ("stop", "start", "verify", "remove", "delete")
+
+    def __init__(self, client, chunk_size=BATCH_SIZE):
+        """
+
+        :param client: Transmission RPC Client
+        :type client: transmissionrpc.Client
+        :param chunk_size: Maximum torrents per RPC call
+        :type chunk_size: int
+        """
+        if chunk_size <= 0:
+            raise ValueError("Chunk size must be a positive integer")
+        self.client = client
+        self.chunk_size = chunk_size
+        self._pending = {action: {} for action in self.actions}
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._pending.values())
+
+    def add(self, action, *torrents):
+        """ Queue an action for one or more torrents. Duplicates within an action are ignored.
+
+        :param action: One of `MutationBatch.actions`
+        :type action: str
+        :param torrents: Torrent instances, ids or hashes
+        """
+        if action not in self._pending:
+            raise ValueError("Unknown batch action: {}".format(action))
+        pending = self._pending[action]
+        for torrent in torrents:
+            pending[getattr(torrent, "hashString", torrent)] = True
+
+    def _send(self, action, ids):
+        if action == "stop":
+            self.client.stop_torrent(ids)
+        elif action == "start":
+            self.client.start_torrent(ids)
+        elif action == "verify":
+            self.client.verify_torrent(ids)
+        elif action == "remove":
+            self.client.remove_torrent(ids, delete_data=False)
+        elif action == "delete":
+            self.client.remove_torrent(ids, delete_data=True)
+
+    def commit(self):
+        """ Send all queued actions, clearing the batch. A failed chunk does not stop the
+        remaining chunks from being sent.
+
+        :return: The result of each chunk sent
+        :rtype: BatchResult[]
+        """
+        results = []
+        for action in self.actions:
+            ids = list(self._pending[action])
+            self._pending[action] = {}
+            for offset in range(0, len(ids), self.chunk_size):
+                chunk = ids[offset:offset + self.chunk_size]
+                try:
+                    self._send(action, chunk)
+                except transmissionrpc.TransmissionError as err:
+                    logger.error("Failed to {} {} torrents: {}".format(action, len(chunk), err))
+                    results.append(BatchResult(action, chunk, err))
+                else:
+                    results.append(BatchResult(action, chunk, None))
+        return results
+
+
+class TorrentCache(object):
+    """ Local id -> torrent table kept current using the recently-active delta protocol. The first
+    sync fetches every torrent, subsequent syncs only transfer torrents which changed, making
+    each refresh proportional to the number of active torrents instead of the total.
+
+    >>> cache = TorrentCache(client, FIELDS_PRINT)
+    >>> while True:
+    >>>     for torrent in cache.sync():
+    >>>         print_torrent_line(torrent)
+    >>>     time.sleep(5)
+    """
+
+    def __init__(self, client, fields=None, max_delta_age=CACHE_MAX_DELTA_AGE):
+        """
+
+        :param client: Transmission RPC Client
+        :type client: TSClient
+        :param fields: torrent-get field names to keep for each torrent, None keeps every field
+        :type fields: list
+        :param max_delta_age: Seconds since the last sync after which a full sync is done instead
+        :type max_delta_age: float
+        """
+        self.client = client
+        self.fields = make_fields(fields) if fields is not None else None
+        self.max_delta_age = max_delta_age
+        self.last_sync = None
+        # Torrents added or updated and ids removed by the last sync
+        self.changed = []
+        self.removed = []
+        self._torrents = {}
+
+    def __len__(self):
+        return len(self._torrents)
+
+    def __iter__(self):
+        return iter(list(self._torrents.values()))
+
+    def get(self, torrent_id, default=None):
+        return self._torrents.get(torrent_id, default)
+
+    @property
+    def torrents(self):
+        """ A new list of the currently cached torrents
+
+        :rtype: TorrentRecord[]
+        """
+        return list(self._torrents.values())
+
+    def sync(self, full=False):
+        """ Bring the cache up to date, fetching everything on the first call or when the last sync
+        is too old for the recently-active list to be trusted.
+
+        :param full: Force a full sync
+        :type full: bool
+        :return: The cached torrents
+        :rtype: TorrentRecord[]
+        """
+        started = time.time()
+        full = full or self.last_sync is None or started - self.last_sync > self.max_delta_age
+        if PROFILER.enabled:
+            PROFILER.hit("torrent cache delta syncs", not full)
+        if full:
+            torrents = {t.id: t for t in self.client.fetch_torrents(self.fields)}
+            self.changed = list(torrents.values())
+            self.removed = [torrent_id for torrent_id in self._torrents if torrent_id not in torrents]
+            self._torrents = torrents
         else:
-            self.set_session(peer_limit=limits)
+            updated, removed = self.client.get_recently_active(self.fields)
+            self.changed = []
+            for torrent in updated:
+                existing = self._torrents.get(torrent.id)
+                if existing is None:
+                    self._torrents[torrent.id] = torrent
+                else:
+                    existing._update_fields(torrent)
+                    torrent = existing
+                self.changed.append(torrent)
+            self.removed = [torrent_id for torrent_id in removed if self._torrents.pop(torrent_id, None) is not None]
+        self.last_sync = started
+        return self.torrents
+
+
+class TorrentIndex(object):
+    """ Local id, hash and tracker index over every torrent of a client, so queries by id, hash or
+    tracker can be resolved to a set of ids before fetching. Only `FIELDS_INDEX` are kept, synced
+    through a `TorrentCache` so after the first sync only recently active torrents are transferred.
+
+    >>> index = client.torrent_index()
+    >>> ids = index.tracker_ids("btn")
+    >>> torrents = client.fetch_torrents(FIELDS_PRINT, ids=sorted(ids)) if ids else []
+    """
+
+    def __init__(self, client, max_delta_age=CACHE_MAX_DELTA_AGE):
+        """
+
+        :param client: Transmission RPC Client
+        :type client: TSClient
+        :param max_delta_age: Seconds since the last sync after which a full sync is done instead
+        :type max_delta_age: float
+        """
+        self.cache = TorrentCache(client, FIELDS_INDEX, max_delta_age)
+        # hash -> id, id -> (tracker, hash) and tracker -> ids
+        self._hashes = {}
+        self._entries = {}
+        self._trackers = defaultdict(set)
+        self._rules = None
+
+    def __len__(self):
+        return len(self.cache)
+
+    def __contains__(self, torrent_id):
+        return torrent_id in self._entries
+
+    def __iter__(self):
+        return iter(self.cache)
+
+    def _add(self, torrent):
+        self._remove(torrent.id)
+        tracker = find_tracker(torrent)
+        self._hashes[torrent.hashString.lower()] = torrent.id
+        self._entries[torrent.id] = (tracker, torrent.hashString.lower())
+        self._trackers[tracker].add(torrent.id)
+
+    def _remove(self, torrent_id):
+        entry = self._entries.pop(torrent_id, None)
+        if entry is None:
+            return
+        tracker, hash_string = entry
+        self._hashes.pop(hash_string, None)
+        ids = self._trackers[tracker]
+        ids.discard(torrent_id)
+        if not ids:
+            del self._trackers[tracker]
+
+    def sync(self, full=False):
+        """ Bring the index up to date with the daemon, only torrents which changed are re-indexed
+
+        :param full: Force a full sync
+        :type full: bool
+        :rtype: TorrentIndex
+        """
+        self.cache.sync(full)
+        changed = self.cache.changed
+        if self._rules is not CONFIG['RULES']:
+            # Tracker names come from the rules, re-index everything when they were reloaded
+            self._rules = CONFIG['RULES']
+            changed = self.cache.torrents
+        for torrent_id in self.cache.removed:
+            self._remove(torrent_id)
+        for torrent in changed:
+            self._add(torrent)
+        return self
+
+    def resolve(self, value):
+        """ Resolve a torrent id or hash to the id of a known torrent
+
+        :param value: Torrent id, as an int or string, or info hash
+        :return: Torrent id, None when no torrent matches
+        :rtype: int
+        """
+        if isinstance(value, int):
+            return value if value in self._entries else None
+        value = str(value).strip().lower()
+        if value.isdigit():
+            return self.resolve(int(value))
+        return self._hashes.get(value)
+
+    def resolve_ids(self, values):
+        """ Resolve torrent ids or hashes to the ids of known torrents
+
+        :param values: Torrent ids or hashes
+        :return: The ids in the order given without duplicates, and the values which matched nothing
+        :rtype: (list, list)
+        """
+        ids = []
+        unknown = []
+        for value in values:
+            torrent_id = self.resolve(value)
+            if torrent_id is None:
+                unknown.append(value)
+            elif torrent_id not in ids:
+                ids.append(torrent_id)
+        return ids, unknown
+
+    def tracker_ids(self, text):
+        """ Ids of the torrents whose `find_tracker` name contains text, case insensitive
+
+        :type text: str
+        :rtype: set
+        """
+        text = text.lower()
+        ids = set()
+        for tracker, tracker_ids in self._trackers.items():
+            if text in tracker.lower():
+                ids.update(tracker_ids)
+        return ids
 
 
 def find_torrent_ids(torrents):
@@ -313,16 +1156,29 @@ def make_client(args=None):
     :param args: Optional CLI args passed in.
     :return:
     """
+    host, port, user, password = client_options(args)
+    return TSClient(host, port=port, user=user, password=password)
+
+
+def client_options(args=None):
+    """ Resolve the connection options from the CLI args and config file without connecting
+
+    :param args: Optional CLI args passed in.
+    :return: Tuple of host, port, user and password
+    :rtype: tuple
+    """
     if args is None:
         args = parse_args()
+    if getattr(args, 'profile', False):
+        PROFILER.enable(report_at_exit=True)
     if args.generate:
         generate_config(args.force)
     load_config()
-    return TSClient(
+    return (
         args.host or CONFIG['CLIENT']['host'],
-        port=args.port or CONFIG['CLIENT']['port'],
-        user=args.user or CONFIG['CLIENT']['user'],
-        password=args.password or CONFIG['CLIENT']['password']
+        args.port or CONFIG['CLIENT']['port'],
+        args.user or CONFIG['CLIENT']['user'],
+        args.password or CONFIG['CLIENT']['password']
     )
 
 
@@ -338,6 +1194,17 @@ class Filter(object):
         "finished"
     )
 
+    # torrent-get fields read by each filter
+    fields = {
+        "all": (),
+        "active": ("rateUpload", "rateDownload"),
+        "downloading": ("status",),
+        "seeding": ("status",),
+        "stopped": ("status",),
+        "finished": ("status",),
+        "lifetime": ("addedDate",)
+    }
+
     @staticmethod
     def all(t):
         return t
@@ -374,11 +1241,20 @@ def filter_torrents_by(torrents, key=Filter.all):
     :param torrents:
     :return: []transmissionrpc.Torrent
     """
-    filtered_torrents = []
+    return list(ifilter_torrents_by(torrents, key))
+
+
+def ifilter_torrents_by(torrents, key=Filter.all):
+    """ Lazy version of `filter_torrents_by` which consumes and yields torrents one at a time,
+    eg. from `TSClient.iter_torrents`.
+
+    :param key:
+    :param torrents:
+    :return: Generator of transmissionrpc.Torrent
+    """
     for torrent in torrents:
         if key(torrent):
-            filtered_torrents.append(torrent)
-    return filtered_torrents
+            yield torrent
 
 
 def find_all_trackers(torrents):
@@ -388,6 +1264,72 @@ def find_all_trackers(torrents):
     return trackers
 
 
+class TrackerStats(object):
+    """ Running totals for the torrents of a single tracker, see `aggregate_by_tracker` """
+
+    __slots__ = ("name", "count", "total_size", "rate_upload", "rate_download", "ratio_sum", "ratio_min",
+                 "ratio_max", "ratio_buckets", "errors", "statuses")
+
+    def __init__(self, name):
+        self.name = name
+        self.count = 0
+        self.total_size = 0
+        self.rate_upload = 0
+        self.rate_download = 0
+        self.ratio_sum = 0.0
+        self.ratio_min = None
+        self.ratio_max = None
+        # Torrents with a ratio up to each of the RATIO_BUCKETS bounds, and above the last
+        self.ratio_buckets = [0] * (len(RATIO_BUCKETS) + 1)
+        self.errors = 0
+        self.statuses = {}
+
+    def __repr__(self):
+        return '<TrackerStats {} count={}>'.format(self.name, self.count)
+
+    def add(self, torrent):
+        """ Include a torrent with the `FIELDS_AGGREGATE` fields in the totals """
+        ratio = torrent.ratio
+        self.count += 1
+        self.total_size += torrent.totalSize
+        self.rate_upload += torrent.rateUpload
+        self.rate_download += torrent.rateDownload
+        self.ratio_sum += ratio
+        if self.ratio_min is None or ratio < self.ratio_min:
+            self.ratio_min = ratio
+        if self.ratio_max is None or ratio > self.ratio_max:
+            self.ratio_max = ratio
+        self.ratio_buckets[bisect.bisect_left(RATIO_BUCKETS, ratio)] += 1
+        if torrent.error:
+            self.errors += 1
+        self.statuses[torrent.status] = self.statuses.get(torrent.status, 0) + 1
+
+    @property
+    def ratio_avg(self):
+        return self.ratio_sum / self.count if self.count else 0.0
+
+
+def aggregate_by_tracker(torrents):
+    """ Group torrents by `find_tracker` and total them in a single pass, so the cost grows
+    linearly with the number of torrents regardless of how many trackers there are.
+
+    >>> for name, stats in sorted(aggregate_by_tracker(client.fetch_torrents(FIELDS_AGGREGATE)).items()):
+    >>>     print(name, stats.count, natural_size(stats.total_size), stats.ratio_avg)
+
+    :param torrents: Torrents with the `FIELDS_AGGREGATE` fields, any iterable
+    :return: Tracker name -> `TrackerStats`
+    :rtype: dict
+    """
+    groups = {}
+    for torrent in torrents:
+        tracker = find_tracker(torrent)
+        stats = groups.get(tracker)
+        if stats is None:
+            stats = groups[tracker] = TrackerStats(tracker)
+        stats.add(torrent)
+    return groups
+
+
 class Sort(object):
     """ Defines methods for sorting torrent sequences """
 
@@ -406,6 +1348,22 @@ class Sort(object):
         "activity"
     )
 
+    # torrent-get fields read by each sort key
+    fields = {
+        "id": ("id",),
+        "progress": ("sizeWhenDone", "leftUntilDone"),
+        "name": ("name",),
+        "size": ("totalSize",),
+        "ratio": ("uploadRatio",),
+        "speed": ("rateUpload", "rateDownload"),
+        "speed_up": ("rateUpload",),
+        "speed_down": ("rateDownload",),
+        "status": ("status",),
+        "queue": ("queuePosition",),
+        "age": ("addedDate",),
+        "activity": ("activityDate",)
+    }
+
     @staticmethod
     def activity(t):
         return t.date_active
@@ -416,7 +1374,7 @@ class Sort(object):
 
     @staticmethod
     def queue(t):
-        return t.queue_position
+        return t.queuePosition
 
     @staticmethod
     def status(t):
@@ -459,6 +1417,52 @@ def sort_torrents_by(torrents, key=Sort.name, reverse=False):
     return sorted(torrents, key=key, reverse=reverse)
 
 
+def select_torrents(torrents, sort_by=None, filter_by=None, reverse=False):
+    """ Filter and then sort a torrent list by name, vectorized when numpy is available
+
+    :param torrents: Torrents to select from
+    :param sort_by: Sort key which must exist in `Sort.names` to be valid
+    :type sort_by: str
+    :param filter_by: Filter which must exist in `Filter.names` to be valid
+    :type filter_by: str
+    :param reverse: Reverse the sort order
+    :type reverse: bool
+    :rtype: list
+    """
+    from transmissionscripts.columnar import HAS_NUMPY, TorrentTable, TorrentView
+    if HAS_NUMPY:
+        view = TorrentView(TorrentTable(torrents))
+        if filter_by:
+            view = view.filter(filter_by)
+        if sort_by:
+            view = view.sort(sort_by, reverse=reverse)
+        return list(view)
+    if filter_by:
+        torrents = filter_torrents_by(torrents, key=getattr(Filter, filter_by))
+    if sort_by:
+        torrents = sort_torrents_by(torrents, key=getattr(Sort, sort_by), reverse=reverse)
+    return torrents
+
+
+def top_torrents_by(torrents, count, key=Sort.name, reverse=False):
+    """ Return the first count torrents of `sort_torrents_by` using a bounded heap rather than
+    sorting every torrent, torrents may be any iterable and are consumed in a single pass.
+
+    :param torrents: Torrents to select from
+    :param count: Number of torrents to return
+    :type count: int
+    :param key: Sort key function, see `Sort`
+    :param reverse: Select from the sorted torrents after reversing them, ties included
+    :type reverse: bool
+    :rtype: list
+    """
+    if reverse:
+        # Matches sorting ascending then reversing the list, which puts ties last in first, so rank ties by position too
+        ranked = heapq.nlargest(count, enumerate(torrents), key=lambda pair: (key(pair[1]), pair[0]))
+        return [torrent for _, torrent in ranked]
+    return heapq.nsmallest(count, torrents, key=key)
+
+
 _reset_color = colored("", "white")
 
 
@@ -487,12 +1491,18 @@ def magenta_on_blk(t):
 
 
 def print_torrent_line(torrent, colourize=True):
+    """ Print a single torrent, see `TorrentRenderer` and `print_torrents` for printing many
+
+    :param torrent: Torrent with the `FIELDS_PRINT` fields
+    :param colourize: Colour the name by completion, the rest of the line is coloured regardless
+    :type colourize: bool
+    """
     name = torrent.name
     progress = torrent.progress / 100.0
     print("[{}] [{}] {} {}[{}/{}]{} ra: {} up: {} dn: {} [{}]".format(
         white_on_blk(torrent.id),
         find_tracker(torrent),
-        print_pct(torrent) if colourize else name.decode("latin-1"),
+        print_pct(torrent) if colourize else name,
         white_on_blk(""),
         red_on_blk("{:.0%}".format(progress)) if progress < 1 else green_on_blk("{:.0%}".format(progress)),
         magenta_on_blk(natural_size(torrent.totalSize)),
@@ -526,70 +1536,303 @@ def print_pct(torrent, complete='green', incomplete='red'):
     return t
 
 
-def remove_torrent(client, torrent, reason="None", dry_run=False):
+class TorrentRenderer(object):
+    """ Renders torrents as the lines `print_torrent_line` prints, for printing many torrents at
+    once. The ANSI codes are resolved from termcolor once up front, formatted sizes are cached and
+    lines are written to the stream in chunks rather than a print call each.
+
+    Without colour a line is a plain string join.
+
+        >>> TorrentRenderer().write(torrents)
+    """
+
+    def __init__(self, colourize=None):
+        """
+
+        :param colourize: Include ANSI colour codes, defaults to whether the terminal supports them
+        :type colourize: bool
+        """
+        self.colourize = HAS_COLOUR if colourize is None else colourize
+        self._natural_size = lru_cache(maxsize=RENDER_SIZE_CACHE_SIZE)(natural_size)
+        self._match = get_rule_matcher().match
+        if self.colourize:
+            # Resolve each colour into the codes termcolor wraps text with
+            def codes(color, attrs=None):
+                return tuple(colored("\0", color, attrs=attrs).split("\0"))
+            reset = colored("", "white")
+            self._white = codes("white")
+            self._green, self._red, self._yellow, self._magenta = [
+                (start, end + reset) for start, end in (codes(c) for c in ("green", "red", "yellow", "magenta"))]
+            self._name_done = codes("green", ["bold"])
+            self._name_left = codes("red", ["bold"])
+            self.line = self._line_colour
+        else:
+            self.line = self._line_plain
+
+    def _size(self, value):
+        return self._natural_size(float(value))
+
+    def _rate(self, rate):
+        return self._natural_size(float(rate)) + "/s" if rate else "0.0 kB/s"
+
+    def _line_plain(self, t):
+        return "".join((
+            "[", str(t.id), "] [", self._match(t)["name"], "] ", t.name, " [",
+            "{:.0%}".format(t.progress / 100.0), "/", self._size(t.totalSize), "] ra: ", str(t.ratio),
+            " up: ", self._rate(t.rateUpload), " dn: ", self._rate(t.rateDownload), " [", t.status, "]"
+        ))
+
+    def _line_colour(self, t):
+        name = t.name
+        progress = t.progress / 100.0
+        completed = int(math.floor(len(name) * progress))
+        white, name_done, name_left = self._white, self._name_done, self._name_left
+        pct, ratio = self._red if progress < 1 else self._green, self._red if t.ratio < 1.0 else self._green
+        green, magenta, yellow = self._green, self._magenta, self._yellow
+        up, down = self._rate(t.rateUpload), self._rate(t.rateDownload)
+        return "".join((
+            "[", white[0], str(t.id), white[1], "] [", self._match(t)["name"], "] ",
+            name_done[0], name[0:completed], name_done[1], name_left[0], name[completed:], name_left[1], " ",
+            white[0], white[1], "[", pct[0], "{:.0%}".format(progress), pct[1], "/",
+            magenta[0], self._size(t.totalSize), magenta[1], "]", white[0], white[1],
+            " ra: ", ratio[0], str(t.ratio), ratio[1],
+            " up: ", green[0] + up + green[1] if t.rateUpload else up,
+            " dn: ", green[0] + down + green[1] if t.rateDownload else down,
+            " [", yellow[0], t.status, yellow[1], "]"
+        ))
+
+    def write(self, torrents, stream=None, chunk_lines=RENDER_CHUNK_LINES):
+        """ Render torrents and write them to the stream, chunk_lines lines per write
+
+        :param torrents: Torrents with the `FIELDS_PRINT` fields, any iterable
+        :param stream: Text stream, defaults to stdout
+        :param chunk_lines: Lines buffered per write
+        :type chunk_lines: int
+        :return: Number of torrents written
+        :rtype: int
+        """
+        stream = sys.stdout if stream is None else stream
+        line = self.line
+        count = 0
+        lines = []
+        for torrent in torrents:
+            lines.append(line(torrent))
+            if len(lines) >= chunk_lines:
+                count += len(lines)
+                lines.append("")
+                stream.write("\n".join(lines))
+                lines = []
+        if lines:
+            count += len(lines)
+            lines.append("")
+            stream.write("\n".join(lines))
+        stream.flush()
+        return count
+
+
+def print_torrents(torrents, colourize=None, stream=None):
+    """ Print torrents the same as calling `print_torrent_line` for each, using a `TorrentRenderer`
+
+    :param torrents: Torrents with the `FIELDS_PRINT` fields, any iterable
+    :param colourize: Include ANSI colour codes, defaults to whether the terminal supports them
+    :type colourize: bool
+    :param stream: Text stream, defaults to stdout
+    :return: Number of torrents printed
+    :rtype: int
+    """
+    return TorrentRenderer(colourize).write(torrents, stream)
+
+
+def remove_torrent(client, torrent, reason="None", dry_run=False, batch=None):
     """ Remove a torrent from the client stopping it first if its in a started state.
 
     :param client: Transmission RPC Client
-    :type client: transmissionrpc.Client
+    :type client: TSClient
     :param torrent: Torrent instance to remove
     :type torrent: transmissionrpc.Torrent
     :param reason: Reason for removal
     :type reason: str
     :param dry_run: Do a dry run without actually running any commands
     :type dry_run: bool
-    :return:
+    :param batch: Queue the removal in this batch instead of sending it immediately. The caller commits
+    the batch and logs what was removed with `log_removal`.
+    :type batch: MutationBatch
+    :return: Whether the torrent was removed, or queued for removal
+    :rtype: bool
     """
-    if torrent.status != "stopped":
-        if not dry_run:
-            client.stop_torrent(torrent.hashString)
+    queued = batch is not None
     if not dry_run:
-        client.remove_torrent(torrent.hashString, delete_data=False)
+        if not queued:
+            batch = client.batch()
+        if torrent.status != "stopped":
+            batch.add("stop", torrent)
+        batch.add("remove", torrent)
+        if not queued and batch_failures(batch.commit(), "remove"):
+            return False
+    if not queued:
+        log_removal(torrent, reason)
+    return True
+
+
+def log_removal(torrent, reason):
+    """ Log a torrent which was removed
+
+    :param torrent: Torrent which was removed
+    :type torrent: transmissionrpc.Torrent
+    :param reason: Reason for removal
+    :type reason: str
+    """
     logger.info("Removed: {} {}\nReason: {}".format(torrent.name, torrent.hashString, reason))
 
 
-def remove_unknown_torrents(client):
+class CleanRules(object):
+    """ Rules deciding if a torrent should be removed from the client. Each returns the reason for
+    removal when the torrent qualifies, otherwise None.
+    """
+
+    names = (
+        "unknown",
+        "local_errors",
+        "min_time_ratio"
+    )
+
+    @staticmethod
+    def unknown(t):
+        """ Torrents that the remote tracker is no longer tracking for whatever reason,
+        usually removed by admins.
+        """
+        if t.error >= 2 and t.errorString.lower() in REMOTE_MESSAGES:
+            return "unregistered with tracker: {}".format(t.errorString)
+        return None
+
+    @staticmethod
+    def local_errors(t):
+        """ Torrents that have local filesystem errors, usually caused by moving data
+        outside of transmission.
+        """
+        if t.error == 3:
+            error_string = t.errorString.lower()
+            for errmsg in LOCAL_ERRORS:
+                if errmsg in error_string:
+                    return "local error: {}".format(t.errorString)
+        return None
+
+    @staticmethod
+    def min_time_ratio(t):
+        """ Seeding torrents that have seeded enough time-wise or ratio-wise according to the
+        rule set matching their tracker.
+        """
+        if t.error or t.status != "seeding":
+            return None
+        rule_set = find_rule_set(t)
+        reasons = []
+        if t.ratio > rule_set['max_ratio']:
+            reasons.append("max_ratio threshold passed")
+        if t.secondsSeeding > rule_set['min_time']:
+            reasons.append("min_time threshold passed")
+        return ", ".join(reasons) or None
+
+
+def plan_removals(torrents, rules=CleanRules.names):
+    """ Evaluate every clean rule against each torrent in a single pass, producing a removal plan
+    with at most one entry per torrent no matter how many rules it matched.
+
+    :param torrents: Torrents to evaluate, they must include `FIELDS_CLEAN`
+    :type torrents: transmissionrpc.Torrent[]
+    :param rules: Names of the `CleanRules` to evaluate
+    :type rules: tuple
+    :return: Ordered mapping of hashString to a (torrent, reasons) tuple
+    :rtype: dict
+    """
+    checks = [getattr(CleanRules, rule) for rule in rules]
+    plan = {}
+    for torrent in torrents:
+        reasons = [reason for reason in (check(torrent) for check in checks) if reason]
+        if reasons:
+            plan[torrent.hashString] = (torrent, reasons)
+    return plan
+
+
+def apply_removals(client, plan, dry_run=False):
+    """ Remove every torrent in a removal plan using a single mutation batch
+
+    :param client: Transmission RPC Client
+    :type client: TSClient
+    :param plan: Removal plan as returned by `plan_removals`
+    :type plan: dict
+    :param dry_run: Only log what would be removed
+    :type dry_run: bool
+    :return: The result of each RPC chunk sent
+    :rtype: BatchResult[]
+    """
+    batch = client.batch()
+    for torrent, reasons in plan.values():
+        remove_torrent(client, torrent, "; ".join(reasons), dry_run=dry_run, batch=batch)
+    results = batch.commit()
+    failed = batch_failures(results, "remove")
+    for torrent, reasons in plan.values():
+        if torrent.hashString not in failed:
+            log_removal(torrent, "; ".join(reasons))
+    return results
+
+
+def clean_torrents(client, torrents=None, rules=CleanRules.names, dry_run=False):
+    """ Fetch the torrent list once, evaluate all the requested clean rules against it and
+    remove every torrent which qualified.
+
+    :param client: Transmission RPC Client
+    :type client: TSClient
+    :param torrents: Torrents to check, eg. from a `TorrentCache`. Fetched from the client when None.
+    :type torrents: transmissionrpc.Torrent[]
+    :param rules: Names of the `CleanRules` to evaluate
+    :type rules: tuple
+    :param dry_run: Only log what would be removed
+    :type dry_run: bool
+    :return: The removal plan that was applied
+    :rtype: dict
+    """
+    if torrents is None:
+        torrents = client.fetch_torrents(FIELDS_CLEAN)
+    plan = plan_removals(torrents, rules)
+    apply_removals(client, plan, dry_run=dry_run)
+    return plan
+
+
+def remove_unknown_torrents(client, torrents=None):
     """ Remove torrents that the remote tracker no longer tracking for whatever
     reason, usually removed by admins.
 
     :param client: Transmission RPC Client
-    :type client: transmissionrpc.Client
+    :type client: TSClient
+    :param torrents: Torrents to check, eg. from a `TorrentCache`. Fetched from the client when None.
+    :type torrents: transmissionrpc.Torrent[]
     """
-    for torrent in client.get_torrents():
-        if torrent.error >= 2 and torrent.errorString.lower() in REMOTE_MESSAGES:
-            remove_torrent(client, torrent)
+    clean_torrents(client, torrents, rules=("unknown",))
 
 
-def remove_local_errors(client):
+def remove_local_errors(client, torrents=None):
     """ Removed torrents that have local filesystem errors, usually caused by moving data
     outside of transmission.
 
     :param client: Transmission RPC Client
-    :type client: transmissionrpc.Client
+    :type client: TSClient
+    :param torrents: Torrents to check, eg. from a `TorrentCache`. Fetched from the client when None.
+    :type torrents: transmissionrpc.Torrent[]
     """
-    for torrent in client.get_torrents():
-        if torrent.error == 3:
-            for errmsg in LOCAL_ERRORS:
-                if errmsg in torrent.errorString.lower():
-                    remove_torrent(client, torrent)
-                    break
+    clean_torrents(client, torrents, rules=("local_errors",))
 
 
-def clean_min_time_ratio(client):
+def clean_min_time_ratio(client, torrents=None):
     """ Remove torrents that are either have seeded enough time-wise or ratio-wise.
     The correct rule set is determined by checking the torrent announce url and
     matching it to a specific rule set defined above.
 
     :param client: Transmission RPC Client
-    :type client: transmissionrpc.Client
+    :type client: TSClient
+    :param torrents: Torrents to check, eg. from a `TorrentCache`. Fetched from the client when None.
+    :type torrents: transmissionrpc.Torrent[]
     """
-    for torrent in client.get_torrents():
-        if torrent.error or torrent.status != "seeding":
-            continue
-        rule_set = find_rule_set(torrent)
-        if torrent.ratio > rule_set['max_ratio']:
-            remove_torrent(client, torrent, "max_ratio threshold passed", dry_run=False)
-        if torrent.secondsSeeding > rule_set['min_time']:
-            remove_torrent(client, torrent, "min_time threshold passed", dry_run=False)
+    clean_torrents(client, torrents, rules=("min_time_ratio",))
 
 
 _SUFFIXES = {
@@ -639,13 +1882,44 @@ __all__ = (
     "colored",
     "natural_size",
     "find_all_trackers",
+    "aggregate_by_tracker",
+    "TrackerStats",
     "find_torrent_ids",
     "make_client",
+    "client_options",
+    "make_fields",
+    "TorrentCache",
+    "TorrentIndex",
+    "MutationBatch",
+    "CleanRules",
+    "plan_removals",
+    "apply_removals",
+    "log_removal",
+    "batch_failures",
+    "clean_torrents",
+    "BatchResult",
     "make_arg_parser",
     "print_torrent_line",
+    "print_torrents",
+    "TorrentRenderer",
     "Filter",
     "Sort",
     "filter_torrents_by",
+    "ifilter_torrents_by",
     "sort_torrents_by",
-    "find_tracker"
+    "select_torrents",
+    "top_torrents_by",
+    "find_tracker",
+    "find_rule_set",
+    "get_rule_matcher",
+    "RuleMatcher",
+    "TorrentRecord",
+    "FIELDS_IDENTITY",
+    "FIELDS_TRACKER",
+    "FIELDS_PRINT",
+    "FIELDS_CLEAN",
+    "FIELDS_AGGREGATE",
+    "FIELDS_INDEX",
+    "INDEX_FETCH_SHARE",
+    "RATIO_BUCKETS"
 )
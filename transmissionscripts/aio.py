@@ -0,0 +1,417 @@
+"""
+Asyncio based transmission RPC client which keeps a pool of keep-alive connections open to the daemon,
+allowing many requests and many daemons to be handled concurrently from a single thread.
+
+Running the same operation against several instances at once::
+
+    >>> clients = [AsyncTSClient(host, port) for host, port in (("seedbox1", 9091), ("seedbox2", 9091))]
+    >>> results = run_fan_out(clients, "get_torrents_by", sort_by="ratio", fields=FIELDS_PRINT)
+    >>> for url, torrents in results.items():
+    >>>     print(url, len(torrents))
+"""
+import asyncio
+import base64
+from json import dumps, loads
+
+import transmissionrpc
+from transmissionrpc.utils import make_rpc_name, argument_value_convert
+
+from transmissionscripts.records import make_records
+from transmissionscripts import CONFIG, BATCH_SIZE, FIELDS_CLEAN, BatchResult, CleanRules, logger, make_fields, \
+    make_limit_args, make_enabled_limit_args, make_peer_limit_args, filter_torrents_by, sort_torrents_by, \
+    plan_removals, Filter, Sort
+
+# Default maximum number of open connections per client
+POOL_SIZE = 4
+
+RPC_PATH = "/transmission/rpc"
+
+# Methods without side effects, which are safe to send again when the connection drops before a response
+READ_ONLY_METHODS = frozenset(("session-get", "session-stats", "torrent-get", "free-space", "port-test"))
+
+
+class _Connection(object):
+    __slots__ = ("reader", "writer")
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncTSClient(object):
+    """ Asyncio transmission RPC client using a pool of keep-alive HTTP connections.
+
+    The X-Transmission-Session-Id handshake is performed once and the session id is shared by every
+    connection in the pool, it is only repeated if the daemon rotates it. The pool belongs to the event
+    loop it was created on, a client used from a new loop, eg. a second `asyncio.run`, starts a new one.
+    """
+
+    def __init__(self, address='localhost', port=transmissionrpc.DEFAULT_PORT, user=None, password=None,
+                 pool_size=POOL_SIZE, timeout=transmissionrpc.DEFAULT_TIMEOUT):
+        """
+
+        :param address: Transmission RPC host
+        :type address: str
+        :param port: Transmission RPC port
+        :type port: int
+        :param user: Optional username
+        :param password: Optional password
+        :param pool_size: Maximum number of concurrent connections to the daemon
+        :type pool_size: int
+        :param timeout: Timeout in seconds for each request
+        :type timeout: float
+        """
+        self.host = address
+        self.port = port
+        self.url = "http://{}:{}{}".format(address, port, RPC_PATH)
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.session_id = None
+        self.rpc_version = None
+        self._auth = None
+        if user and password:
+            token = base64.b64encode("{}:{}".format(user, password).encode("utf-8")).decode("ascii")
+            self._auth = "Basic {}".format(token)
+        self._sequence = 0
+        self._idle = []
+        self._slots = None
+        self._loop = None
+
+    def __repr__(self):
+        return "<AsyncTSClient {}>".format(self.url)
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    async def connect(self):
+        """ Fetch the session to determine the RPC version of the daemon, this is done automatically
+        by the first request when not called explicitly.
+        """
+        if self.rpc_version is None:
+            session = await self._request_arguments("session-get", ensure_version=False)
+            self.rpc_version = session.get("rpc-version", 2)
+
+    def close(self):
+        """ Close all idle connections in the pool """
+        while self._idle:
+            try:
+                self._idle.pop().close()
+            except RuntimeError:
+                # Opened on an event loop which has since been closed
+                pass
+
+    async def _acquire(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Connections and the semaphore of a previous event loop can't be used from this one
+            self.close()
+            self._slots = asyncio.Semaphore(self.pool_size)
+            self._loop = loop
+        await self._slots.acquire()
+        if self._idle:
+            return self._idle.pop()
+        try:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        except Exception:
+            self._slots.release()
+            raise
+        return _Connection(reader, writer)
+
+    def _release(self, conn, reusable):
+        if reusable:
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    def _build_request(self, body):
+        headers = [
+            "POST {} HTTP/1.1".format(RPC_PATH),
+            "Host: {}:{}".format(self.host, self.port),
+            "Content-Type: application/json",
+            "Content-Length: {}".format(len(body)),
+            "Connection: keep-alive"
+        ]
+        if self.session_id:
+            headers.append("X-Transmission-Session-Id: {}".format(self.session_id))
+        if self._auth:
+            headers.append("Authorization: {}".format(self._auth))
+        return ("\r\n".join(headers) + "\r\n\r\n").encode("latin-1") + body
+
+    @staticmethod
+    async def _read_response(reader):
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by server")
+        parts = status_line.decode("latin-1").split(None, 2)
+        version, status = parts[0], int(parts[1])
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = version != "HTTP/1.0" and headers.get("connection", "").lower() != "close"
+        if "content-length" in headers:
+            body = await reader.readexactly(int(headers["content-length"]))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readline()
+            body = b"".join(chunks)
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return status, headers, body, keep_alive
+
+    async def _exchange(self, body, read_only=False):
+        """ Send a request body over a pooled connection, negotiating the session id if required
+
+        :param read_only: Whether the request has no side effects, so it may be sent again if the
+        connection drops after it was written
+        :type read_only: bool
+        :return: Response body
+        :rtype: bytes
+        """
+        # A stale keep-alive connection and a session id change are each retried once. Requests which
+        # change something are only retried when the connection failed before they were written, as
+        # the daemon may have run them without getting to answer.
+        retried_connection = retried_session = False
+        while True:
+            try:
+                conn = await self._acquire()
+            except OSError as err:
+                raise transmissionrpc.TransmissionError("Failed to connect to {}.".format(self.url), err)
+            reusable = written = False
+            try:
+                conn.writer.write(self._build_request(body))
+                await conn.writer.drain()
+                written = True
+                status, headers, data, reusable = await self._read_response(conn.reader)
+            except (ConnectionError, asyncio.IncompleteReadError) as err:
+                if retried_connection or (written and not read_only):
+                    raise transmissionrpc.TransmissionError("Request failed.", err)
+                retried_connection = True
+                continue
+            finally:
+                self._release(conn, reusable)
+            if status == 409:
+                if retried_session:
+                    raise transmissionrpc.TransmissionError("Session ID negotiation failed.")
+                retried_session = True
+                self.session_id = headers.get("x-transmission-session-id")
+                if not self.session_id:
+                    raise transmissionrpc.TransmissionError("Unknown conflict.")
+                continue
+            if status != 200:
+                raise transmissionrpc.TransmissionError("Request failed with HTTP status {}.".format(status))
+            return data
+
+    async def _request_arguments(self, method, arguments=None, ensure_version=True):
+        """ Send a RPC request returning the response arguments
+
+        :param method: RPC method name
+        :type method: str
+        :param arguments: RPC arguments
+        :type arguments: dict
+        :return: Response arguments
+        :rtype: dict
+        """
+        if ensure_version:
+            await self.connect()
+        body = dumps({"tag": self._sequence, "method": method, "arguments": arguments or {}}).encode("utf-8")
+        self._sequence += 1
+        response = await asyncio.wait_for(self._exchange(body, method in READ_ONLY_METHODS), self.timeout)
+        data = loads(response.decode("utf-8"))
+        if data.get("result") != "success":
+            raise transmissionrpc.TransmissionError('Query failed with result "{}".'.format(data.get("result")))
+        return data["arguments"]
+
+    async def get_session(self):
+        """ Fetch the session configuration
+
+        :rtype: dict
+        """
+        return await self._request_arguments("session-get")
+
+    async def session_stats(self):
+        """ Fetch the session statistics
+
+        :rtype: dict
+        """
+        return await self._request_arguments("session-stats")
+
+    async def set_session(self, **kwargs):
+        await self.connect()
+        args = {}
+        for key, value in kwargs.items():
+            arg, val = argument_value_convert("session-set", make_rpc_name(key), value, self.rpc_version)
+            args[arg] = val
+        if args:
+            await self._request_arguments("session-set", args)
+
+    async def set_limits(self, speed_up=None, speed_dn=None, alt=False):
+        await self.set_session(**make_limit_args(speed_up, speed_dn, alt))
+
+    async def set_enabled_limits(self, status, alt=False):
+        await self.set_session(**make_enabled_limit_args(status, alt))
+
+    async def set_peer_limit(self, limits, is_global=True):
+        await self.set_session(**make_peer_limit_args(limits, is_global))
+
+    async def fetch_torrents(self, fields=None, ids=None):
+        """ Fetch torrents requesting only the fields given, see `TSClient.fetch_torrents`
+
+        :param fields: torrent-get field names required, None fetches every field
+        :type fields: list
+        :param ids: Optional list of torrent ids or hashes
+        :type ids: list
+        :return: Torrent list, compact records unless every field was requested
+        :rtype: TorrentRecord[]
+        """
+        await self.connect()
+        if fields is None:
+            arguments = {"fields": transmissionrpc.utils.get_arguments("torrent-get", self.rpc_version)}
+        else:
+            arguments = {"fields": make_fields(fields)}
+        if ids is not None:
+            arguments["ids"] = ids
+        data = await self._request_arguments("torrent-get", arguments)
+        if fields is None:
+            return [transmissionrpc.Torrent(self, item) for item in data.get("torrents", [])]
+        return list(make_records(data.get("torrents", []), self.rpc_version))
+
+    async def get_torrents_by(self, sort_by=None, filter_by=None, reverse=False, fields=None):
+        """ Fetch, filter and sort torrents, see `TSClient.get_torrents_by`
+
+        :rtype: transmissionrpc.Torrent[]
+        """
+        if fields is not None:
+            fields = make_fields(Filter.fields.get(filter_by), Sort.fields.get(sort_by), fields)
+        torrents = await self.fetch_torrents(fields)
+        if filter_by:
+            torrents = filter_torrents_by(torrents, key=getattr(Filter, filter_by))
+        if sort_by:
+            torrents = sort_torrents_by(torrents, key=getattr(Sort, sort_by), reverse=reverse)
+        return torrents
+
+    async def mutate(self, action, ids, chunk_size=None):
+        """ Apply a `MutationBatch` action to a list of torrent ids or hashes in chunks. A failed
+        chunk does not stop the remaining chunks from being sent.
+
+        :param action: One of `MutationBatch.actions`
+        :type action: str
+        :param ids: Torrent ids or hashes
+        :type ids: list
+        :param chunk_size: Torrents per RPC call, defaults to the configured batch_size
+        :type chunk_size: int
+        :return: The result of each chunk sent
+        :rtype: BatchResult[]
+        """
+        if chunk_size is None:
+            chunk_size = CONFIG['CLIENT'].get('batch_size', BATCH_SIZE)
+        if action in ("remove", "delete"):
+            method, extra = "torrent-remove", {"delete-local-data": action == "delete"}
+        elif action in ("stop", "start", "verify"):
+            method, extra = "torrent-{}".format(action), {}
+        else:
+            raise ValueError("Unknown batch action: {}".format(action))
+        ids = list(ids)
+        results = []
+        for offset in range(0, len(ids), chunk_size):
+            chunk = ids[offset:offset + chunk_size]
+            try:
+                await self._request_arguments(method, dict(extra, ids=chunk))
+            except transmissionrpc.TransmissionError as err:
+                logger.error("Failed to {} {} torrents: {}".format(action, len(chunk), err))
+                results.append(BatchResult(action, chunk, err))
+            else:
+                results.append(BatchResult(action, chunk, None))
+        return results
+
+    async def clean_torrents(self, torrents=None, rules=CleanRules.names, dry_run=False):
+        """ Evaluate the clean rules and remove every torrent which qualified, see `clean_torrents`
+
+        :return: The removal plan that was applied
+        :rtype: dict
+        """
+        if torrents is None:
+            torrents = await self.fetch_torrents(FIELDS_CLEAN)
+        plan = plan_removals(torrents, rules)
+        removed = list(plan)
+        if not dry_run:
+            await self.mutate("stop", [t.hashString for t, _ in plan.values() if t.status != "stopped"])
+            results = await self.mutate("remove", removed)
+            removed = [torrent_hash for result in results if not result.error for torrent_hash in result.ids]
+        for torrent_hash in removed:
+            torrent, reasons = plan[torrent_hash]
+            logger.info("Removed: {} {}\nReason: {}".format(torrent.name, torrent.hashString, "; ".join(reasons)))
+        return plan
+
+
+async def fan_out(clients, method, *args, **kwargs):
+    """ Call the same `AsyncTSClient` method against every client concurrently. A failure on one
+    client does not affect the others, its exception is returned as the result instead.
+
+    :param clients: Clients to run against
+    :type clients: AsyncTSClient[]
+    :param method: Name of the `AsyncTSClient` method to call
+    :type method: str
+    :return: Mapping of client url to result or exception
+    :rtype: dict
+    """
+    results = await asyncio.gather(
+        *[getattr(client, method)(*args, **kwargs) for client in clients], return_exceptions=True)
+    return {client.url: result for client, result in zip(clients, results)}
+
+
+def run_fan_out(clients, method, *args, **kwargs):
+    """ Synchronous wrapper around `fan_out` which closes the client connections when done
+
+    :return: Mapping of client url to result or exception
+    :rtype: dict
+    """
+    async def _run():
+        try:
+            return await fan_out(clients, method, *args, **kwargs)
+        finally:
+            for client in clients:
+                client.close()
+    return asyncio.run(_run())
+
+
+def make_async_clients(hosts, user=None, password=None, pool_size=POOL_SIZE):
+    """ Create a client for each "host" or "host:port" string
+
+    :param hosts: Hosts to connect to
+    :type hosts: list
+    :rtype: AsyncTSClient[]
+    """
+    clients = []
+    for host in hosts:
+        address, _, port = host.rpartition(":") if ":" in host else (host, None, None)
+        clients.append(AsyncTSClient(address, int(port) if port else transmissionrpc.DEFAULT_PORT,
+                                     user=user, password=password, pool_size=pool_size))
+    return clients
+
+
+__all__ = (
+    "AsyncTSClient",
+    "fan_out",
+    "run_fan_out",
+    "make_async_clients"
+)
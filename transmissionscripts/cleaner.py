@@ -0,0 +1,242 @@
+"""
+Long running cleaner, run by `ts_clean.py --daemon`, removing torrents close to the moment they
+qualify under the `CleanRules` instead of rescanning every torrent from cron.
+
+Each torrent is scheduled in a priority queue at the time it is predicted to qualify:
+
+- Torrents which qualify already, eg. unregistered or with local errors, are due straight away.
+- Seeding torrents are due when `secondsSeeding` passes the `min_time` of their rule set, or
+  sooner when uploading at the current `rateUpload` takes their ratio past `max_ratio`.
+- Anything else, eg. downloading or stopped torrents, is not scheduled until it changes.
+
+A `TorrentCache` is synced from the recently-active delta every poll interval and only torrents
+which changed are rescheduled, so changes in state or upload rate update their predictions. Between
+polls the cleaner sleeps until the next torrent is due. Due torrents are fetched again by id and
+checked against the rules before removal, a prediction which no longer holds is rescheduled. A removal
+which fails is retried after `CLEANER_RETRY_DELAY` for the same reasons, as the torrent may have been
+stopped and no longer match the rules.
+
+    >>> cleaner = CleanerDaemon(make_client(args), dry_run=True)
+    >>> cleaner.run()
+"""
+import heapq
+import threading
+import time
+
+from transmissionscripts import CleanRules, FIELDS_CLEAN, TorrentCache, apply_removals, find_rule_set, logger, \
+    make_fields, plan_removals
+
+# torrent-get fields read when predicting when torrents qualify
+FIELDS_CLEANER = make_fields(FIELDS_CLEAN, ('rateUpload', 'uploadedEver', 'downloadedEver', 'sizeWhenDone'))
+
+# Seconds between delta syncs with the daemon, below the 60 seconds the recently-active list covers
+CLEANER_POLL_INTERVAL = 30.0
+
+# Seconds between full syncs, catching changes the recently-active list does not report
+CLEANER_FULL_SYNC_INTERVAL = 3600.0
+
+# Seconds added to predicted times, the rules require thresholds to be passed rather than reached
+CLEANER_MARGIN = 1.0
+
+# Shortest delay before checking a torrent again whose prediction did not hold
+CLEANER_RETRY_DELAY = 5.0
+
+
+def predict_eligible(torrent, now, rules=CleanRules.names):
+    """ Predict when a torrent will qualify for removal under the rules
+
+    :param torrent: Torrent with the `FIELDS_CLEANER` fields
+    :param now: Unix time the torrent's fields were fetched at
+    :type now: float
+    :param rules: Names of the `CleanRules` evaluated
+    :type rules: tuple
+    :return: Unix time the torrent is due, None when it will not qualify without changing
+    :rtype: float
+    """
+    for rule in rules:
+        if getattr(CleanRules, rule)(torrent):
+            return now
+    if "min_time_ratio" not in rules or torrent.error or torrent.status != "seeding":
+        return None
+    rule_set = find_rule_set(torrent)
+    due = now + rule_set['min_time'] - torrent.secondsSeeding + CLEANER_MARGIN
+    if torrent.rateUpload > 0:
+        # Transmission divides by the bytes downloaded, or the size when the data was added rather than downloaded
+        downloaded = torrent.downloadedEver or torrent.sizeWhenDone
+        remaining = rule_set['max_ratio'] * downloaded - torrent.uploadedEver
+        due = min(due, now + max(0.0, remaining) / float(torrent.rateUpload) + CLEANER_MARGIN)
+    return due
+
+
+class CleanerDaemon(object):
+    """ Priority queue of torrents keyed on when they qualify for removal, see the module docs """
+
+    def __init__(self, client, rules=CleanRules.names, dry_run=False, poll_interval=CLEANER_POLL_INTERVAL,
+                 full_sync_interval=CLEANER_FULL_SYNC_INTERVAL):
+        """
+
+        :param client: Transmission RPC Client
+        :type client: transmissionscripts.TSClient
+        :param rules: Names of the `CleanRules` to evaluate
+        :type rules: tuple
+        :param dry_run: Only log what would be removed
+        :type dry_run: bool
+        :param poll_interval: Seconds between delta syncs
+        :type poll_interval: float
+        :param full_sync_interval: Seconds between full syncs
+        :type full_sync_interval: float
+        """
+        self.client = client
+        self.rules = tuple(rules)
+        self.dry_run = dry_run
+        self.poll_interval = poll_interval
+        self.full_sync_interval = full_sync_interval
+        self.cache = TorrentCache(client, FIELDS_CLEANER)
+        self.stopped = threading.Event()
+        self.next_sync = 0.0
+        self.last_full_sync = None
+        # Heap of (due, id) entries, an entry is stale unless it matches the id's time in _due
+        self._queue = []
+        self._due = {}
+        # Torrents a dry run reported, they are never removed so are not checked again
+        self._reported = set()
+        # id -> reasons of torrents whose removal failed, they may have been stopped so no longer match the rules
+        self._failed = {}
+        self.syncs = 0
+        self.checks = 0
+        self.removed = 0
+
+    def __len__(self):
+        return len(self._due)
+
+    def stop(self):
+        self.stopped.set()
+
+    def schedule(self, torrent, now, not_before=None):
+        """ Queue a torrent at its predicted time, replacing any earlier prediction
+
+        :param now: Unix time the torrent's fields were fetched at
+        :type now: float
+        :param not_before: Earliest time to queue the torrent at
+        :type not_before: float
+        """
+        if torrent.id in self._reported:
+            return
+        due = now if torrent.id in self._failed else predict_eligible(torrent, now, self.rules)
+        if due is None:
+            self._due.pop(torrent.id, None)
+            return
+        if not_before is not None:
+            due = max(due, not_before)
+        self._due[torrent.id] = due
+        heapq.heappush(self._queue, (due, torrent.id))
+
+    def next_due(self):
+        """ Unix time the earliest scheduled torrent is due, None when none are
+
+        :rtype: float
+        """
+        while self._queue and self._due.get(self._queue[0][1]) != self._queue[0][0]:
+            heapq.heappop(self._queue)
+        return self._queue[0][0] if self._queue else None
+
+    def pop_due(self, now):
+        """ Remove the torrents due by now from the queue
+
+        :return: Their ids
+        :rtype: list
+        """
+        ids = []
+        while self.next_due() is not None and self._queue[0][0] <= now:
+            _, torrent_id = heapq.heappop(self._queue)
+            del self._due[torrent_id]
+            ids.append(torrent_id)
+        return ids
+
+    def sync(self, now):
+        """ Sync the torrent cache, rescheduling the torrents which changed """
+        full = self.last_full_sync is None or now - self.last_full_sync >= self.full_sync_interval
+        self.cache.sync(full)
+        if full:
+            self.last_full_sync = now
+        self.syncs += 1
+        for torrent_id in self.cache.removed:
+            self._due.pop(torrent_id, None)
+            self._reported.discard(torrent_id)
+            self._failed.pop(torrent_id, None)
+        for torrent in self.cache.changed:
+            self.schedule(torrent, now)
+        self.next_sync = now + self.poll_interval
+
+    def check(self, ids, now):
+        """ Fetch due torrents again, removing those which qualify and rescheduling the rest
+
+        :param ids: Ids of the due torrents
+        :type ids: list
+        :return: The removal plan, torrents whose removal failed are rescheduled
+        :rtype: dict
+        """
+        if not ids:
+            # No ids would fetch every torrent
+            return {}
+        self.checks += 1
+        torrents = self.client.fetch_torrents(FIELDS_CLEANER, ids=ids)
+        plan = plan_removals(torrents, self.rules)
+        for torrent in torrents:
+            if torrent.id in self._failed and torrent.hashString not in plan:
+                plan[torrent.hashString] = (torrent, self._failed[torrent.id])
+        failed = set()
+        if plan:
+            for result in apply_removals(self.client, plan, dry_run=self.dry_run):
+                if result.error and result.action == "remove":
+                    failed.update(result.ids)
+            self.removed += len(plan) - len(failed)
+        for torrent in torrents:
+            if torrent.hashString in failed:
+                self._failed[torrent.id] = plan[torrent.hashString][1]
+            elif torrent.hashString in plan:
+                self._failed.pop(torrent.id, None)
+                if self.dry_run:
+                    self._reported.add(torrent.id)
+                continue
+            cached = self.cache.get(torrent.id)
+            if cached is not None:
+                cached._update_fields(torrent)
+            # The prediction was early or the removal failed, don't check again before the daemon has moved on
+            self.schedule(torrent, now, now + CLEANER_RETRY_DELAY)
+        return plan
+
+    def step(self):
+        """ Run whatever is due now, a sync and or a check of due torrents
+
+        :return: Seconds until something is next due
+        :rtype: float
+        """
+        now = time.time()
+        if now >= self.next_sync:
+            self.sync(now)
+        ids = self.pop_due(now)
+        if ids:
+            self.check(ids, now)
+        due = self.next_due()
+        wake = self.next_sync if due is None else min(due, self.next_sync)
+        return max(0.0, wake - time.time())
+
+    def run(self):
+        """ Run until stopped, sleeping until the next torrent is due or the next sync """
+        logger.info("Cleaner started, syncing every {}s{}".format(self.poll_interval, " (dry run)" if self.dry_run else ""))
+        while not self.stopped.is_set():
+            try:
+                delay = self.step()
+            except Exception as err:
+                logger.error("Cleaner step failed: {}".format(err))
+                delay = self.poll_interval
+            self.stopped.wait(delay)
+
+
+__all__ = (
+    "CLEANER_POLL_INTERVAL",
+    "FIELDS_CLEANER",
+    "CleanerDaemon",
+    "predict_eligible"
+)
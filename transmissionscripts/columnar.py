@@ -0,0 +1,281 @@
+"""
+NumPy backed columnar engine for filtering and sorting large torrent lists. The torrent list is
+converted into column arrays once, filters then become boolean masks and sorts argsort calls over
+an index array, so a whole pipeline runs as vectorized operations instead of a Python call per
+torrent per stage.
+
+NumPy is optional, check `HAS_NUMPY` and fall back to `filter_torrents_by` / `sort_torrents_by`
+when it is not installed.
+
+    >>> view = TorrentView(TorrentTable(torrents)).filter("seeding").sort("ratio").limit(20)
+    >>> for torrent in view:
+    >>>     print_torrent_line(torrent)
+"""
+from bisect import bisect_left
+
+try:
+    # noinspection PyPackageRequirements
+    import numpy as np
+except ImportError:
+    np = None
+
+from transmissionscripts import find_tracker
+from transmissionscripts.query import NAME_PREDICATES, Predicate, make_name_matcher
+
+HAS_NUMPY = np is not None
+
+# Numeric columns: name -> (getter, dtype)
+NUMERIC_COLUMNS = {
+    "id": (lambda t: t.id, "i8"),
+    "progress": (lambda t: t.progress, "f8"),
+    "totalSize": (lambda t: t.totalSize, "i8"),
+    "ratio": (lambda t: t.ratio, "f8"),
+    "rateUpload": (lambda t: t.rateUpload, "f8"),
+    "rateDownload": (lambda t: t.rateDownload, "f8"),
+    "queuePosition": (lambda t: t.queuePosition, "i8"),
+    "addedDate": (lambda t: t.addedDate, "i8"),
+    "activityDate": (lambda t: t.activityDate, "i8"),
+}
+
+# Categorical columns, stored as codes ranked by the sorted unique values: name -> getter
+CATEGORICAL_COLUMNS = {
+    "status": lambda t: t.status,
+    "name": lambda t: t.name.lower(),
+    "tracker": find_tracker,
+}
+
+
+class TorrentTable(object):
+    """ Column arrays over a fixed torrent list. Columns are only built the first time they are
+    used, so a pipeline only pays for the columns it reads.
+    """
+
+    def __init__(self, torrents):
+        """
+
+        :param torrents: Torrents to index, any iterable
+        """
+        if not HAS_NUMPY:
+            raise RuntimeError("numpy is required for the columnar engine")
+        self.torrents = torrents if isinstance(torrents, list) else list(torrents)
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.torrents)
+
+    def column(self, name):
+        """ Return a numeric column array
+
+        :param name: Key of `NUMERIC_COLUMNS`
+        :type name: str
+        :rtype: numpy.ndarray
+        """
+        column = self._columns.get(name)
+        if column is None:
+            getter, dtype = NUMERIC_COLUMNS[name]
+            column = np.fromiter((getter(t) for t in self.torrents), dtype, len(self.torrents))
+            self._columns[name] = column
+        return column
+
+    def categorical(self, name):
+        """ Return a categorical column as codes along with the sorted unique values they index,
+        comparing codes is equivalent to comparing the values.
+
+        :param name: Key of `CATEGORICAL_COLUMNS`
+        :type name: str
+        :rtype: (numpy.ndarray, list)
+        """
+        column = self._columns.get(name)
+        if column is None:
+            values = np.array([CATEGORICAL_COLUMNS[name](t) for t in self.torrents], dtype=str)
+            uniques, codes = np.unique(values, return_inverse=True)
+            column = self._columns[name] = (codes, uniques.tolist())
+        return column
+
+    def equals(self, name, value):
+        """ Boolean mask of rows where a categorical column equals value """
+        codes, uniques = self.categorical(name)
+        position = bisect_left(uniques, value)
+        if position == len(uniques) or uniques[position] != value:
+            return np.zeros(len(codes), dtype=bool)
+        return codes == position
+
+    def filter_mask(self, name):
+        """ Boolean mask equivalent to the `Filter` of the same name
+
+        :param name: One of `Filter.names`
+        :type name: str
+        :rtype: numpy.ndarray
+        """
+        if name == "all":
+            return np.ones(len(self.torrents), dtype=bool)
+        elif name == "active":
+            return (self.column("rateUpload") > 0) | (self.column("rateDownload") > 0)
+        return self.equals("status", name)
+
+    def sort_key(self, name):
+        """ Numeric key array ordered the same as the `Sort` of the same name
+
+        :param name: One of `Sort.names`
+        :type name: str
+        :rtype: numpy.ndarray
+        """
+        if name in ("name", "status"):
+            return self.categorical(name)[0]
+        elif name == "size":
+            return -self.column("totalSize")
+        elif name == "speed":
+            return self.column("rateUpload") + self.column("rateDownload")
+        return self.column({
+            "id": "id",
+            "progress": "progress",
+            "ratio": "ratio",
+            "speed_up": "rateUpload",
+            "speed_down": "rateDownload",
+            "queue": "queuePosition",
+            "age": "addedDate",
+            "activity": "activityDate",
+        }[name])
+
+    def name_prefix_mask(self, prefix):
+        """ Boolean mask of rows whose lower cased name starts with prefix. Since the unique names
+        are sorted, the matches form a single contiguous range of codes.
+        """
+        codes, uniques = self.categorical("name")
+        low = bisect_left(uniques, prefix)
+        high = low
+        while high < len(uniques) and uniques[high].startswith(prefix):
+            high += 1
+        return (codes >= low) & (codes < high)
+
+    def name_match_mask(self, predicate):
+        """ Boolean mask of rows whose name matches a `transmissionscripts.query.NAME_PREDICATES`
+        predicate, each distinct name is only tested once.
+        """
+        codes, uniques = self.categorical("name")
+        match = make_name_matcher(predicate)
+        return np.isin(codes, [i for i, name in enumerate(uniques) if match(name)])
+
+    def ids_mask(self, ids):
+        """ Boolean mask of rows whose torrent id is in ids """
+        return np.isin(self.column("id"), list(ids))
+
+    def tracker_mask(self, substring):
+        """ Boolean mask of rows whose tracker name contains substring, case insensitive """
+        codes, uniques = self.categorical("tracker")
+        substring = substring.lower()
+        matched = [i for i, tracker in enumerate(uniques) if substring in tracker.lower()]
+        return np.isin(codes, matched)
+
+    def added_mask(self, before, timestamp):
+        """ Boolean mask of rows added before (or after) a unix timestamp """
+        added = self.column("addedDate")
+        return added < timestamp if before else added > timestamp
+
+    def predicate_mask(self, name, arg):
+        """ Boolean mask equivalent to a `transmissionscripts.query.Predicate`
+
+        :param name: A `Filter` name, one of the `NAME_PREDICATES`, "ids", "tracker" or "added"
+        :type name: str
+        :param arg: Predicate argument
+        :rtype: numpy.ndarray
+        """
+        if name == "name":
+            return self.name_prefix_mask(arg)
+        elif name in NAME_PREDICATES:
+            return self.name_match_mask(Predicate(name, arg))
+        elif name == "ids":
+            return self.ids_mask(arg)
+        elif name == "tracker":
+            return self.tracker_mask(arg)
+        elif name == "added":
+            older, date = arg
+            return self.added_mask(older, date.timestamp())
+        return self.filter_mask(name)
+
+
+class TorrentView(object):
+    """ An ordered selection of rows in a `TorrentTable`. Operations return a new view over an
+    index array, the underlying torrents are never copied.
+    """
+
+    def __init__(self, table, index=None):
+        """
+
+        :param table: Table the view selects from
+        :type table: TorrentTable
+        :param index: Row indexes in view order, all rows when None
+        :type index: numpy.ndarray
+        """
+        self.table = table
+        self.index = np.arange(len(table)) if index is None else index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        torrents = self.table.torrents
+        for i in self.index:
+            yield torrents[i]
+
+    def _mask(self, mask):
+        return TorrentView(self.table, self.index[mask[self.index]])
+
+    def filter(self, name):
+        return self._mask(self.table.filter_mask(name))
+
+    def name_prefix(self, prefix):
+        return self._mask(self.table.name_prefix_mask(prefix))
+
+    def tracker(self, substring):
+        return self._mask(self.table.tracker_mask(substring))
+
+    def added(self, before, timestamp):
+        return self._mask(self.table.added_mask(before, timestamp))
+
+    def where(self, predicates):
+        """ Select rows matching all of the `transmissionscripts.query.Predicate` in one pass """
+        mask = None
+        for name, arg in predicates:
+            predicate_mask = self.table.predicate_mask(name, arg)
+            mask = predicate_mask if mask is None else mask & predicate_mask
+        return self if mask is None else self._mask(mask)
+
+    def sort(self, name, reverse=False):
+        """ Stable sort matching `sort_torrents_by`, including the order of ties when reversed """
+        keys = self.table.sort_key(name)[self.index]
+        order = np.argsort(-keys if reverse else keys, kind="stable")
+        return TorrentView(self.table, self.index[order])
+
+    def top(self, name, count, reverse=False):
+        """ The first count rows of `sort`, optionally followed by `reverse`. Only the rows whose key
+        is within the bound found by a partition are sorted, rather than the whole view.
+        """
+        if count >= len(self.index):
+            view = self.sort(name)
+            return view.reverse() if reverse else view
+        keys = self.table.sort_key(name)[self.index]
+        if reverse:
+            bound = np.partition(keys, len(keys) - count)[len(keys) - count]
+            candidates = np.flatnonzero(keys >= bound)
+        else:
+            bound = np.partition(keys, count - 1)[count - 1]
+            candidates = np.flatnonzero(keys <= bound)
+        # Candidates include every tie at the bound, so a stable sort of them orders ties correctly
+        order = candidates[np.argsort(keys[candidates], kind="stable")]
+        if reverse:
+            order = order[::-1]
+        return TorrentView(self.table, self.index[order[0:count]])
+
+    def limit(self, count):
+        return TorrentView(self.table, self.index[0:count])
+
+    def reverse(self):
+        return TorrentView(self.table, self.index[::-1])
+
+
+__all__ = (
+    "HAS_NUMPY",
+    "TorrentTable",
+    "TorrentView"
+)
@@ -0,0 +1,353 @@
+"""
+Disk pressure eviction: when the disks holding the download directories are short of a free space
+target, choose the seeding torrents whose removal (with their data) costs the least.
+
+When the daemon runs on this machine download directories are grouped by the mount point they are
+on, found locally with `filesystem.FreeSpaceCache`. Otherwise, or for directories which don't exist
+locally, the daemon is asked with a free-space RPC call and directories reporting the same free and
+total bytes are taken to be on the same disk. The target of a disk is
+the largest target of its directories, a directory takes the target of the longest target path
+containing it or the default target.
+
+The cost of removing a torrent is the upload it would lose plus how far it is from being allowed
+to go, in bytes:
+
+- `rateUpload` × `EVICTION_RATE_HORIZON`, what it would upload over the next day at its current rate.
+- Its slack is how far past its rule set's thresholds it is, max(secondsSeeding / min_time,
+  ratio / max_ratio) with unknown (negative) ratios counted as 0, the same either-or test the min_time_ratio rule uses. Below 1 it still owes
+  seeding time or ratio and costs (1 - slack) × size × `EVICTION_OBLIGATION_WEIGHT` more.
+
+Each disk is then a minimum cost covering knapsack solved greedily: torrents are taken cheapest per
+byte freed first (ties broken by the most slack, then the largest) until the deficit is covered,
+the last one taken is swapped for the cheapest torrent left covering the remainder, torrents the
+target turns out not to need are dropped again, most expensive first, and the result is compared
+against the cheapest single torrent covering the deficit alone. Sorting dominates, so
+planning 100k torrents over many disks costs a sort of each disk's seeding torrents.
+
+    >>> plan = plan_eviction(torrents, {None: parse_size("100G")}, make_free_space_lookup(client))
+    >>> print(format_eviction(plan))
+    >>> apply_eviction(client, plan, dry_run=True)
+"""
+import os
+import re
+import socket
+from collections import defaultdict, namedtuple
+
+try:
+    from urllib.parse import urlparse
+except ImportError:
+    from urlparse import urlparse
+
+from transmissionscripts import FIELDS_CLEAN, batch_failures, find_rule_set, logger, make_fields, natural_size
+from transmissionscripts import filesystem
+
+# torrent-get fields read when planning
+FIELDS_EVICTION = make_fields(FIELDS_CLEAN, ('downloadDir', 'sizeWhenDone', 'rateUpload'))
+
+# Seconds of upload at the current rate a removal is charged for
+EVICTION_RATE_HORIZON = 86400
+
+# Bytes charged per byte of a torrent for each whole share of its rule thresholds it has yet to reach
+EVICTION_OBLIGATION_WEIGHT = 10.0
+
+# Host names of this machine, besides the ones socket reports
+LOCAL_HOSTS = ("localhost", "127.0.0.1", "::1")
+
+# Sizes such as 500G or 1.5TiB
+_SIZE = re.compile(r"^(?P<value>\d+(?:\.\d+)?)\s*(?P<unit>[kmgtpe]?)(?P<binary>i?)b?$", re.IGNORECASE)
+
+# A seeding torrent which may be removed, cost in bytes lost, slack past its thresholds
+EvictionCandidate = namedtuple("EvictionCandidate", ("torrent", "size", "cost", "slack"))
+
+
+class EvictionGroup(object):
+    """ The eviction plan for the download directories on one disk """
+
+    def __init__(self, key, free, target, directories=()):
+        """
+
+        :param key: Mount point, or the directory when free space was asked of the daemon
+        :param free: Free bytes, None when unknown
+        :param target: Free bytes wanted
+        :param directories: Download directories on the disk
+        """
+        self.key = key
+        self.free = free
+        self.target = target
+        self.directories = set(directories)
+        self.candidates = []
+        self.chosen = []
+
+    @property
+    def deficit(self):
+        """ Bytes which need freeing to reach the target, 0 when the target is met or free space is unknown """
+        if self.free is None:
+            return 0
+        return max(0, self.target - self.free)
+
+    @property
+    def freed(self):
+        return sum(c.size for c in self.chosen)
+
+    @property
+    def cost(self):
+        return sum(c.cost for c in self.chosen)
+
+    @property
+    def shortfall(self):
+        """ Bytes the target is still short of after the chosen torrents are removed """
+        return max(0, self.deficit - self.freed)
+
+
+def parse_size(text):
+    """ Parse a size such as `500G`, `1.5TB` or `200GiB` into bytes. Units are decimal unless
+    given with an i, matching `natural_size`.
+
+    :type text: str
+    :rtype: int
+    """
+    m = _SIZE.match(text.strip())
+    if not m:
+        raise ValueError("Invalid size, expected eg. 500G or 1.5TiB: {}".format(text))
+    base = 1024 if m.group("binary") else 1000
+    power = " kmgtpe".index(m.group("unit").lower() or " ")
+    return int(float(m.group("value")) * base ** power)
+
+
+def eviction_cost(torrent):
+    """ The cost in bytes of removing a seeding torrent and its slack past its rule thresholds,
+    see the module docs.
+
+    :param torrent: Torrent with the `FIELDS_EVICTION` fields
+    :return: Cost and slack
+    :rtype: (float, float)
+    """
+    rule_set = find_rule_set(torrent)
+    # Transmission reports -1 when the ratio is unknown and -2 when it is infinite, neither passes max_ratio
+    ratio = max(0.0, torrent.ratio)
+    slack = max(torrent.secondsSeeding / float(rule_set['min_time']) if rule_set['min_time'] > 0 else 1.0,
+                ratio / float(rule_set['max_ratio']) if rule_set['max_ratio'] > 0 else 1.0)
+    cost = torrent.rateUpload * EVICTION_RATE_HORIZON
+    if slack < 1:
+        cost += (1 - slack) * torrent.sizeWhenDone * EVICTION_OBLIGATION_WEIGHT
+    return cost, slack
+
+
+def solve_eviction(candidates, deficit):
+    """ Choose a cheap set of candidates freeing at least deficit bytes, see the module docs
+
+    :param candidates: Candidates to choose from
+    :type candidates: EvictionCandidate[]
+    :param deficit: Bytes to free
+    :type deficit: int
+    :return: The chosen candidates, all of them when even they can't cover the deficit
+    :rtype: EvictionCandidate[]
+    """
+    if deficit <= 0:
+        return []
+    chosen = []
+    freed = 0
+    for candidate in sorted(candidates, key=lambda c: (c.cost / c.size, -c.slack, -c.size)):
+        if freed >= deficit:
+            break
+        chosen.append(candidate)
+        freed += candidate.size
+    if freed < deficit:
+        return chosen
+    # The last torrent taken usually overshoots, the cheapest one left covering the remainder may do instead
+    last = chosen[-1]
+    remainder = deficit - (freed - last.size)
+    taken = set(id(c) for c in chosen)
+    for candidate in candidates:
+        if id(candidate) not in taken and candidate.size >= remainder and candidate.cost < last.cost:
+            last = candidate
+    if last is not chosen[-1]:
+        freed += last.size - chosen[-1].size
+        chosen[-1] = last
+    # The last torrents taken may have covered the deficit alone, drop the earlier ones not needed
+    kept = []
+    for candidate in sorted(chosen, key=lambda c: (-c.cost, c.slack)):
+        if freed - candidate.size >= deficit:
+            freed -= candidate.size
+        else:
+            kept.append(candidate)
+    cost = sum(c.cost for c in kept)
+    single = None
+    for candidate in candidates:
+        if candidate.size >= deficit and (single is None or candidate.cost < single.cost):
+            single = candidate
+    if single is not None and single.cost < cost:
+        return [single]
+    kept.sort(key=lambda c: (c.cost / c.size, -c.slack, -c.size))
+    return kept
+
+
+def _target_of(directory, targets):
+    """ The target of the longest target path containing directory, else the default target """
+    path = directory.rstrip("/") or "/"
+    while True:
+        if path in targets:
+            return targets[path]
+        parent = os.path.dirname(path)
+        if parent == path:
+            return targets.get(None)
+        path = parent
+
+
+def is_local_client(client):
+    """ Whether the daemon a client talks to runs on this machine, so its download directories can
+    be looked at directly
+
+    :param client: Transmission RPC Client
+    :type client: transmissionscripts.TSClient
+    :rtype: bool
+    """
+    host = urlparse(client.url).hostname
+    if not host:
+        return False
+    if host in LOCAL_HOSTS or host.startswith("127."):
+        return True
+    return host in (socket.gethostname(), socket.getfqdn())
+
+
+def make_free_space_lookup(client=None, ttl=30.0, local=None):
+    """ Return a function mapping a download directory to its disk and free bytes. Directories are
+    grouped by mount point when the daemon is local, otherwise by the free and total bytes the daemon
+    reports for them, asking it once per directory.
+
+    :param client: Transmission RPC Client used for directories which can't be looked at locally
+    :type client: transmissionscripts.TSClient
+    :param ttl: Seconds local free space values are reused for
+    :type ttl: float
+    :param local: Whether the daemon's directories are on this machine, by default when the client's
+    host is this machine or there is no client
+    :type local: bool
+    :return: Function returning a (disk key, free bytes) tuple, free bytes is None when unknown
+    :rtype: callable
+    """
+    if local is None:
+        local = client is None or is_local_client(client)
+    free_space = filesystem.FreeSpaceCache(ttl)
+    remote = {}
+    # (free, total) bytes -> the first directory reporting them, naming the disk
+    disks = {}
+
+    def lookup(directory):
+        if local and os.path.isdir(directory):
+            mount = free_space.mount(directory)
+            return mount, free_space.get_free_space(mount)
+        if directory not in remote:
+            key, free = directory, None
+            if client is not None:
+                try:
+                    result = client._request_arguments('free-space', {'path': directory})
+                except Exception as err:
+                    logger.warning("Failed to get free space of {}: {}".format(directory, err))
+                else:
+                    free = result.get('size-bytes')
+                    if free is None or free < 0:
+                        free = None
+                    else:
+                        key = disks.setdefault((free, result.get('total_size')), directory)
+            remote[directory] = key, free
+        return remote[directory]
+    return lookup
+
+
+def plan_eviction(torrents, targets, free_space):
+    """ Plan which seeding torrents to remove so every disk reaches its free space target
+
+    :param torrents: Torrents with the `FIELDS_EVICTION` fields
+    :param targets: Download directory -> free bytes wanted, the None key holds the default target
+    :type targets: dict
+    :param free_space: Function mapping a directory to a (disk key, free bytes) tuple, see
+    `make_free_space_lookup`
+    :return: The plan of each disk with a target, sorted by disk
+    :rtype: EvictionGroup[]
+    """
+    targets = dict((None if path is None else path.rstrip("/") or "/", size) for path, size in targets.items())
+    by_dir = defaultdict(list)
+    for torrent in torrents:
+        by_dir[torrent.downloadDir].append(torrent)
+    groups = {}
+    for directory, dir_torrents in by_dir.items():
+        target = _target_of(directory, targets)
+        if target is None:
+            continue
+        key, free = free_space(directory)
+        group = groups.get(key)
+        if group is None:
+            group = groups[key] = EvictionGroup(key, free, target)
+        group.target = max(group.target, target)
+        group.directories.add(directory)
+        for torrent in dir_torrents:
+            if torrent.status == "seeding" and torrent.sizeWhenDone > 0:
+                cost, slack = eviction_cost(torrent)
+                group.candidates.append(EvictionCandidate(torrent, torrent.sizeWhenDone, cost, slack))
+    for group in groups.values():
+        group.chosen = solve_eviction(group.candidates, group.deficit)
+    return [groups[key] for key in sorted(groups)]
+
+
+def format_eviction(plan):
+    """ Describe an eviction plan, one line per disk followed by one per torrent chosen
+
+    :type plan: EvictionGroup[]
+    :rtype: str
+    """
+    lines = []
+    for group in plan:
+        lines.append("[{}] Free: {} Target: {} Deficit: {} Freeing: {} from {} torrents{}".format(
+            group.key, "unknown" if group.free is None else natural_size(group.free), natural_size(group.target),
+            natural_size(group.deficit), natural_size(group.freed), len(group.chosen),
+            " Short by: {}".format(natural_size(group.shortfall)) if group.shortfall else ""))
+        for c in group.chosen:
+            lines.append("  [{}] {} {} cost: {} slack: {:.2f} up: {}/s".format(
+                c.torrent.id, c.torrent.name, natural_size(c.size), natural_size(c.cost), c.slack,
+                natural_size(c.torrent.rateUpload)))
+    return "\n".join(lines)
+
+
+def apply_eviction(client, plan, dry_run=False):
+    """ Stop and delete the data of every torrent in an eviction plan using a single mutation batch
+
+    :param client: Transmission RPC Client
+    :type client: transmissionscripts.TSClient
+    :param plan: Eviction plan as returned by `plan_eviction`
+    :type plan: EvictionGroup[]
+    :param dry_run: Only log what would be removed
+    :type dry_run: bool
+    :return: The result of each RPC chunk sent
+    :rtype: BatchResult[]
+    """
+    batch = client.batch()
+    if not dry_run:
+        for group in plan:
+            for c in group.chosen:
+                batch.add("stop", c.torrent)
+                batch.add("delete", c.torrent)
+    results = batch.commit()
+    failed = batch_failures(results, "delete")
+    for group in plan:
+        for c in group.chosen:
+            if c.torrent.hashString not in failed:
+                logger.info("Evicted: {} {}\nReason: freeing {} on {}".format(
+                    c.torrent.name, c.torrent.hashString, natural_size(c.size), group.key))
+    return results
+
+
+__all__ = (
+    "EVICTION_OBLIGATION_WEIGHT",
+    "EVICTION_RATE_HORIZON",
+    "FIELDS_EVICTION",
+    "EvictionCandidate",
+    "EvictionGroup",
+    "apply_eviction",
+    "eviction_cost",
+    "format_eviction",
+    "is_local_client",
+    "make_free_space_lookup",
+    "parse_size",
+    "plan_eviction",
+    "solve_eviction"
+)
@@ -0,0 +1,262 @@
+"""
+Prometheus metrics for a transmission daemon, served by ts_exporter.
+
+A `MetricsCollector` thread polls the daemon every interval. Each poll is one session-get, one
+session-stats and one delta torrent-get through a `TorrentCache`. The exposition text is rendered
+once per poll, so a scrape only copies bytes that already exist and never makes an RPC call. Many
+scrapers put the same constant load on the daemon as one.
+
+Torrents are aggregated per `find_tracker` group and status, along with error counts per error
+class (see `error_class`) and free space per mount point of the download directories that exist
+locally. How long each poll took and how old the data served is are exported too.
+
+    >>> collector = MetricsCollector(make_client(args), interval=15)
+    >>> collector.start()
+    >>> body = collector.scrape()
+"""
+import os
+import re
+import threading
+import time
+
+from transmissionscripts import LOCAL_ERRORS, REMOTE_MESSAGES, FIELDS_AGGREGATE, TorrentCache, \
+    aggregate_by_tracker, logger, make_fields
+from transmissionscripts import filesystem
+
+# torrent-get fields read when collecting
+FIELDS_METRICS = make_fields(FIELDS_AGGREGATE, ("errorString", "downloadDir"))
+
+# Seconds between polls of the daemon
+METRICS_INTERVAL = 15.0
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Distinct error classes exported before the rest are counted as "other", bounding label cardinality
+ERROR_CLASS_LIMIT = 20
+
+# Transmission's torrent error codes
+ERROR_CODES = {
+    1: "tracker_warning",
+    2: "tracker_error",
+    3: "local_error",
+}
+
+# Parts of error messages which vary between torrents, eg. paths, quoted names and numbers
+_ERROR_DETAIL = re.compile(r"\(.*?\)|\".*?\"|'.*?'|/\S*|\d+")
+
+
+def error_class(torrent):
+    """ Group a torrent's error message into a short class shared by torrents with the same kind of
+    error, "unregistered" and "no_data" for the messages the cleaning rules act on.
+
+    :param torrent: Torrent with the error and errorString fields
+    :return: Error class, None when the torrent has no error
+    :rtype: str
+    """
+    if not torrent.error:
+        return None
+    message = torrent.errorString.lower()
+    if message in REMOTE_MESSAGES:
+        return "unregistered"
+    for local_error in LOCAL_ERRORS:
+        if local_error in message:
+            return "no_data"
+    message = " ".join(_ERROR_DETAIL.sub(" ", message).split())
+    return message[0:60] or ERROR_CODES.get(torrent.error, "unknown")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class MetricsText(object):
+    """ Builds exposition text, one metric family at a time """
+
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, metric_type, help_text, samples):
+        """ Add a metric family
+
+        :param name: Metric name
+        :param metric_type: gauge or counter
+        :param help_text: Description
+        :param samples: Sequence of (labels dict, value)
+        """
+        self.lines.append("# HELP {} {}".format(name, help_text))
+        self.lines.append("# TYPE {} {}".format(name, metric_type))
+        for labels, value in samples:
+            if labels:
+                self.lines.append("{}{{{}}} {}".format(name, ",".join(
+                    '{}="{}"'.format(key, _escape(labels[key])) for key in sorted(labels)), repr(float(value))))
+            else:
+                self.lines.append("{} {}".format(name, repr(float(value))))
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+class MetricsCollector(threading.Thread):
+    """ Background thread polling the daemon and rendering metrics, see the module docs """
+
+    def __init__(self, client, interval=METRICS_INTERVAL, free_space_ttl=60.0):
+        """
+
+        :param client:
+        :type client: transmissionscripts.TSClient
+        :param interval: Seconds between polls
+        :type interval: float
+        :param free_space_ttl: Seconds local free space lookups are reused for
+        :type free_space_ttl: float
+        """
+        threading.Thread.__init__(self, name="ts_exporter-collector")
+        self.daemon = True
+        self.client = client
+        self.interval = interval
+        self.cache = TorrentCache(client, FIELDS_METRICS)
+        self.free_space = filesystem.FreeSpaceCache(free_space_ttl)
+        self.stopped = threading.Event()
+        self.collections = 0
+        self.errors = 0
+        self.scrapes = 0
+        self.last_duration = 0.0
+        self.last_success = None
+        self.last_failed = True
+        self._body = ""
+        self._lock = threading.Lock()
+
+    def stop(self):
+        self.stopped.set()
+
+    def run(self):
+        if self.collections:
+            # Collected before starting to have data to serve, don't poll again straight away
+            self.stopped.wait(self.interval)
+        while not self.stopped.is_set():
+            started = time.time()
+            self.collect()
+            self.stopped.wait(max(0.0, self.interval - (time.time() - started)))
+
+    def collect(self):
+        """ Poll the daemon once and render the metrics, failures keep serving the previous data """
+        started = time.time()
+        try:
+            session = self.client.get_session()
+            stats = self.client.session_stats()
+            torrents = self.cache.sync()
+            body = self.render(session, stats, torrents)
+        except Exception as err:
+            self.errors += 1
+            body = None
+            logger.warning("Failed to collect metrics: {}".format(err))
+        self.last_duration = time.time() - started
+        self.collections += 1
+        self.last_failed = body is None
+        if body is not None:
+            self.last_success = time.time()
+            with self._lock:
+                self._body = body
+
+    @staticmethod
+    def _session_families(metrics, session, stats):
+        metrics.family("transmission_session_download_speed_bytes", "gauge", "Current download rate in bytes/s",
+                       [({}, getattr(stats, "downloadSpeed", 0))])
+        metrics.family("transmission_session_upload_speed_bytes", "gauge", "Current upload rate in bytes/s",
+                       [({}, getattr(stats, "uploadSpeed", 0))])
+        metrics.family("transmission_session_torrents", "gauge", "Torrents known to the session by state", [
+            ({"state": "active"}, getattr(stats, "activeTorrentCount", 0)),
+            ({"state": "paused"}, getattr(stats, "pausedTorrentCount", 0)),
+            ({"state": "all"}, getattr(stats, "torrentCount", 0)),
+        ])
+        for key, name, help_text in (
+                ("downloadedBytes", "downloaded_bytes_total", "Bytes downloaded"),
+                ("uploadedBytes", "uploaded_bytes_total", "Bytes uploaded"),
+                ("filesAdded", "files_added_total", "Files added"),
+                ("secondsActive", "active_seconds_total", "Seconds the daemon has been active")):
+            metrics.family("transmission_session_" + name, "counter", help_text, [
+                ({"scope": scope}, (getattr(stats, attr, None) or {}).get(key, 0))
+                for scope, attr in (("cumulative", "cumulative_stats"), ("current", "current_stats"))
+            ])
+        metrics.family("transmission_download_dir_free_bytes", "gauge",
+                       "Free space in the default download directory as reported by the daemon",
+                       [({}, getattr(session, "download_dir_free_space", 0) or 0)])
+
+    def render(self, session, stats, torrents):
+        """ Render the exposition text for one poll
+
+        :param session: Result of session-get
+        :param stats: Result of session-stats
+        :param torrents: Every torrent, with the `FIELDS_METRICS` fields
+        :rtype: str
+        """
+        groups = sorted(aggregate_by_tracker(torrents).items())
+        errors = {}
+        dirs = set()
+        for torrent in torrents:
+            error = error_class(torrent)
+            if error is not None:
+                if error not in errors and len(errors) >= ERROR_CLASS_LIMIT:
+                    error = "other"
+                errors[error] = errors.get(error, 0) + 1
+            dirs.add(torrent.downloadDir)
+        mounts = sorted({self.free_space.mount(d) for d in dirs if os.path.isdir(d)})
+
+        metrics = MetricsText()
+        self._session_families(metrics, session, stats)
+        metrics.family("transmission_torrents", "gauge", "Torrents by tracker and status", [
+            ({"tracker": tracker, "status": status}, count)
+            for tracker, group in groups for status, count in sorted(group.statuses.items())])
+        metrics.family("transmission_torrent_size_bytes", "gauge", "Total size of the torrents of each tracker", [
+            ({"tracker": tracker}, group.total_size) for tracker, group in groups])
+        metrics.family("transmission_torrent_upload_speed_bytes", "gauge",
+                       "Summed upload rate of the torrents of each tracker in bytes/s",
+                       [({"tracker": tracker}, group.rate_upload) for tracker, group in groups])
+        metrics.family("transmission_torrent_download_speed_bytes", "gauge",
+                       "Summed download rate of the torrents of each tracker in bytes/s",
+                       [({"tracker": tracker}, group.rate_download) for tracker, group in groups])
+        metrics.family("transmission_torrent_ratio_avg", "gauge", "Mean upload ratio of the torrents of each tracker",
+                       [({"tracker": tracker}, group.ratio_avg) for tracker, group in groups])
+        metrics.family("transmission_torrent_errors", "gauge", "Torrents in an error state by error class", [
+            ({"class": error}, count) for error, count in sorted(errors.items())])
+        metrics.family("transmission_mount_free_bytes", "gauge",
+                       "Free space of the local mount points holding download directories", [
+                           ({"mount": mount}, self.free_space.get_free_space(mount))
+                           for mount in mounts if self.free_space.get_free_space(mount) is not None])
+        return metrics.text()
+
+    def scrape(self):
+        """ The metrics of the last successful poll along with the exporter's own, no RPC calls are made
+
+        :rtype: str
+        """
+        self.scrapes += 1
+        now = time.time()
+        with self._lock:
+            body = self._body
+        metrics = MetricsText()
+        metrics.family("transmission_up", "gauge", "Whether the last poll of the daemon succeeded",
+                       [({}, 0 if self.last_failed else 1)])
+        metrics.family("transmission_exporter_staleness_seconds", "gauge",
+                       "Seconds since the metrics served were collected",
+                       [({}, now - self.last_success if self.last_success is not None else -1)])
+        metrics.family("transmission_exporter_collect_duration_seconds", "gauge",
+                       "Seconds the last poll of the daemon took, including failed polls",
+                       [({}, self.last_duration)])
+        metrics.family("transmission_exporter_collections_total", "counter", "Polls of the daemon",
+                       [({}, self.collections)])
+        metrics.family("transmission_exporter_collect_errors_total", "counter", "Polls of the daemon which failed",
+                       [({}, self.errors)])
+        metrics.family("transmission_exporter_scrapes_total", "counter", "Scrapes served",
+                       [({}, self.scrapes)])
+        return body + metrics.text()
+
+
+__all__ = (
+    "CONTENT_TYPE",
+    "FIELDS_METRICS",
+    "METRICS_INTERVAL",
+    "MetricsCollector",
+    "MetricsText",
+    "error_class"
+)
@@ -1,5 +1,8 @@
 import os
 import platform
+import time
+
+from transmissionscripts.instrument import PROFILER
 
 
 def get_free_space(dir_name):
@@ -18,3 +21,65 @@ def get_free_space(dir_name):
     else:
         st = os.statvfs(dir_name)
         return st.f_bavail * st.f_frsize
+
+
+def find_mount(path):
+    """Find the mount point the path resides on
+
+    :param path: Any path, it does not need to exist
+    :return: Mount point path
+    """
+    path = os.path.abspath(path)
+    while not os.path.ismount(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return path
+
+
+class FreeSpaceCache(object):
+    """Free space lookups cached per mount point for ttl seconds, so many download directories
+    on the same disk cost a single statvfs call per ttl.
+    """
+
+    def __init__(self, ttl=30.0):
+        """
+
+        :param ttl: Seconds a free space value is reused for
+        :type ttl: float
+        """
+        self.ttl = ttl
+        self._mounts = {}
+        self._free = {}
+
+    def mount(self, path):
+        """Get the cached mount point of a path
+
+        :param path: Directory path
+        :return: Mount point path
+        """
+        mount = self._mounts.get(path)
+        if mount is None:
+            mount = self._mounts[path] = find_mount(path)
+        return mount
+
+    def get_free_space(self, path):
+        """Get free space in bytes for the mount holding path, None when it cannot be read
+
+        :param path: Directory path
+        :return: Free bytes
+        """
+        mount = self.mount(path)
+        now = time.time()
+        cached = self._free.get(mount)
+        expired = cached is None or now - cached[0] > self.ttl
+        if PROFILER.enabled:
+            PROFILER.hit("free space", not expired)
+        if expired:
+            try:
+                free = get_free_space(mount)
+            except OSError:
+                free = None
+            cached = self._free[mount] = (now, free)
+        return cached[1]
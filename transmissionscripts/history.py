@@ -0,0 +1,280 @@
+"""
+Fixed memory history of torrent transfer rates, recorded once per poll by the watch and top loops.
+
+Samples are kept in flat `array.array` buffers of rows × slots, one row per torrent, written as
+rings so recording never allocates once every row exists. Storage is consolidated the way an RRD
+is, keeping memory predictable regardless of how long it runs:
+
+- Each torrent keeps `window` samples at the poll step, 15 minutes of 5 second polls by default.
+- Every full window is averaged into one coarse sample, of which each torrent keeps `coarse_window`,
+  24 hours by default.
+- Rates summed per `find_tracker` group keep `group_window` samples at the poll step, 24 hours of
+  5 second polls by default. There are only ever a handful of groups.
+
+With the defaults each row costs 2.2kB, rows are allocated in doubling steps so 20k torrents take
+between 44MB and 74MB, see `RateHistory.memory_bytes`.
+
+    >>> history = RateHistory()
+    >>> history.record(cache.sync())
+    >>> up, down = history.torrent(torrent.id)
+    >>> print(sparkline(up), rate_stats(up).p95)
+"""
+import math
+from array import array
+from collections import namedtuple
+
+from transmissionscripts import find_tracker, FIELDS_TRACKER
+
+# Samples kept per torrent at the poll step
+HISTORY_WINDOW = 180
+
+# Consolidated samples kept per torrent, each averaging one full window
+HISTORY_COARSE_WINDOW = 96
+
+# Samples kept per tracker group at the poll step
+HISTORY_GROUP_WINDOW = 17280
+
+# torrent-get fields read when recording
+FIELDS_HISTORY = ("rateUpload", "rateDownload") + FIELDS_TRACKER
+
+# Largest value an unsigned 32 bit sample can hold
+_SAMPLE_MAX = 0xFFFFFFFF
+
+SPARK_CHARS = u"▁▂▃▄▅▆▇█"
+
+RateStats = namedtuple("RateStats", ("last", "avg", "p95", "peak"))
+
+
+class RateRing(object):
+    """ Upload and download samples for a set of keys. Every key is sampled together on each call to
+    `record`, so all rows share a single write position.
+    """
+
+    def __init__(self, slots, rows=64, keep_missing=False):
+        """
+
+        :param slots: Samples kept per key
+        :type slots: int
+        :param rows: Initial number of rows to allocate, grown by doubling as keys are added
+        :type rows: int
+        :param keep_missing: Record zero for keys missing from a sample rather than dropping them
+        :type keep_missing: bool
+        """
+        self.slots = slots
+        self.keep_missing = keep_missing
+        self.samples = 0
+        self._rows = {}
+        self._free = list(range(rows - 1, -1, -1))
+        self._first = array("Q", bytes(8 * rows))
+        self._up = array("I", bytes(4 * rows * slots))
+        self._down = array("I", bytes(4 * rows * slots))
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, key):
+        return key in self._rows
+
+    def keys(self):
+        return self._rows.keys()
+
+    @property
+    def capacity(self):
+        return len(self._first)
+
+    def memory_bytes(self):
+        """ Bytes held by the sample buffers """
+        return (self._up.itemsize + self._down.itemsize) * len(self._up) + self._first.itemsize * len(self._first)
+
+    def _grow(self):
+        rows = self.capacity
+        self._first.extend(array("Q", bytes(8 * rows)))
+        self._up.extend(array("I", bytes(4 * rows * self.slots)))
+        self._down.extend(array("I", bytes(4 * rows * self.slots)))
+        self._free.extend(range(2 * rows - 1, rows - 1, -1))
+
+    def _row(self, key):
+        row = self._rows.get(key)
+        if row is None:
+            if not self._free:
+                self._grow()
+            row = self._rows[key] = self._free.pop()
+            self._first[row] = self.samples
+        return row
+
+    def record(self, rates):
+        """ Record one sample for every key. Keys missing from rates are dropped along with their
+        samples and their rows reused by new keys, unless keep_missing is set.
+
+        :param rates: key -> (upload rate, download rate)
+        :type rates: dict
+        """
+        column = self.samples % self.slots
+        slots, up, down = self.slots, self._up, self._down
+        for key in [key for key in self._rows if key not in rates]:
+            if self.keep_missing:
+                offset = self._rows[key] * slots + column
+                up[offset] = down[offset] = 0
+            else:
+                self._free.append(self._rows.pop(key))
+        for key, (rate_up, rate_down) in rates.items():
+            offset = self._row(key) * slots + column
+            up[offset] = min(int(rate_up), _SAMPLE_MAX)
+            down[offset] = min(int(rate_down), _SAMPLE_MAX)
+        self.samples += 1
+
+    def series(self, key):
+        """ Samples recorded for the key, oldest first
+
+        :return: (upload samples, download samples)
+        :rtype: (list, list)
+        """
+        row = self._rows.get(key)
+        if row is None:
+            return [], []
+        count = min(self.samples - self._first[row], self.slots)
+        base = row * self.slots
+        start = (self.samples - count) % self.slots
+        if start + count <= self.slots:
+            spans = ((base + start, base + start + count),)
+        else:
+            spans = ((base + start, base + self.slots), (base, base + start + count - self.slots))
+        return ([value for lo, hi in spans for value in self._up[lo:hi]],
+                [value for lo, hi in spans for value in self._down[lo:hi]])
+
+    def averages(self):
+        """ The mean of each key's samples
+
+        :return: key -> (mean upload rate, mean download rate)
+        :rtype: dict
+        """
+        result = {}
+        for key in self._rows:
+            up, down = self.series(key)
+            if up:
+                result[key] = (sum(up) / len(up), sum(down) / len(down))
+        return result
+
+
+class RateHistory(object):
+    """ Rate history for every torrent and `find_tracker` group, see the module docs for how
+    samples are consolidated.
+    """
+
+    def __init__(self, window=HISTORY_WINDOW, coarse_window=HISTORY_COARSE_WINDOW,
+                 group_window=HISTORY_GROUP_WINDOW):
+        """
+
+        :param window: Samples kept per torrent at the poll step
+        :type window: int
+        :param coarse_window: Consolidated samples kept per torrent
+        :type coarse_window: int
+        :param group_window: Samples kept per tracker group at the poll step
+        :type group_window: int
+        """
+        self.fine = RateRing(window)
+        self.coarse = RateRing(coarse_window)
+        self.groups = RateRing(group_window, rows=8, keep_missing=True)
+
+    def __len__(self):
+        return len(self.fine)
+
+    def memory_bytes(self):
+        """ Bytes held by all sample buffers """
+        return self.fine.memory_bytes() + self.coarse.memory_bytes() + self.groups.memory_bytes()
+
+    def record(self, torrents):
+        """ Record a sample for each torrent and tracker group, torrents which are no longer present
+        have their history discarded.
+
+        :param torrents: Every torrent currently known, with the `FIELDS_HISTORY` fields
+        """
+        rates = {}
+        groups = {}
+        for torrent in torrents:
+            rates[torrent.id] = (torrent.rateUpload, torrent.rateDownload)
+            tracker = find_tracker(torrent)
+            group = groups.get(tracker)
+            groups[tracker] = (torrent.rateUpload, torrent.rateDownload) if group is None else \
+                (group[0] + torrent.rateUpload, group[1] + torrent.rateDownload)
+        self.fine.record(rates)
+        self.groups.record(groups)
+        if self.fine.samples % self.fine.slots == 0:
+            self.coarse.record(self.fine.averages())
+
+    def torrent(self, torrent_id, coarse=False):
+        """ Rate samples for a torrent, oldest first
+
+        :param torrent_id: Torrent id
+        :param coarse: Return the consolidated samples instead of those at the poll step
+        :type coarse: bool
+        :return: (upload samples, download samples)
+        :rtype: (list, list)
+        """
+        return (self.coarse if coarse else self.fine).series(torrent_id)
+
+    def tracker(self, name):
+        """ Rate samples summed over the torrents of a `find_tracker` group, oldest first
+
+        :return: (upload samples, download samples)
+        :rtype: (list, list)
+        """
+        return self.groups.series(name)
+
+    def trackers(self):
+        return sorted(self.groups.keys())
+
+
+def percentile(values, pct):
+    """ Nearest rank percentile of values
+
+    :param values: Samples
+    :param pct: Percentile between 0 and 100
+    :type pct: float
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered), int(math.ceil(pct / 100.0 * len(ordered)))) - 1)]
+
+
+def rate_stats(values):
+    """ Summarize rate samples
+
+    :param values: Samples, oldest first
+    :rtype: RateStats
+    """
+    if not values:
+        return RateStats(0, 0.0, 0, 0)
+    return RateStats(values[-1], sum(values) / float(len(values)), percentile(values, 95), max(values))
+
+
+def sparkline(values, width=None):
+    """ Render samples as a line of block characters scaled to the largest sample. When width is
+    given and there are more samples, neighbouring samples are averaged down to fit.
+
+    :param values: Samples, oldest first
+    :param width: Maximum number of characters
+    :type width: int
+    :rtype: str
+    """
+    if width and len(values) > width:
+        step = len(values) / float(width)
+        values = [sum(values[int(i * step):int((i + 1) * step)]) / max(1, int((i + 1) * step) - int(i * step))
+                  for i in range(width)]
+    peak = max(values) if values else 0
+    if not peak:
+        return SPARK_CHARS[0] * len(values)
+    top = len(SPARK_CHARS) - 1
+    return u"".join(SPARK_CHARS[int(round(value * top / float(peak)))] for value in values)
+
+
+__all__ = (
+    "FIELDS_HISTORY",
+    "RateHistory",
+    "RateRing",
+    "RateStats",
+    "percentile",
+    "rate_stats",
+    "sparkline"
+)
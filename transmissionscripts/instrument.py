@@ -0,0 +1,225 @@
+"""
+Opt-in instrumentation of the hot paths, enabled with the `--profile` flag every script accepts.
+
+The module level `PROFILER` collects:
+
+- Per RPC method: calls, total time, payload bytes and torrents returned. Torrent-get requests
+  split their time into waiting for the response headers (daemon work plus a round trip), transferring
+  the body, JSON decoding and building torrent objects.
+- Per pipeline stage: calls, items produced and exclusive time. Lazy stages are chained
+  generators, so time spent pulling from an upstream stage is charged to that stage rather than to
+  the one asking for the next item.
+- Cache hits and misses, eg. delta versus full `TorrentCache` syncs and the rule matcher's url cache.
+
+Every hook checks `PROFILER.enabled` first, so the cost while disabled is one attribute lookup per
+request or pipeline stage rather than per torrent.
+
+    >>> PROFILER.enable()
+    >>> torrents = list(PROFILER.iterate("filter", ifilter_torrents_by(source, key)))
+    >>> print(PROFILER.report())
+"""
+import atexit
+import sys
+from time import perf_counter
+
+
+class Timings(object):
+    """ Accumulated call count, item count, seconds and named sub-timings of one RPC method or stage """
+
+    __slots__ = ("calls", "items", "seconds", "bytes", "phases")
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.phases = {}
+
+
+class CountingReader(object):
+    """ File like wrapper counting the bytes read through it """
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.bytes = 0
+
+    def read(self, size=-1):
+        data = self.fp.read(size)
+        self.bytes += len(data)
+        return data
+
+
+class _Frame(object):
+    __slots__ = ("name", "started", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = perf_counter()
+        self.children = 0.0
+
+
+class Profiler(object):
+    """ Collects the timings described in the module docs """
+
+    def __init__(self):
+        self.enabled = False
+        self.cache_sources = {}
+        self.reset()
+
+    def reset(self):
+        self.rpc = {}
+        self.stages = {}
+        self.caches = {}
+        self._stack = []
+
+    def enable(self, report_at_exit=False):
+        """ Start collecting
+
+        :param report_at_exit: Write the report to stderr when the process exits
+        :type report_at_exit: bool
+        """
+        if report_at_exit and not self.enabled:
+            atexit.register(lambda: sys.stderr.write(self.report()))
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def add_phase(self, method, phase, seconds, torrents=0):
+        """ Add time spent handling the response of an RPC request already recorded, eg. building
+        torrents from it, without counting another call.
+        """
+        timings = self.rpc.get(method)
+        if timings is None:
+            timings = self.rpc[method] = Timings()
+        timings.seconds += seconds
+        timings.items += torrents
+        timings.phases[phase] = timings.phases.get(phase, 0.0) + seconds
+
+    def record_rpc(self, method, seconds, bytes_received=0, torrents=0, **phases):
+        """ Record one RPC request
+
+        :param method: RPC method name
+        :param seconds: Total time of the request
+        :param bytes_received: Size of the response body
+        :param torrents: Torrents in the response
+        :param phases: Named parts of seconds, eg. wait, transfer, decode and build
+        """
+        timings = self.rpc.get(method)
+        if timings is None:
+            timings = self.rpc[method] = Timings()
+        timings.calls += 1
+        timings.seconds += seconds
+        timings.bytes += bytes_received
+        timings.items += torrents
+        for phase, phase_seconds in phases.items():
+            timings.phases[phase] = timings.phases.get(phase, 0.0) + phase_seconds
+
+    def hit(self, name, hit=True):
+        """ Record a cache lookup
+
+        :param name: Cache name
+        :param hit: Whether the lookup was answered from the cache
+        """
+        counts = self.caches.get(name)
+        if counts is None:
+            counts = self.caches[name] = [0, 0]
+        counts[0 if hit else 1] += 1
+
+    def begin(self, name):
+        """ Start timing a call of the stage name, nested stages are charged their own time
+
+        :rtype: _Frame
+        """
+        frame = _Frame(name)
+        self._stack.append(frame)
+        return frame
+
+    def end(self, frame, items=0, calls=1):
+        """ Stop timing a frame returned by `begin`
+
+        :param items: Items the call produced
+        :param calls: Calls to count, iterators count once however many items they produce
+        """
+        elapsed = perf_counter() - frame.started
+        self._stack.pop()
+        if self._stack:
+            self._stack[-1].children += elapsed
+        timings = self.stages.get(frame.name)
+        if timings is None:
+            timings = self.stages[frame.name] = Timings()
+        timings.calls += calls
+        timings.items += items
+        timings.seconds += elapsed - frame.children
+
+    def timed(self, name, func, *args, **kwargs):
+        """ Call func charging its exclusive time to the stage name, items are counted when it
+        returns a sized result.
+        """
+        frame = self.begin(name)
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            self.end(frame, len(result) if hasattr(result, "__len__") else 0)
+
+    def iterate(self, name, iterable):
+        """ Generator passing through iterable, charging the exclusive time of producing each item
+        to the stage name.
+        """
+        iterator = iter(iterable)
+        calls = 1
+        while True:
+            frame = self.begin(name)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.end(frame, 0, calls)
+                return
+            except BaseException:
+                self.end(frame, 0, calls)
+                raise
+            self.end(frame, 1, calls)
+            calls = 0
+            yield item
+
+    def report(self):
+        """ Format the collected timings as a table
+
+        :rtype: str
+        """
+        lines = []
+        if self.rpc:
+            lines.append("{:<16} {:>6} {:>10} {:>10} {:>12} {:>9}  {}".format(
+                "RPC method", "calls", "total ms", "avg ms", "bytes", "torrents", "phases ms"))
+            for method, t in sorted(self.rpc.items()):
+                lines.append("{:<16} {:>6} {:>10.1f} {:>10.2f} {:>12} {:>9}  {}".format(
+                    method, t.calls, t.seconds * 1000, t.seconds * 1000 / max(1, t.calls), t.bytes, t.items,
+                    " ".join("{}={:.1f}".format(phase, seconds * 1000) for phase, seconds in sorted(t.phases.items()))))
+        if self.stages:
+            lines.append("{:<16} {:>6} {:>10} {:>10}".format("Stage", "calls", "self ms", "items"))
+            for name, t in sorted(self.stages.items(), key=lambda item: -item[1].seconds):
+                lines.append("{:<16} {:>6} {:>10.1f} {:>10}".format(name, t.calls, t.seconds * 1000, t.items))
+        caches = dict((name, tuple(counts)) for name, counts in self.caches.items())
+        for name, source in self.cache_sources.items():
+            caches[name] = tuple(source())
+        if caches:
+            lines.append("{:<24} {:>10} {:>10} {:>8}".format("Cache", "hits", "misses", "hit %"))
+            for name, (hits, misses) in sorted(caches.items()):
+                total = hits + misses
+                lines.append("{:<24} {:>10} {:>10} {:>7.1f}%".format(
+                    name, hits, misses, 100.0 * hits / total if total else 0.0))
+        if not lines:
+            return "Nothing recorded\n"
+        return "\n".join(lines) + "\n"
+
+
+PROFILER = Profiler()
+
+__all__ = (
+    "PROFILER",
+    "Profiler",
+    "Timings",
+    "CountingReader"
+)
@@ -0,0 +1,201 @@
+"""
+Machine readable torrent output for ts_list and ts_cli, so other tools don't have to parse the coloured
+lines `print_torrent_line` prints.
+
+Each torrent is written as one record holding only the requested torrent-get fields, with the raw values
+the daemon sent: sizes in bytes, dates as unix timestamps and no colour codes. Records are encoded
+as torrents arrive and written out in chunks, so output fed from `TSClient.iter_torrents` uses
+constant memory however many torrents there are.
+
+- ndjson: One JSON object per line
+- csv: A header row of the field names, then one row per torrent. Lists such as trackers are JSON encoded
+- msgpack: A stream of msgpack maps, requires the msgpack package
+
+    >>> make_writer("ndjson", ("id", "name", "uploadRatio")).write(client.iter_torrents(fields))
+"""
+import abc
+import argparse
+import csv
+import io
+import json
+import sys
+
+try:
+    # noinspection PyPackageRequirements
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from transmissionscripts import RENDER_CHUNK_LINES, TorrentRenderer
+from transmissionscripts.records import TorrentRecord
+
+HAS_MSGPACK = msgpack is not None
+
+OUTPUT_FORMATS = ("text", "ndjson", "csv", "msgpack")
+
+
+def parse_fields(value):
+    """ Parse a comma separated --fields list. Only fields a `TorrentRecord` holds can be written,
+    records drop any other torrent-get field.
+
+    :param value: Comma separated torrent-get field names
+    :type value: str
+    :rtype: list
+    """
+    fields = [f.strip() for f in value.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in TorrentRecord.fields]
+    if unknown:
+        raise argparse.ArgumentTypeError("Unsupported fields: {}, choose from: {}".format(
+            ", ".join(unknown), ", ".join(TorrentRecord.fields)))
+    if not fields:
+        raise argparse.ArgumentTypeError("No fields given")
+    return fields
+
+
+def project(torrent, fields):
+    """ The values of the fields of a torrent in order, None for fields which were not fetched
+
+    :param torrent: Torrent or `TorrentRecord`
+    :param fields: torrent-get field names
+    :rtype: list
+    """
+    return [getattr(torrent, name, None) for name in fields]
+
+
+class RecordWriter(abc.ABC):
+    """ Base for writers encoding a chunk of torrents at a time, see the module docs """
+
+    # Output is bytes rather than text
+    binary = False
+
+    def __init__(self, fields):
+        """
+
+        :param fields: torrent-get field names written for each torrent, in order
+        """
+        self.fields = tuple(fields)
+
+    def header(self):
+        """ Encoded data written before the first record """
+        return b"" if self.binary else ""
+
+    @abc.abstractmethod
+    def encode(self, torrents):
+        """ Encode a chunk of torrents
+
+        :type torrents: list
+        :rtype: str|bytes
+        """
+
+    def write(self, torrents, stream=None, chunk_lines=RENDER_CHUNK_LINES):
+        """ Encode torrents and write them to the stream, chunk_lines torrents per write
+
+        :param torrents: Torrents with the writer's fields, any iterable
+        :param stream: Stream to write to, defaults to stdout. Binary formats write to the
+        underlying buffer of text streams.
+        :param chunk_lines: Torrents encoded per write
+        :type chunk_lines: int
+        :return: Number of torrents written
+        :rtype: int
+        """
+        stream = sys.stdout if stream is None else stream
+        if self.binary:
+            stream.flush()
+            stream = getattr(stream, "buffer", stream)
+        stream.write(self.header())
+        count = 0
+        chunk = []
+        for torrent in torrents:
+            chunk.append(torrent)
+            if len(chunk) >= chunk_lines:
+                stream.write(self.encode(chunk))
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            stream.write(self.encode(chunk))
+            count += len(chunk)
+        stream.flush()
+        return count
+
+
+class NDJSONWriter(RecordWriter):
+    def __init__(self, fields):
+        RecordWriter.__init__(self, fields)
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def encode(self, torrents):
+        fields, encode = self.fields, self._encoder.encode
+        lines = [encode(dict(zip(fields, project(torrent, fields)))) for torrent in torrents]
+        lines.append("")
+        return "\n".join(lines)
+
+
+class CSVWriter(RecordWriter):
+    def header(self):
+        return self.encode_rows([self.fields])
+
+    @staticmethod
+    def encode_rows(rows):
+        buf = io.StringIO()
+        csv.writer(buf, lineterminator="\n").writerows(rows)
+        return buf.getvalue()
+
+    def encode(self, torrents):
+        rows = []
+        for torrent in torrents:
+            row = project(torrent, self.fields)
+            for i, value in enumerate(row):
+                if isinstance(value, (list, dict)):
+                    row[i] = json.dumps(value, separators=(",", ":"))
+            rows.append(row)
+        return self.encode_rows(rows)
+
+
+class MsgpackWriter(RecordWriter):
+    binary = True
+
+    def __init__(self, fields):
+        if msgpack is None:
+            raise ValueError("The msgpack output format requires the msgpack package")
+        RecordWriter.__init__(self, fields)
+        self._packer = msgpack.Packer()
+
+    def encode(self, torrents):
+        fields, pack = self.fields, self._packer.pack
+        return b"".join(pack(dict(zip(fields, project(torrent, fields)))) for torrent in torrents)
+
+
+_WRITERS = {
+    "ndjson": NDJSONWriter,
+    "csv": CSVWriter,
+    "msgpack": MsgpackWriter,
+}
+
+
+def make_writer(output_format, fields):
+    """ Create the writer for an output format, text returns a `TorrentRenderer`
+
+    :param output_format: One of `OUTPUT_FORMATS`
+    :type output_format: str
+    :param fields: torrent-get field names written for each torrent, unused by text
+    :return: Object with a write(torrents, stream) method returning the number written
+    """
+    if output_format == "text":
+        return TorrentRenderer()
+    try:
+        return _WRITERS[output_format](fields)
+    except KeyError:
+        raise ValueError("Unknown output format: {}".format(output_format))
+
+
+__all__ = (
+    "HAS_MSGPACK",
+    "OUTPUT_FORMATS",
+    "RecordWriter",
+    "NDJSONWriter",
+    "CSVWriter",
+    "MsgpackWriter",
+    "make_writer",
+    "parse_fields",
+    "project"
+)
@@ -0,0 +1,338 @@
+"""
+Parser and planner for the ts_cli pipe language, eg. `ls | seeding | ratio | 20`.
+
+A pipeline is parsed into a list of `Stage` nodes, left to right, which `plan_pipeline` then
+rewrites into an equivalent but cheaper list:
+
+- Filters are moved ahead of sorts and reverses, so the sorts only see the torrents that remain.
+- Adjacent filters are fused into a single stage evaluated in one pass.
+- A sort followed by a limit becomes a top-k selection using a bounded heap.
+- Sorts and reverses which nothing downstream depends on the order of are dropped.
+
+Stages with side effects (print, limits, total_size, mutations) are barriers, nothing is moved
+across them. `pipeline_fields` returns the torrent-get fields the stages read so the fetch can be
+limited to them.
+"""
+import math
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from transmissionscripts import Filter, Sort, FIELDS_PRINT, FIELDS_TRACKER, find_tracker, make_fields
+from transmissionscripts.search import FUZZY_THRESHOLD, name_tokens, name_trigrams
+
+SEP_CMD = "|"
+
+CMD_PRINT = ("p", "print")
+CMD_COUNT = ("c", "cnt", "count")
+CMD_REVERSE = ("r", "rev", "reverse")
+CMD_NAME = ("n", "name")
+CMD_TRACKER = ("t", "tracker")
+CMD_SUBSTRING = ("s", "sub")
+CMD_TOKENS = ("w", "words")
+CMD_FUZZY = ("f", "fuzzy")
+CMD_TIME = ("time",)
+CMD_TOTAL_SIZE = ("total_size",)
+
+# Mutation commands: name -> `MutationBatch` action
+CMD_MUTATE = {
+    "stop": "stop",
+    "pause": "stop",
+    "start": "start",
+    "remove": "remove",
+    "rm": "remove",
+    "delete": "delete",
+}
+
+ARGS_TIME = re.compile(r"(?P<dir>[<>])(?P<duration>\d+)(?P<unit>[mhdwMY])")
+
+ARGS_DURATION = re.compile(r"^(?P<duration>\d+)(?P<unit>[mhdwMY])$")
+
+# Duration units used by time filters: unit -> seconds
+DURATION_UNITS = {
+    "m": 60,
+    "h": 3600,
+    "d": 86400,
+    "w": 86400 * 7,
+    "M": 86400 * 30.5,
+    "Y": 86400 * 365,
+}
+
+# A single pipeline stage, the type of arg depends on the op:
+#   filter: tuple of Predicate, all of which must match
+#   sort: `Sort` name
+#   top: (`Sort` name, count, reverse)
+#   limit: count
+#   mutate: `MutationBatch` action
+#   reverse, print, count, total_size: None
+Stage = namedtuple("Stage", ("op", "arg"))
+
+# Predicates matching on the torrent name, which a `NameIndex` can answer
+NAME_PREDICATES = ("name", "substring", "tokens", "fuzzy")
+
+# A single filter condition, name is a `Filter` name, one of `NAME_PREDICATES`, "tracker", "added"
+# or "ids" which matches a set of torrent ids
+Predicate = namedtuple("Predicate", ("name", "arg"))
+
+# Stages which print their torrents when they end the pipeline
+_PRINT_LAST = ("filter", "sort", "limit", "reverse")
+
+# Stages which filters may be moved ahead of
+_COMMUTES = ("sort", "reverse")
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _parse_time(arg):
+    """ Parse a time filter argument such as `>2w` into an "added" predicate """
+    m = ARGS_TIME.match(arg)
+    if not m:
+        raise QueryError("Invalid time filter, expected eg. >2w or <12h: {}".format(arg))
+    split, duration, unit = m.groups()
+    return Predicate("added", (split == ">", datetime.now() - timedelta(seconds=int(duration) * DURATION_UNITS[unit])))
+
+
+def parse_duration(text):
+    """ Parse a duration such as `30d` or `12h` into seconds
+
+    :param text: Integer followed by one of the `DURATION_UNITS`
+    :type text: str
+    :rtype: float
+    """
+    m = ARGS_DURATION.match(text.strip())
+    if not m:
+        raise QueryError("Invalid duration, expected eg. 30d or 12h: {}".format(text))
+    return int(m.group("duration")) * DURATION_UNITS[m.group("unit")]
+
+
+def parse_stage(arg):
+    """ Parse a single pipeline argument into a `Stage`
+
+    :param arg: Stripped pipeline argument, eg. "seeding" or "n=foo"
+    :type arg: str
+    :rtype: Stage
+    """
+    if arg.isdigit():
+        if int(arg) <= 0:
+            raise QueryError("Limit too low, must be positive integer: {}".format(arg))
+        return Stage("limit", int(arg))
+    elif arg in CMD_PRINT:
+        return Stage("print", None)
+    elif arg in CMD_COUNT:
+        return Stage("count", None)
+    elif arg in CMD_REVERSE:
+        return Stage("reverse", None)
+    elif arg in CMD_TOTAL_SIZE:
+        return Stage("total_size", None)
+    elif arg in CMD_MUTATE:
+        return Stage("mutate", CMD_MUTATE[arg])
+    elif arg in Filter.names:
+        return Stage("filter", (Predicate(arg, None),))
+    elif arg in Sort.names:
+        return Stage("sort", arg)
+    elif "=" in arg:
+        cmd_name, _, cmd_arg = arg.partition("=")
+        if cmd_name in CMD_NAME:
+            return Stage("filter", (Predicate("name", cmd_arg),))
+        elif cmd_name in CMD_SUBSTRING:
+            return Stage("filter", (Predicate("substring", cmd_arg),))
+        elif cmd_name in CMD_TOKENS:
+            return Stage("filter", (Predicate("tokens", cmd_arg),))
+        elif cmd_name in CMD_FUZZY:
+            return Stage("filter", (Predicate("fuzzy", cmd_arg),))
+        elif cmd_name in CMD_TRACKER:
+            return Stage("filter", (Predicate("tracker", cmd_arg),))
+        elif cmd_name in CMD_TIME:
+            return Stage("filter", (_parse_time(cmd_arg),))
+    raise QueryError("Unknown function: {}".format(arg))
+
+
+def parse_pipeline(line, sep=SEP_CMD):
+    """ Parse a pipeline into its stages in the order written. A print stage is appended when the
+    last stage is one which implicitly prints, an empty pipeline prints everything.
+
+    :param line: Pipeline string, eg. "seeding | ratio | 20"
+    :type line: str
+    :rtype: Stage[]
+    """
+    stages = []
+    for arg in line.split(sep):
+        arg = arg.strip().lower()
+        if arg:
+            stages.append(parse_stage(arg))
+    if not stages or stages[-1].op in _PRINT_LAST:
+        stages.append(Stage("print", None))
+    return stages
+
+
+def plan_pipeline(stages):
+    """ Rewrite parsed stages into a cheaper equivalent pipeline, see the module docs for the rules
+    applied. The output order of every print and the set of torrents every side effect sees are
+    unchanged.
+
+    :param stages: Stages as returned by `parse_pipeline`
+    :type stages: Stage[]
+    :rtype: Stage[]
+    """
+    stages = list(stages)
+
+    # Move each filter ahead of any sorts and reverses directly before it
+    for i in range(len(stages)):
+        j = i
+        while j > 0 and stages[j].op == "filter" and stages[j - 1].op in _COMMUTES:
+            stages[j - 1], stages[j] = stages[j], stages[j - 1]
+            j -= 1
+
+    # Drop sorts and reverses whose order is never observed, eg. `ratio | count`
+    planned = []
+    order_matters = False
+    for stage in reversed(stages):
+        if stage.op in _COMMUTES and not order_matters:
+            continue
+        if stage.op in ("print", "limit", "sort"):
+            order_matters = True
+        planned.append(stage)
+    planned.reverse()
+
+    # Fuse adjacent stages
+    stages, planned = planned, []
+    for stage in stages:
+        prev = planned[-1] if planned else None
+        prev_op = prev.op if prev else None
+        if stage.op == "filter" and prev_op == "filter":
+            planned[-1] = Stage("filter", prev.arg + stage.arg)
+        elif stage.op == "reverse" and prev_op == "reverse":
+            planned.pop()
+        elif stage.op == "limit" and prev_op == "limit":
+            planned[-1] = Stage("limit", min(prev.arg, stage.arg))
+        elif stage.op == "limit" and prev_op == "sort":
+            planned[-1] = Stage("top", (prev.arg, stage.arg, False))
+        elif stage.op == "limit" and prev_op == "reverse" and len(planned) > 1 and planned[-2].op == "sort":
+            planned.pop()
+            planned[-1] = Stage("top", (planned[-1].arg, stage.arg, True))
+        else:
+            planned.append(stage)
+    return planned
+
+
+def pipeline_fields(stages, print_fields=FIELDS_PRINT):
+    """ Determine the smallest set of torrent-get fields required to evaluate the stages
+
+    :param stages: Parsed or planned stages
+    :type stages: Stage[]
+    :param print_fields: Fields read by the print stages
+    :return: torrent-get field names
+    :rtype: list
+    """
+    field_sets = []
+    for stage in stages:
+        if stage.op == "filter":
+            for predicate in stage.arg:
+                if predicate.name in NAME_PREDICATES:
+                    field_sets.append(("name",))
+                elif predicate.name == "ids":
+                    continue
+                elif predicate.name == "tracker":
+                    field_sets.append(FIELDS_TRACKER)
+                elif predicate.name == "added":
+                    field_sets.append(Filter.fields["lifetime"])
+                else:
+                    field_sets.append(Filter.fields[predicate.name])
+        elif stage.op == "sort":
+            field_sets.append(Sort.fields[stage.arg])
+        elif stage.op == "top":
+            field_sets.append(Sort.fields[stage.arg[0]])
+        elif stage.op == "total_size":
+            field_sets.append(("totalSize",))
+        elif stage.op == "print":
+            field_sets.append(print_fields)
+    return make_fields(*field_sets)
+
+
+def make_name_matcher(predicate):
+    """ Return a function testing a lower cased name against one of the `NAME_PREDICATES`, the
+    same as the `NameIndex` search of the same kind.
+
+    :type predicate: Predicate
+    :rtype: callable
+    """
+    text = predicate.arg.lower()
+    if predicate.name == "name":
+        return lambda name: name.startswith(text)
+    elif predicate.name == "substring":
+        return lambda name: text in name
+    elif predicate.name == "tokens":
+        words = name_tokens(text)
+        return lambda name: bool(words) and words <= name_tokens(name)
+    trigrams = name_trigrams(text)
+    if not trigrams:
+        return lambda name: text in name
+    required = max(1, math.ceil(FUZZY_THRESHOLD * len(trigrams)))
+    return lambda name: len(trigrams & name_trigrams(name)) >= required
+
+
+def make_predicate(predicate):
+    """ Return a function testing a single torrent against a predicate
+
+    :type predicate: Predicate
+    :rtype: callable
+    """
+    if predicate.name in NAME_PREDICATES:
+        match_name = make_name_matcher(predicate)
+
+        def match(t):
+            return match_name(t.name.lower())
+    elif predicate.name == "ids":
+        ids = predicate.arg
+
+        def match(t):
+            return t.id in ids
+    elif predicate.name == "tracker":
+        substring = predicate.arg.lower()
+
+        def match(t):
+            return substring in find_tracker(t).lower()
+    elif predicate.name == "added":
+        older, date = predicate.arg
+
+        def match(t):
+            return t.date_added < date if older else t.date_added > date
+    else:
+        match = getattr(Filter, predicate.name)
+    return match
+
+
+def make_filter(predicates):
+    """ Return a single function testing a torrent against all the predicates, in order
+
+    :type predicates: Predicate[]
+    :rtype: callable
+    """
+    matchers = [make_predicate(predicate) for predicate in predicates]
+    if len(matchers) == 1:
+        return matchers[0]
+
+    def match(t):
+        for matcher in matchers:
+            if not matcher(t):
+                return False
+        return True
+    return match
+
+
+__all__ = (
+    "Stage",
+    "Predicate",
+    "NAME_PREDICATES",
+    "QueryError",
+    "parse_duration",
+    "parse_stage",
+    "parse_pipeline",
+    "plan_pipeline",
+    "pipeline_fields",
+    "make_name_matcher",
+    "make_predicate",
+    "make_filter"
+)
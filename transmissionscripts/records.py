@@ -0,0 +1,157 @@
+"""
+Compact torrent representation used in place of `transmissionrpc.Torrent` when working with large
+torrent lists. A record stores the raw torrent-get values directly in slots rather than a dict of
+`Field` wrappers behind `__getattr__`, so it costs far less memory and attribute access is a plain
+slot lookup.
+"""
+import datetime
+
+# Status codes used by RPC version 14 and later
+STATUS_NEW = {
+    0: 'stopped',
+    1: 'check pending',
+    2: 'checking',
+    3: 'download pending',
+    4: 'downloading',
+    5: 'seed pending',
+    6: 'seeding',
+}
+
+# Status codes used before RPC version 14
+STATUS_OLD = {
+    1 << 0: 'check pending',
+    1 << 1: 'checking',
+    1 << 2: 'downloading',
+    1 << 3: 'seeding',
+    1 << 4: 'stopped',
+}
+
+
+def status_codes(rpc_version):
+    """ Return the status code mapping used by the RPC version
+
+    :param rpc_version: Transmission RPC version
+    :type rpc_version: int
+    :rtype: dict
+    """
+    return STATUS_NEW if rpc_version >= 14 else STATUS_OLD
+
+
+class TorrentRecord(object):
+    """ Slotted torrent holding the torrent-get fields listed in `TorrentRecord.fields`, any other
+    fields in a response are dropped. The status is resolved to its name when the record is built.
+    Fields which were not fetched raise AttributeError on access, the same as `transmissionrpc.Torrent`.
+    """
+
+    # torrent-get fields a record can hold
+    fields = (
+        'id', 'hashString', 'name', 'status', 'error', 'errorString', 'totalSize', 'sizeWhenDone',
+        'leftUntilDone', 'percentDone', 'uploadRatio', 'uploadedEver', 'downloadedEver', 'rateUpload',
+        'rateDownload', 'addedDate', 'activityDate', 'startDate', 'doneDate', 'secondsSeeding',
+        'secondsDownloading', 'queuePosition', 'downloadDir', 'isFinished', 'eta', 'trackers'
+    )
+
+    __slots__ = fields
+
+    def __init__(self, values, statuses=STATUS_NEW):
+        """
+
+        :param values: A single torrent from a torrent-get response
+        :type values: dict
+        :param statuses: Status code mapping for the RPC version, see `status_codes`
+        :type statuses: dict
+        """
+        self._update_fields(values, statuses)
+
+    def __repr__(self):
+        return '<TorrentRecord {} "{}">'.format(getattr(self, 'id', None), getattr(self, 'name', ''))
+
+    def _update_fields(self, other, statuses=STATUS_NEW):
+        """ Update the record from a torrent-get response dict or another record, named after
+        `transmissionrpc.Torrent._update_fields` so either type can be merged in place.
+
+        :param other: Torrent values or record to copy set fields from
+        :type other: dict|TorrentRecord
+        :param statuses: Status code mapping used when other is a dict
+        :type statuses: dict
+        """
+        if isinstance(other, TorrentRecord):
+            for name in self.fields:
+                try:
+                    setattr(self, name, getattr(other, name))
+                except AttributeError:
+                    pass
+            return
+        for key, value in other.items():
+            if key == 'status':
+                value = statuses.get(value, value)
+            try:
+                setattr(self, key, value)
+            except AttributeError:
+                pass
+
+    def as_dict(self):
+        """ The fields set on the record, status as its name
+
+        :rtype: dict
+        """
+        values = {}
+        for name in self.fields:
+            try:
+                values[name] = getattr(self, name)
+            except AttributeError:
+                pass
+        return values
+
+    @property
+    def progress(self):
+        """Get the download progress in percent."""
+        try:
+            return 100.0 * (self.sizeWhenDone - self.leftUntilDone) / float(self.sizeWhenDone)
+        except ZeroDivisionError:
+            return 0.0
+
+    @property
+    def ratio(self):
+        """Get the upload/download ratio."""
+        return float(self.uploadRatio)
+
+    @property
+    def date_active(self):
+        """Get the attribute "activityDate" as datetime.datetime."""
+        return datetime.datetime.fromtimestamp(self.activityDate)
+
+    @property
+    def date_added(self):
+        """Get the attribute "addedDate" as datetime.datetime."""
+        return datetime.datetime.fromtimestamp(self.addedDate)
+
+    @property
+    def date_started(self):
+        """Get the attribute "startDate" as datetime.datetime."""
+        return datetime.datetime.fromtimestamp(self.startDate)
+
+    @property
+    def date_done(self):
+        """Get the attribute "doneDate" as datetime.datetime."""
+        return datetime.datetime.fromtimestamp(self.doneDate)
+
+
+def make_records(items, rpc_version):
+    """ Convert the torrents of a torrent-get response into records
+
+    :param items: The "torrents" list of a torrent-get response, may be any iterable
+    :param rpc_version: Transmission RPC version of the daemon which sent the response
+    :type rpc_version: int
+    :return: Generator of records
+    """
+    statuses = status_codes(rpc_version)
+    for item in items:
+        yield TorrentRecord(item, statuses)
+
+
+__all__ = (
+    "TorrentRecord",
+    "make_records",
+    "status_codes"
+)
@@ -0,0 +1,115 @@
+"""
+Fixed cadence scheduling for polling loops such as ts_cli's watch.
+
+Ticks are due every interval counted from the first tick, rather than interval after the previous
+run finished, so the time each run takes does not make the cadence drift. A run which overruns its
+slot starts the next one straight away and any ticks missed entirely are skipped instead of being
+run back to back.
+
+The interval backs off while the daemon is slow. It is stretched so polls take at most `SLOW_SHARE`
+of it, based on a moving average of how long they took, up to `MAX_BACKOFF` times the interval
+asked for or an optional longest interval, and returns to it once polls are fast again. Callers
+syncing recently active deltas cap it below the delta's maximum age, past which every tick would
+be a full fetch and backing off would make the daemon slower rather than faster.
+
+    >>> scheduler = PollScheduler(5.0)
+    >>> while True:
+    >>>     scheduler.wait()
+    >>>     started = time.monotonic()
+    >>>     torrents = cache.sync()
+    >>>     scheduler.record(time.monotonic() - started)
+"""
+import time
+
+# Share of the interval polls may take before the interval is stretched
+SLOW_SHARE = 0.5
+
+# Largest multiple of the requested interval backing off stretches it to
+MAX_BACKOFF = 8.0
+
+# Weight of the latest poll in the moving average of poll durations
+DURATION_WEIGHT = 0.5
+
+
+class PollScheduler(object):
+    """ Fixed cadence ticks with drift compensation and back off, see the module docs """
+
+    def __init__(self, interval, max_backoff=MAX_BACKOFF, slow_share=SLOW_SHARE, max_interval=None,
+                 clock=time.monotonic, sleep=time.sleep):
+        """
+
+        :param interval: Seconds between ticks while the daemon keeps up
+        :type interval: float
+        :param max_backoff: Largest multiple of interval the interval is stretched to
+        :type max_backoff: float
+        :param slow_share: Share of the interval polls may take before it is stretched
+        :type slow_share: float
+        :param max_interval: Longest the interval is stretched to, never shorter than interval
+        :type max_interval: float|None
+        :param clock: Monotonic clock returning seconds
+        :param sleep: Function sleeping for the given seconds
+        """
+        if interval <= 0:
+            raise ValueError("Interval must be positive")
+        self.base_interval = interval
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.max_interval = interval * max_backoff
+        if max_interval is not None:
+            self.max_interval = max(interval, min(self.max_interval, max_interval))
+        self.slow_share = slow_share
+        self.clock = clock
+        self.sleep = sleep
+        self.duration = None
+        self.ticks = 0
+        self.skipped = 0
+        self._last_due = None
+
+    @property
+    def backed_off(self):
+        """ Whether the interval is currently stretched beyond the one asked for
+
+        :rtype: bool
+        """
+        return self.interval > self.base_interval
+
+    def wait(self):
+        """ Sleep until the next tick is due, the first tick is due straight away
+
+        :return: Seconds slept
+        :rtype: float
+        """
+        now = self.clock()
+        if self._last_due is None:
+            due = now
+        else:
+            due = self._last_due + self.interval
+            if now - due >= self.interval:
+                missed = int((now - due) // self.interval)
+                self.skipped += missed
+                due += missed * self.interval
+        delay = due - now
+        if delay > 0:
+            self.sleep(delay)
+        self._last_due = due
+        self.ticks += 1
+        return max(0.0, delay)
+
+    def record(self, duration):
+        """ Record how long the daemon took to answer this tick's poll, adjusting the interval
+
+        :param duration: Seconds the poll took
+        :type duration: float
+        """
+        if self.duration is None:
+            self.duration = duration
+        else:
+            self.duration += DURATION_WEIGHT * (duration - self.duration)
+        self.interval = min(self.max_interval, max(self.base_interval, self.duration / self.slow_share))
+
+
+__all__ = (
+    "MAX_BACKOFF",
+    "SLOW_SHARE",
+    "PollScheduler"
+)
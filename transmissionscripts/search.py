@@ -0,0 +1,206 @@
+"""
+In-memory name index supporting substring, token and fuzzy searches over torrent names.
+
+Two inverted indexes map to torrent ids, one keyed by the words of each name and one by the three
+character sequences (trigrams) of each word, padded so the start and end of words count too. A
+substring search intersects the postings of the trigrams inside the query's words, smallest first,
+and only compares the few names left. A fuzzy search ranks names by how many of the query's
+trigrams they share, so it tolerates typos. Only names holding one of the query's rarest trigrams
+can reach the threshold, so just those are counted.
+
+The index is synced from a torrent list and only re-indexes names which changed, so keeping it
+up to date from a `TorrentCache` costs a dict lookup per torrent.
+
+    >>> index = NameIndex()
+    >>> index.sync(cache.sync(), full=True)
+    >>> index.substring("s01e0")
+    >>> index.fuzzy("ubunut server")
+"""
+import math
+import re
+from collections import defaultdict
+
+# Splits names into words
+_TOKEN_SPLIT = re.compile(r"[\W_]+", re.UNICODE)
+
+# Smallest share of the query's trigrams a name must contain to match a fuzzy search
+FUZZY_THRESHOLD = 0.6
+
+# Search modes accepted by `NameIndex.search`
+SEARCH_MODES = ("prefix", "substring", "tokens", "fuzzy")
+
+
+def name_tokens(name):
+    """ The distinct lower cased words of a name
+
+    :type name: str
+    :rtype: set
+    """
+    return {token for token in _TOKEN_SPLIT.split(name.lower()) if token}
+
+
+def name_trigrams(name, padded=True):
+    """ The distinct three character sequences of the words of a lower cased name
+
+    :type name: str
+    :param padded: Include the sequences spanning the start and end of each word
+    :type padded: bool
+    :rtype: set
+    """
+    trigrams = set()
+    for token in name_tokens(name):
+        if padded:
+            token = "  {} ".format(token)
+        trigrams.update(token[i:i + 3] for i in range(len(token) - 2))
+    return trigrams
+
+
+class NameIndex(object):
+    """ Token and trigram inverted indexes over torrent names, see the module docs """
+
+    def __init__(self, torrents=None):
+        """
+
+        :param torrents: Optional torrents to index, with at least the id and name fields
+        """
+        self._names = {}
+        self._tokens = defaultdict(set)
+        self._trigrams = defaultdict(set)
+        if torrents is not None:
+            self.sync(torrents, full=True)
+
+    def __len__(self):
+        return len(self._names)
+
+    def __contains__(self, torrent_id):
+        return torrent_id in self._names
+
+    def add(self, torrent_id, name):
+        """ Index a name, replacing any name already indexed for the id """
+        if torrent_id in self._names:
+            if self._names[torrent_id] == name.lower():
+                return
+            self.remove(torrent_id)
+        self._names[torrent_id] = name.lower()
+        for token in name_tokens(name):
+            self._tokens[token].add(torrent_id)
+        for trigram in name_trigrams(name):
+            self._trigrams[trigram].add(torrent_id)
+
+    def remove(self, torrent_id):
+        """ Remove a torrent from the index, unknown ids are ignored """
+        name = self._names.pop(torrent_id, None)
+        if name is None:
+            return
+        for index, keys in ((self._tokens, name_tokens(name)), (self._trigrams, name_trigrams(name))):
+            for key in keys:
+                postings = index.get(key)
+                if postings is not None:
+                    postings.discard(torrent_id)
+                    if not postings:
+                        del index[key]
+
+    def sync(self, torrents, removed=(), full=False):
+        """ Bring the index up to date with a torrent list, only names which changed are re-indexed
+
+        :param torrents: Torrents which are new or may have changed
+        :param removed: Ids of torrents which were removed
+        :param full: Torrents is the complete list, any other indexed torrent is removed
+        :type full: bool
+        """
+        seen = set() if full else None
+        for torrent in torrents:
+            self.add(torrent.id, torrent.name)
+            if full:
+                seen.add(torrent.id)
+        if full:
+            removed = [torrent_id for torrent_id in self._names if torrent_id not in seen]
+        for torrent_id in removed:
+            self.remove(torrent_id)
+
+    @staticmethod
+    def _intersect(postings):
+        """ Intersect posting sets starting from the smallest so the work is bounded by it """
+        postings = sorted(postings, key=len)
+        if not postings:
+            return set()
+        result = set(postings[0])
+        for other in postings[1:]:
+            if not result:
+                break
+            result &= other
+        return result
+
+    def prefix(self, text):
+        """ Ids of names starting with text, case insensitive
+
+        :rtype: set
+        """
+        text = text.lower()
+        return {torrent_id for torrent_id in self.substring(text) if self._names[torrent_id].startswith(text)}
+
+    def substring(self, text):
+        """ Ids of names containing text, case insensitive
+
+        :rtype: set
+        """
+        text = text.lower()
+        # The words at either end of text may be partial, only the sequences inside words are certain
+        trigrams = name_trigrams(text, padded=False)
+        if not trigrams:
+            return {torrent_id for torrent_id, name in self._names.items() if text in name}
+        candidates = self._intersect([self._trigrams.get(trigram, ()) for trigram in trigrams])
+        return {torrent_id for torrent_id in candidates if text in self._names[torrent_id]}
+
+    def tokens(self, text):
+        """ Ids of names containing every word of text, case insensitive
+
+        :rtype: set
+        """
+        words = name_tokens(text)
+        if not words:
+            return set()
+        return self._intersect([self._tokens.get(word, ()) for word in words])
+
+    def fuzzy(self, text, threshold=FUZZY_THRESHOLD):
+        """ Ids of names sharing at least threshold of the trigrams of text, best matches first
+
+        :param threshold: Share of the query's trigrams a name must contain, between 0 and 1
+        :type threshold: float
+        :rtype: list
+        """
+        postings = sorted((self._trigrams.get(trigram, set()) for trigram in name_trigrams(text)), key=len)
+        if not postings:
+            return sorted(self.substring(text))
+        required = max(1, int(math.ceil(threshold * len(postings))))
+        # A name missing all of the rarest len - required + 1 trigrams cannot share enough of them
+        candidates = set()
+        for posting in postings[0:len(postings) - required + 1]:
+            candidates.update(posting)
+        matches = []
+        for torrent_id in candidates:
+            count = sum(1 for posting in postings if torrent_id in posting)
+            if count >= required:
+                matches.append((count, torrent_id))
+        matches.sort(key=lambda match: (-match[0], len(self._names[match[1]]), match[1]))
+        return [torrent_id for _, torrent_id in matches]
+
+    def search(self, text, mode="substring"):
+        """ Run a search of the given mode
+
+        :param mode: One of `SEARCH_MODES`
+        :type mode: str
+        :rtype: set
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError("Unknown search mode: {}".format(mode))
+        return set(getattr(self, mode)(text))
+
+
+__all__ = (
+    "FUZZY_THRESHOLD",
+    "SEARCH_MODES",
+    "NameIndex",
+    "name_tokens",
+    "name_trigrams"
+)
@@ -0,0 +1,317 @@
+"""
+On-disk snapshot of the torrent table, so scripts which run often (cron jobs, shell prompts) can
+answer from the last known state straight away instead of doing a full torrent-get every time.
+
+Snapshots are stored in a sqlite database under `CONFIG_DIR`, one per daemon address. Each row
+holds a torrent's `TorrentRecord` fields along with indexed columns for its hash, name, status,
+ratio, added date and `find_tracker` assignment, which `query` and `execute` can select on using
+SQL, eg. `tracker = 'BTN' AND status = 'seeding' AND ratio < 0.5 AND added < ago('30d')`. A snapshot
+is refreshed in one of three ways depending on its age:
+
+- Within the daemon's recently-active window, only the changed torrents are fetched.
+- Otherwise only the small fields of every torrent are fetched and merged into the stored rows,
+  the static fields (trackers, download directory, error string) are only fetched for torrents
+  which are new, whose error changed or whose id now belongs to a different hash, as the daemon
+  renumbers torrents when it restarts.
+- Once older than `SNAPSHOT_FULL_AGE`, or when there is no snapshot, everything is fetched.
+
+    >>> snapshot = open_snapshot(args)
+    >>> for torrent in snapshot.torrents(lambda: make_client(args), max_age=300):
+    >>>     print_torrent_line(torrent)
+"""
+import argparse
+import sqlite3
+import threading
+import time
+from json import dumps, loads
+from os.path import join, dirname, exists
+
+from transmissionscripts import CONFIG_DIR, CACHE_MAX_DELTA_AGE, client_options, find_tracker, mkdir_p, logger
+from transmissionscripts.query import parse_duration
+from transmissionscripts.records import TorrentRecord, status_codes
+
+SNAPSHOT_FILE = join(CONFIG_DIR, "snapshot.sqlite")
+
+# Default --max-age, in seconds
+SNAPSHOT_MAX_AGE = 300.0
+
+# Age in seconds after which a refresh fetches every field again
+SNAPSHOT_FULL_AGE = 86400.0
+
+# torrent-get fields stored for each torrent, enough to serve any of the scripts
+FIELDS_SNAPSHOT = TorrentRecord.fields
+
+# Fields which rarely change and make up most of the payload, only fetched for new torrents. The identity
+# fields (id, hashString, name) are always fetched, matching stored rows by hash as well as id.
+FIELDS_STATIC = ('errorString', 'downloadDir', 'trackers')
+
+# Fields fetched for every torrent by a partial refresh
+FIELDS_VOLATILE = tuple(f for f in FIELDS_SNAPSHOT if f not in FIELDS_STATIC)
+
+# Bumped whenever the schema changes, older snapshots are discarded and fetched again
+SCHEMA_VERSION = 2
+
+# Columns which can be queried, the data column holds the full record
+QUERY_COLUMNS = ("id", "hash", "name", "status", "tracker", "ratio", "added")
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS snapshots ("
+    " address TEXT PRIMARY KEY, synced REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS torrents ("
+    " address TEXT NOT NULL, id INTEGER NOT NULL, hash TEXT, name TEXT COLLATE NOCASE, status TEXT,"
+    " tracker TEXT, ratio REAL, added INTEGER, data TEXT NOT NULL, PRIMARY KEY (address, id))",
+    "CREATE INDEX IF NOT EXISTS torrents_hash ON torrents (address, hash)",
+    "CREATE INDEX IF NOT EXISTS torrents_name ON torrents (address, name)",
+    "CREATE INDEX IF NOT EXISTS torrents_status ON torrents (address, status)",
+    "CREATE INDEX IF NOT EXISTS torrents_tracker ON torrents (address, tracker, status)",
+    "CREATE INDEX IF NOT EXISTS torrents_ratio ON torrents (address, ratio)",
+    "CREATE INDEX IF NOT EXISTS torrents_added ON torrents (address, added)",
+)
+
+
+def _ago(duration):
+    """ SQL function returning the unix time a duration such as '30d' ago """
+    return int(time.time() - parse_duration(duration))
+
+
+def make_snapshot_arg_parser():
+    """ Create an argparse parent adding the `--cached` and `--max-age` options
+
+    :rtype: argparse.ArgumentParser
+    """
+    parser = argparse.ArgumentParser(add_help=False)
+    parser.add_argument('--cached', '-c', action='store_true', dest='cached',
+                        help="Answer from the on-disk snapshot and refresh it in the background")
+    parser.add_argument('--max-age', type=float, default=None, dest='max_age',
+                        help="Oldest snapshot in seconds to answer from, implies --cached "
+                             "(default: {})".format(int(SNAPSHOT_MAX_AGE)))
+    return parser
+
+
+def open_snapshot(args, path=SNAPSHOT_FILE):
+    """ Open the snapshot of the daemon the CLI args point to, None unless cached mode was requested
+
+    :param args: CLI args including those of `make_snapshot_arg_parser`
+    :rtype: TorrentSnapshot
+    """
+    if not args.cached and args.max_age is None:
+        return None
+    host, port, _, _ = client_options(args)
+    return TorrentSnapshot("{}:{}".format(host, port), path)
+
+
+class TorrentSnapshot(object):
+    """ The stored torrent table of a single daemon. Connections are opened per call so a
+    snapshot may be refreshed from a background thread while another is reading it.
+    """
+
+    def __init__(self, address, path=SNAPSHOT_FILE):
+        """
+
+        :param address: Daemon address the snapshot belongs to, eg. localhost:9091
+        :type address: str
+        :param path: sqlite database path
+        :type path: str
+        """
+        self.address = address
+        self.path = path
+        self._thread = None
+
+    def _connect(self):
+        if not exists(dirname(self.path)):
+            mkdir_p(dirname(self.path))
+        db = sqlite3.connect(self.path, timeout=30)
+        db.execute("PRAGMA journal_mode=WAL")
+        db.create_function("ago", 1, _ago)
+        if db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            with db:
+                db.execute("DROP TABLE IF EXISTS torrents")
+                db.execute("DROP TABLE IF EXISTS snapshots")
+                for statement in _SCHEMA:
+                    db.execute(statement)
+                db.execute("PRAGMA user_version = {}".format(SCHEMA_VERSION))
+        return db
+
+    def synced(self):
+        """ Unix time of the last refresh, None when there is no snapshot
+
+        :rtype: float
+        """
+        db = self._connect()
+        try:
+            row = db.execute("SELECT synced FROM snapshots WHERE address = ?", (self.address,)).fetchone()
+        finally:
+            db.close()
+        return row[0] if row else None
+
+    def age(self):
+        """ Seconds since the last refresh, None when there is no snapshot
+
+        :rtype: float
+        """
+        synced = self.synced()
+        return None if synced is None else time.time() - synced
+
+    def load(self, max_age=SNAPSHOT_MAX_AGE):
+        """ Load the stored torrents, None when there is no snapshot or it is older than max_age
+
+        :param max_age: Oldest snapshot in seconds to return, None for any age
+        :type max_age: float
+        :rtype: TorrentRecord[]
+        """
+        db = self._connect()
+        try:
+            row = db.execute("SELECT synced FROM snapshots WHERE address = ?", (self.address,)).fetchone()
+            if row is None or (max_age is not None and time.time() - row[0] > max_age):
+                return None
+            rows = db.execute("SELECT data FROM torrents WHERE address = ? ORDER BY id", (self.address,))
+            return [TorrentRecord(loads(data)) for data, in rows]
+        finally:
+            db.close()
+
+    def query(self, where, params=()):
+        """ Load the stored torrents matching a SQL condition over the `QUERY_COLUMNS`, the
+        condition is evaluated by sqlite using the column indexes.
+
+        :param where: SQL expression, eg. "tracker = 'BTN' AND ratio < 0.5"
+        :type where: str
+        :param params: Values for any ? placeholders in where
+        :rtype: TorrentRecord[]
+        """
+        db = self._connect()
+        try:
+            rows = db.execute("SELECT data FROM torrents WHERE address = ? AND ({}) ORDER BY id".format(where),
+                              (self.address,) + tuple(params))
+            return [TorrentRecord(loads(data)) for data, in rows]
+        finally:
+            db.close()
+
+    def execute(self, sql, params=()):
+        """ Run an ad-hoc SQL statement against a `torrents` view holding only this snapshot's
+        `QUERY_COLUMNS`, eg. "SELECT tracker, count(*) FROM torrents GROUP BY tracker"
+
+        :param sql: SQL statement
+        :type sql: str
+        :param params: Values for any ? placeholders
+        :return: Column names and result rows
+        :rtype: (list, list)
+        """
+        db = self._connect()
+        try:
+            # The temp view shadows the table of the same name for the statements of this connection
+            db.execute("CREATE TEMP VIEW torrents AS SELECT {} FROM main.torrents WHERE address = {}".format(
+                ", ".join(QUERY_COLUMNS), "'{}'".format(self.address.replace("'", "''"))))
+            cursor = db.execute(sql, params)
+            columns = [column[0] for column in cursor.description or ()]
+            return columns, cursor.fetchall()
+        finally:
+            db.close()
+
+    def save(self, torrents, removed=(), full=False, synced=None):
+        """ Store torrents in the snapshot, replacing any existing rows for the same ids
+
+        :param torrents: Torrents fetched with `FIELDS_SNAPSHOT`
+        :param removed: Ids of torrents to delete
+        :param full: Torrents is the complete table, every other row is deleted
+        :type full: bool
+        :param synced: Unix time the torrents were fetched at, defaults to now
+        :type synced: float
+        """
+        rows = [(self.address, t.id, t.hashString, t.name, t.status, find_tracker(t), t.uploadRatio, t.addedDate,
+                 dumps(t.as_dict())) for t in torrents]
+        db = self._connect()
+        try:
+            with db:
+                if full:
+                    db.execute("DELETE FROM torrents WHERE address = ?", (self.address,))
+                else:
+                    db.executemany("DELETE FROM torrents WHERE address = ? AND id = ?",
+                                   [(self.address, torrent_id) for torrent_id in removed])
+                db.executemany("INSERT OR REPLACE INTO torrents "
+                               "(address, id, hash, name, status, tracker, ratio, added, data) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                db.execute("INSERT OR REPLACE INTO snapshots (address, synced) VALUES (?, ?)",
+                           (self.address, time.time() if synced is None else synced))
+        finally:
+            db.close()
+
+    def refresh(self, client, full=False):
+        """ Bring the snapshot up to date, see the module docs for how depending on its age
+
+        :param client: Transmission RPC Client
+        :type client: TSClient
+        :param full: Force a full fetch
+        :type full: bool
+        """
+        started = time.time()
+        age = self.age()
+        if full or age is None or age > SNAPSHOT_FULL_AGE:
+            self.save(client.fetch_torrents(FIELDS_SNAPSHOT), full=True, synced=started)
+        elif age <= CACHE_MAX_DELTA_AGE:
+            torrents, removed = client.get_recently_active(FIELDS_SNAPSHOT)
+            self.save(torrents, removed, synced=started)
+        else:
+            self._refresh_volatile(client, started)
+
+    def _refresh_volatile(self, client, started):
+        stored = {t.id: t for t in self.load(max_age=None) or ()}
+        statuses = status_codes(client.rpc_version)
+        torrents = []
+        missing = []
+        for values in client._request_arguments(
+                'torrent-get', client._torrent_get_arguments(FIELDS_VOLATILE, None)).get('torrents', []):
+            torrent = stored.get(values['id'])
+            # A changed error also changes errorString, a changed hash means the id was given to another torrent
+            if torrent is None or torrent.hashString != values['hashString'] or torrent.error != values.get('error'):
+                missing.append(values['id'])
+            else:
+                torrent._update_fields(values, statuses)
+                torrents.append(torrent)
+        if missing:
+            torrents.extend(client.fetch_torrents(FIELDS_SNAPSHOT, ids=missing))
+        self.save(torrents, full=True, synced=started)
+
+    def torrents(self, make_client, max_age=SNAPSHOT_MAX_AGE):
+        """ Return the stored torrents straight away and refresh the snapshot in the background,
+        unless the snapshot is missing or older than max_age in which case it is refreshed first.
+
+        :param make_client: Function returning a connected `TSClient`
+        :param max_age: Oldest snapshot in seconds to answer from
+        :type max_age: float
+        :rtype: TorrentRecord[]
+        """
+        torrents = self.load(max_age)
+        if torrents is None:
+            self.refresh(make_client())
+            return self.load(max_age=None)
+        self.refresh_in_background(make_client)
+        return torrents
+
+    def refresh_in_background(self, make_client):
+        """ Refresh the snapshot from a new thread. The thread is not a daemon thread, so the
+        interpreter waits for it to finish after the script has written its output.
+
+        :param make_client: Function returning a connected `TSClient`, called from the thread
+        :rtype: threading.Thread
+        """
+        def refresh():
+            try:
+                self.refresh(make_client())
+            except Exception as err:
+                logger.warning("Failed to refresh torrent snapshot: {}".format(err))
+
+        self._thread = threading.Thread(target=refresh, name="snapshot-refresh")
+        self._thread.start()
+        return self._thread
+
+
+__all__ = (
+    "FIELDS_SNAPSHOT",
+    "SNAPSHOT_FILE",
+    "SNAPSHOT_MAX_AGE",
+    "SNAPSHOT_FULL_AGE",
+    "QUERY_COLUMNS",
+    "TorrentSnapshot",
+    "make_snapshot_arg_parser",
+    "open_snapshot"
+)